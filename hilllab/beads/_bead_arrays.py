@@ -0,0 +1,212 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+from pathlib import Path
+import hashlib
+import numpy as np
+import pandas as pd
+
+from ..dynamics._primary_store import _encode_tables, _iterate_beads
+from ..dynamics.DynamicsDataset import DynamicsDataset
+
+# Summary columns of the param and summary models
+PARAM_FEATURES = ['displacement', 'straightness', 'circular_variance', 'bb_area', 'mean_speed', 'mean_acceleration']
+SUMMARY_FEATURES = ('displacement', 'linearity')  # every column from displacement to linearity
+
+# Integer label of each classification, as encoded for training
+LABEL_VOCAB = ['stuck', 'transiting', 'oscillating', 'discard']
+
+# Fraction of beads in the train, val, and test splits
+SPLITS = {'train': 0.8, 'val': 0.1, 'test': 0.1}
+
+def _read_summary(data):
+
+    """
+    Reads the summary table of a primary analysis H5 file or a
+    DynamicsDataset folder, with bead codes, one row per UUID sorted by
+    UUID (the order of groupby('uuid') in load_hdf).
+    """
+
+    if Path(data).is_dir():
+        summary = DynamicsDataset(data).summary
+    else:
+        summary, _ = _encode_tables(pd.read_hdf(data, key='summary'), pd.read_hdf(data, key='metadata'))
+
+    return summary.drop_duplicates(subset='uuid').sort_values('uuid', kind='stable').reset_index(drop=True)
+
+
+def _join_labels(summary, labels):
+
+    """
+    Joins the bead classifications of a label Excel file onto a summary in
+    one merge, dropping unlabelled beads and beads labelled 'idk'. Returns
+    the labelled summary rows (in the same order) and their labels.
+    """
+
+    df_class = pd.read_excel(labels).drop_duplicates(subset='uuid')[['uuid', 'classification']]
+    df_class = df_class[df_class['classification'] != 'idk']
+    labelled = summary.merge(df_class, on='uuid', how='inner', sort=False)
+
+    return labelled.drop(columns='classification'), labelled['classification'].astype(str).to_numpy()
+
+
+def _summary_features(summary, columns):
+
+    """
+    Returns the features of every bead as a float32 matrix. columns is a
+    list of columns or a (first, last) range of columns.
+    """
+
+    if isinstance(columns, tuple):
+        features = summary.loc[:, columns[0]:columns[1]]
+    else:
+        features = summary[columns]
+
+    return features.to_numpy(dtype=np.float32)
+
+
+def _position_arrays(data, summary):
+
+    """
+    Reads the positions of the beads of a summary, centered on each bead's
+    mean position, as one flat array.
+
+    RETURNS:
+        values (numpy.ndarray): the (x, y) of every row of every bead, one
+            bead after another in the order of the summary, as float32.
+        row_splits (numpy.ndarray): where the rows of each bead start, plus
+            the total, so bead i is values[row_splits[i]:row_splits[i+1]].
+    """
+
+    # Read only the x, y, and uuid_code columns of every row
+    if Path(data).is_dir():
+        dataset = DynamicsDataset(data)
+        chunks = [dataset.get_partition(path_code, columns=['uuid_code', 'x', 'y'])
+                  for path_code in dataset.metadata['path_code']]
+    else:
+        file_summary, _ = _encode_tables(pd.read_hdf(data, key='summary'), pd.read_hdf(data, key='metadata'))
+        chunks = list(_iterate_beads(data, file_summary, columns=['x', 'y']))
+    positions = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame({'uuid_code': [], 'x': [], 'y': []})
+
+    # First row and number of rows of each stored bead (which are contiguous)
+    codes, starts, counts = np.unique(positions['uuid_code'].to_numpy(), return_index=True, return_counts=True)
+    bead_rows = np.searchsorted(codes, summary['uuid_code'].to_numpy())
+    bead_starts, bead_counts = starts[bead_rows], counts[bead_rows]
+
+    # Gather the rows of the requested beads, in order
+    row_splits = np.concatenate([[0], np.cumsum(bead_counts)]).astype(np.int64)
+    rows = np.arange(row_splits[-1]) - np.repeat(row_splits[:-1] - bead_starts, bead_counts)
+
+    # Normalize by mean positions
+    values = np.empty((rows.size, 2), dtype=np.float32)
+    values[:, 0] = positions['x'].to_numpy()[rows] - np.repeat(summary['mean_x'].to_numpy(), bead_counts)
+    values[:, 1] = positions['y'].to_numpy()[rows] - np.repeat(summary['mean_y'].to_numpy(), bead_counts)
+
+    return values, row_splits
+
+
+def _plate_arrays(data, labels, kind, max_length=None, crop=False):
+
+    """
+    Reads the features of one plate for a model kind ('param', 'summary',
+    or 'position'), with labels encoded as integers of LABEL_VOCAB.
+    Positions longer than max_length are shortened with _limit_lengths.
+
+    RETURNS:
+        arrays (dict): 'uuid', 'label' (or None without labels), and
+            'values' (one row per bead, or one row per position), with
+            'row_splits' for positions.
+    """
+
+    summary = _read_summary(data)
+    label_codes = None
+    if labels is not None:
+        summary, label_strings = _join_labels(summary, labels)
+        unknown = set(label_strings) - set(LABEL_VOCAB)
+        if unknown:
+            raise ValueError(f'Unknown classifications in {labels}: {sorted(unknown)}')
+        label_codes = pd.Index(LABEL_VOCAB).get_indexer(label_strings).astype(np.int64)
+
+    arrays = {'uuid': summary['uuid'].astype(str).to_numpy(), 'label': label_codes}
+    if kind == 'position':
+        arrays['values'], arrays['row_splits'] = _limit_lengths(*_position_arrays(data, summary),
+                                                                max_length=max_length, crop=crop)
+    elif kind in ['param', 'summary']:
+        arrays['values'] = _summary_features(summary, PARAM_FEATURES if kind == 'param' else SUMMARY_FEATURES)
+    else:
+        raise ValueError(f"kind must be 'param', 'summary', or 'position', not {kind!r}")
+
+    return arrays
+
+
+def _assign_splits(uuids):
+
+    """
+    Assigns every bead to the train, val, or test split from a hash of its
+    UUID. The split of a bead never changes, however the dataset grows or
+    is ordered, so splits are reproducible without storing a random seed.
+    """
+
+    # First 8 hex digits of each MD5 hash, as a number in [0, 1)
+    positions = np.array([int(hashlib.md5(str(uuid).encode()).hexdigest()[:8], 16) for uuid in uuids],
+                         dtype=np.float64) / 16**8
+    edges = np.cumsum(list(SPLITS.values()))[:-1]
+
+    return np.array(list(SPLITS.keys()))[np.searchsorted(edges, positions, side='right')]
+
+
+def _limit_lengths(values, row_splits, max_length=None, crop=False):
+
+    """
+    Shortens every bead longer than max_length rows, either by keeping
+    every n-th row (the smallest n that fits, which keeps the whole
+    trajectory) or, with crop, by keeping only its first max_length rows.
+    Returns the new values and row_splits.
+    """
+
+    counts = np.diff(row_splits)
+    if (max_length is None) or (counts.size == 0) or (counts.max() <= max_length):
+        return values, row_splits
+
+    # Position of every row within its bead
+    position = np.arange(values.shape[0]) - np.repeat(row_splits[:-1], counts)
+    if crop:
+        keep = position < max_length
+    else:
+        stride = np.maximum(1, -(-counts // max_length))  # ceiling division
+        keep = (position % np.repeat(stride, counts)) == 0
+
+    bead = np.repeat(np.arange(counts.size), counts)
+    kept_counts = np.bincount(bead[keep], minlength=counts.size)
+
+    return values[keep], np.concatenate([[0], np.cumsum(kept_counts)]).astype(np.int64)
+
+
+def _length_stats(row_splits):
+
+    """Returns summary statistics of the number of rows of every bead."""
+
+    lengths = np.diff(row_splits)
+    if lengths.size == 0:
+        return {'count': 0}
+    quantiles = np.percentile(lengths, [10, 50, 90, 99])
+
+    return {'count': int(lengths.size), 'min': int(lengths.min()), 'max': int(lengths.max()),
+            'mean': float(lengths.mean()), 'p10': float(quantiles[0]), 'median': float(quantiles[1]),
+            'p90': float(quantiles[2]), 'p99': float(quantiles[3]), 'total_rows': int(lengths.sum())}
+
+
+def _bucket_boundaries(lengths, n_buckets=8):
+
+    """
+    Returns the bucket boundaries of bucket_by_sequence_length that split
+    beads into n_buckets buckets of about the same number of beads. Lengths
+    grow by orders of magnitude, so equal-count buckets keep the padding of
+    each batch small wherever most beads are.
+    """
+
+    lengths = np.asarray(lengths)
+    if lengths.size == 0:
+        return []
+    quantiles = np.percentile(lengths, np.linspace(0, 100, n_buckets + 1)[1:-1])
+
+    # A boundary is the smallest length of the next bucket
+    return sorted({int(q) + 1 for q in quantiles if int(q) + 1 <= lengths.max()})
@@ -19,9 +19,19 @@ A bunch of functions to evaluate and plot model performance:
     confusion_matrix
     - confusion_matrix: confusion matrix across models, both avg counts and percentages.
     
+    ensemble
+    - ensemble_predict: runs every model on each batch of a dataset, in one pass.
+    - plate_predictions: predictions of every model for a plate, cached on disk.
+    
+    exported_models
+    - NumpyModel, TFLiteModel: CPU inference with models exported by tf_export.
+    - load_exported: util, loads exported models into a list.
+    - parity_check: compares an exported model's predictions with the original.
+    - benchmark: inference throughput of models, in beads per second.
+    
     ffca
     - pred_ffca: uses model to predict fractional functional ciliated area (FFCA)
-                 averaged across models for each plate. TAKES A LONG TIME!
+                 averaged across models for each plate.
     - plot_ffca: bar graph to plot pred_ffca results across plates.
     
     prediction_map
@@ -2,7 +2,7 @@
 
 import numpy as np
 
-from .tf_train import evaluate
+from ..tf_train import evaluate
 
 def batch_evaluate(models, test_ds):
     """
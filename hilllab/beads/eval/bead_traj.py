@@ -3,7 +3,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
 
-from .load_hdf import load_hdf
+from ..load_hdf import load_hdf
 
 def bead_traj(bead_uuid,path,ax=None,color=None):
     """
@@ -4,8 +4,10 @@ import numpy as np
 import matplotlib.pyplot as plt
 from sklearn.metrics import confusion_matrix, ConfusionMatrixDisplay
 
+from .ensemble import ensemble_predict
 
-def conf_matrix(models, vocab, test_ds):
+
+def conf_matrix(models, vocab, test_ds, predictions=None):
     """
     plots confusion matrix over models, for both avg counts and avg percentages.
     
@@ -13,22 +15,24 @@ def conf_matrix(models, vocab, test_ds):
         models (list): list of models
         vocab (list): list of classifications (['stuck','transiting','oscillating','discard'])
         test_ds (tf.data.Dataset): test dataset
+        predictions (tuple): opt, (probs, labels) from ensemble_predict of
+                             these models on test_ds, to skip inference
         
     """
 
-    # true labels of test dataset
-    trues = []
-    for _,label in test_ds.unbatch(): trues.append(label.numpy())
-    trues = np.array(trues) 
+    # predictions of every model and true labels of test dataset, from
+    # one pass over the dataset
+    if predictions is None:
+        predictions = ensemble_predict(models, test_ds)
+    all_probs, trues = predictions
     
     classes = range(len(vocab))
     
     # generate confusion matrix for each model
     cms = []
     
-    for model in models:
+    for probs in all_probs:
         
-        probs = model.predict(test_ds,verbose=0)
         preds = np.argmax(probs,axis=1)
         
         cm = confusion_matrix(trues,preds,labels=classes)
@@ -0,0 +1,121 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+
+import os
+import hashlib
+from pathlib import Path
+import numpy as np
+
+"""
+functions to run many models over a dataset in one pass:
+
+    - ensemble_predict: runs every model on each batch of a dataset,
+                        reading the dataset only once
+    - plate_predictions: probabilities of every model for one plate,
+                         cached on disk per (model, plate)
+
+the roc, confusion matrix, ffca, and prediction map functions take these
+predictions instead of calling model.predict themselves.
+"""
+
+def ensemble_predict(models, dataset):
+    """
+    runs every model on each batch of a dataset, so the dataset is read
+    (and its batches built) once instead of once per model.
+
+    ARGUMENTS:
+        models (list): list of models
+        dataset (tf.data.Dataset): batched features, or (features, labels)
+
+    RETURNS:
+        probs (np.ndarray): probabilities of shape (n_models, n_beads, n_classes)
+        labels (np.ndarray): labels of every bead, or None if the dataset
+                             has no labels
+
+    """
+
+    probs = [[] for _ in models]
+    labels = []
+
+    for batch in dataset:
+        if isinstance(batch, tuple):
+            features, label = batch
+            labels.append(np.asarray(label))
+        else:
+            features = batch
+
+        # every model on the same batch
+        for i, model in enumerate(models):
+            probs[i].append(np.asarray(model.predict_on_batch(features)))
+
+    if not any(probs):
+        return np.zeros((len(models), 0, 0)), None
+    probs = np.stack([np.concatenate(model_probs) for model_probs in probs])
+    labels = np.concatenate(labels) if labels else None
+
+    return probs, labels
+
+
+def plate_predictions(models, data, key, cache_dir=None, max_length=None):
+    """
+    probabilities of every model for every bead of one plate, in uuid
+    order. with a cache_dir, the probabilities of each (model, plate) are
+    saved and reused, so only models without saved probabilities are run
+    (all of them in one pass over the plate).
+
+    ARGUMENTS:
+        models (list): list of models
+        data (str): path to h5 file primary analysis data for some plate
+        key (str): model type ('position', 'param', 'summary')
+        cache_dir (str): opt, folder of saved probabilities
+        max_length (int): opt, as for position_data
+
+    RETURNS:
+        probs (np.ndarray): probabilities of shape (n_models, n_beads, n_classes)
+
+    NOTES:
+        1. models are identified by a hash of their weights, and plates by
+        their name, modification time, and size, so retrained models and
+        changed plates are predicted again.
+
+    """
+
+    source = np.array([os.path.getmtime(data), os.path.getsize(data)])
+    paths = [None] * len(models)
+    probs = [None] * len(models)
+
+    # load saved probabilities
+    if cache_dir is not None:
+        suffix = '' if max_length is None else f'-{max_length}'
+        for i, model in enumerate(models):
+            paths[i] = Path(cache_dir) / _model_key(model) / f'{Path(data).name}-{key}{suffix}.npz'
+            if paths[i].exists():
+                with np.load(paths[i]) as saved:
+                    if np.array_equal(saved['source'], source):
+                        probs[i] = saved['probs']
+
+    # run the other models together, over one copy of the plate
+    missing = [i for i in range(len(models)) if probs[i] is None]
+    if missing:
+        from ..tf_data import inference_data
+        plate_ds, restore = inference_data(data, key, max_length=max_length)
+        missing_probs, _ = ensemble_predict([models[i] for i in missing], plate_ds)
+
+        for i, model_probs in zip(missing, missing_probs[:, restore]):
+            probs[i] = model_probs
+            if paths[i] is not None:
+                paths[i].parent.mkdir(parents=True, exist_ok=True)
+                temporary_path = f'{paths[i]}.tmp.npz'
+                np.savez(temporary_path, probs=model_probs, source=source)
+                os.replace(temporary_path, paths[i])
+
+    return np.stack(probs)
+
+
+def _model_key(model):
+    """identifies a model by a hash of its weights."""
+
+    digest = hashlib.md5()
+    for weights in model.get_weights():
+        digest.update(np.ascontiguousarray(weights).tobytes())
+
+    return digest.hexdigest()[:16]
@@ -0,0 +1,208 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+
+import time
+import hashlib
+from pathlib import Path
+import numpy as np
+
+from .ensemble import ensemble_predict
+
+"""
+CPU inference with exported bead classification models (see tf_export),
+without keras:
+
+    - NumpyModel: dense models (param_model, summary_model) evaluated with
+                  numpy matrix products
+    - TFLiteModel: any model (e.g. position_model) run by the TFLite
+                   interpreter
+    - load_exported: loads a .npz or .tflite export
+    - parity_check: agreement of an exported model with the original
+    - benchmark: beads per second of each model
+
+exported models have predict_on_batch and get_weights like keras models,
+so they work with ensemble_predict, plate_predictions, and pred_ffca.
+"""
+
+class NumpyModel():
+    """
+    a dense model exported by tf_export.export_numpy: each layer is
+    activation(x @ W + b). dropout does nothing at inference.
+
+    ARGUMENTS:
+        path (str): path to the .npz export
+
+    """
+
+    def __init__(self, path):
+        with np.load(path) as saved:
+            self.weights = [saved[f'W{i}'] for i in range(int(saved['n_layers']))]
+            self.biases = [saved[f'b{i}'] for i in range(int(saved['n_layers']))]
+            self.activations = [str(activation) for activation in saved['activations']]
+        self.name = Path(path).stem
+
+    def predict_on_batch(self, features):
+        x = np.asarray(features, dtype=np.float32)
+        for W, b, activation in zip(self.weights, self.biases, self.activations):
+            x = _ACTIVATIONS[activation](x @ W + b)
+        return x
+
+    def predict(self, features, batch_size=1024, verbose=0):
+        features = np.asarray(features, dtype=np.float32)
+        return np.concatenate([self.predict_on_batch(features[i:i + batch_size])
+                               for i in range(0, max(len(features), 1), batch_size)])
+
+    def get_weights(self):
+        return [array for pair in zip(self.weights, self.biases) for array in pair]
+
+
+class TFLiteModel():
+    """
+    a model exported by tf_export.export_tflite, run by the TFLite
+    interpreter (from tflite_runtime if installed, otherwise tensorflow).
+    the input is resized to each batch, so variable length positions work.
+
+    ARGUMENTS:
+        path (str): path to the .tflite export
+        num_threads (int): opt, threads used by the interpreter
+
+    """
+
+    def __init__(self, path, num_threads=None):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ModuleNotFoundError:
+            from tensorflow.lite import Interpreter
+
+        self.path = Path(path)
+        self.name = self.path.stem
+        self.interpreter = Interpreter(model_path=str(path), num_threads=num_threads)
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.shape = None
+
+    def predict_on_batch(self, features):
+        features = np.asarray(features)
+
+        # quantized inputs are scaled to integers
+        scale, zero_point = self.input['quantization']
+        if scale:
+            features = np.round(features / scale + zero_point)
+        features = features.astype(self.input['dtype'])
+
+        if features.shape != self.shape:
+            self.interpreter.resize_tensor_input(self.input['index'], features.shape)
+            self.interpreter.allocate_tensors()
+            self.shape = features.shape
+        self.interpreter.set_tensor(self.input['index'], features)
+        self.interpreter.invoke()
+        probs = self.interpreter.get_tensor(self.output['index'])
+
+        scale, zero_point = self.output['quantization']
+        if scale:
+            probs = (probs.astype(np.float32) - zero_point) * scale
+        return probs
+
+    def get_weights(self):
+        # identifies the model for cached predictions
+        return [np.frombuffer(hashlib.md5(self.path.read_bytes()).digest(), dtype=np.uint8)]
+
+
+def load_exported(path):
+    """
+    loads exported models: one .npz or .tflite file, or every one in a folder.
+
+    RETURNS:
+        models (list): NumpyModel and TFLiteModel objects
+    """
+
+    path = Path(path)
+    files = sorted(path.iterdir()) if path.is_dir() else [path]
+
+    models = []
+    for file in files:
+        if file.suffix == '.npz':
+            models.append(NumpyModel(file))
+        elif file.suffix == '.tflite':
+            models.append(TFLiteModel(file))
+
+    print(f'loaded {len(models)} models.')
+
+    return models
+
+
+def parity_check(model, exported, dataset):
+    """
+    compares the predictions of an exported model with the original
+    model on the same dataset.
+
+    ARGUMENTS:
+        model (tf.keras.Model): the original model
+        exported (NumpyModel or TFLiteModel): its export
+        dataset (tf.data.Dataset): batched features (or features, labels)
+
+    RETURNS:
+        parity (dict): fraction of beads with the same predicted class,
+                       largest and mean absolute difference of probabilities,
+                       and the accuracy of both if the dataset has labels
+
+    """
+
+    (original_probs, exported_probs), labels = ensemble_predict([model, exported], dataset)
+    difference = np.abs(original_probs - exported_probs)
+
+    parity = {'agreement': float(np.mean(original_probs.argmax(axis=1) == exported_probs.argmax(axis=1))),
+              'max_abs_diff': float(difference.max()) if difference.size else 0.0,
+              'mean_abs_diff': float(difference.mean()) if difference.size else 0.0}
+    if labels is not None:
+        parity['original_accuracy'] = float(np.mean(original_probs.argmax(axis=1) == labels))
+        parity['exported_accuracy'] = float(np.mean(exported_probs.argmax(axis=1) == labels))
+
+    return parity
+
+
+def benchmark(models, dataset, repeats=3):
+    """
+    measures the inference throughput of models on the same batches.
+    the dataset is read once before timing, so only inference is timed.
+
+    ARGUMENTS:
+        models (dict): name and model (keras or exported) of each model
+        dataset (tf.data.Dataset): batched features (or features, labels)
+        repeats (int): opt, passes timed per model; the fastest is kept
+
+    RETURNS:
+        throughput (dict): beads per second of each model
+
+    """
+
+    batches = [batch[0] if isinstance(batch, tuple) else batch for batch in dataset]
+    n_beads = sum(len(batch) for batch in batches)
+
+    throughput = {}
+    for name, model in models.items():
+        model.predict_on_batch(batches[0])  # warm up (tracing, allocation)
+        best = np.inf
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for batch in batches:
+                model.predict_on_batch(batch)
+            best = min(best, time.perf_counter() - start)
+        throughput[name] = n_beads / best
+        print(f'{name}: {throughput[name]:.0f} beads/s')
+
+    return throughput
+
+
+def _softmax(x):
+    exp = np.exp(x - x.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+# dense layer activations, by their keras name
+_ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'sigmoid': lambda x: 1 / (1 + np.exp(-x)),
+    'tanh': np.tanh,
+    'softmax': _softmax,
+}
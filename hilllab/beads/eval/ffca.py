@@ -3,19 +3,19 @@
 import os
 import numpy as np
 import matplotlib.pyplot as plt
-import tensorflow as tf
 
-from .tf_data import param_data, position_data, summary_data
+from .ensemble import plate_predictions
 
 """
 functions for model to predict ffca and plot results:
 - pred_ffca: uses model to predict fractional functional ciliated area (FFCA)
-             averaged across models for each plate. TAKES A LONG TIME!
+             averaged across models for each plate. runs every model in
+             one pass over each plate, and reuses cached predictions.
 - plot_ffca: bar graph to plot pred_ffca results across plates.
 
 """
 
-def pred_ffca(path, models, key):
+def pred_ffca(path, models, key, max_length=None, cache_dir=None):
     """
     use models to predict fractional functional ciliated area (FFCA):
         oscillating/(oscillating + stuck).
@@ -25,6 +25,11 @@ def pred_ffca(path, models, key):
         path (str): path to folder containing a bunch of plate h5 files
         models (list): list of models
         key (str): model type ('position','parameter','summary')
+        max_length (int): opt, longest trajectory given to a position model
+                          (as for position_data)
+        cache_dir (str): opt, folder where the predictions of each model
+                         for each plate are saved and reused (see
+                         plate_predictions)
         
     RETURNS:
         avg_ffca (list): list of avg ffca for each plate
@@ -42,25 +47,14 @@ def pred_ffca(path, models, key):
     for file in files:
         plate = os.path.join(path, file)
         
-        # reformat plate h5 into tf dataset
-        if key =='param':
-            plate_ds,_ = param_data(plate)
-        elif key =='position':
-            plate_ds,_ = position_data(plate)
-        elif key == 'summary':
-            plate_ds,_ = summary_data(plate)
-        else: 
-            raise SyntaxError('key must be one of: position, param, summary')
-        
-        plate_ds = plate_ds.padded_batch(32).prefetch(tf.data.AUTOTUNE)
+        # predictions of every model for this plate
+        plate_probs = plate_predictions(models, plate, key, cache_dir=cache_dir, max_length=max_length)
 
         # loop over models
         ffcas = [] 
         
-        for model in models:
+        for probs in plate_probs:
         
-            # run model
-            probs = model.predict(plate_ds,verbose=0)
             preds = np.argmax(probs,axis=1)
             
             # get predicted osc and stuck
@@ -5,8 +5,10 @@ import matplotlib.pyplot as plt
 from sklearn.metrics import roc_curve, auc
 from sklearn.preprocessing import label_binarize
 
+from .ensemble import ensemble_predict
 
-def interpolate_roc(models, vocab, test_ds, name=None, colors=None):
+
+def interpolate_roc(models, vocab, test_ds, name=None, colors=None, predictions=None):
     """
     plots one vs. rest ROC curves with AUC values for each classification.
     ROC curve interpolated and AUC averaged over models.
@@ -18,13 +20,16 @@ def interpolate_roc(models, vocab, test_ds, name=None, colors=None):
         
         name (str): opt, label for model name
         colors (cmap): opt, colormap for aesthetics
+        predictions (tuple): opt, (probs, labels) from ensemble_predict of
+                             these models on test_ds, to skip inference
     
     """
     
-    # true labels of test dataset
-    true_labels = []
-    for _,label in test_ds.unbatch(): true_labels.append(label.numpy())
-    true_labels = np.array(true_labels) 
+    # predictions of every model and true labels of test dataset, from
+    # one pass over the dataset
+    if predictions is None:
+        predictions = ensemble_predict(models, test_ds)
+    all_preds, true_labels = predictions
     
     classes = range(len(vocab))
     trues = label_binarize(true_labels,classes=classes)
@@ -39,9 +44,7 @@ def interpolate_roc(models, vocab, test_ds, name=None, colors=None):
         aucs = []
        
        # loop through each model
-        for model in models:
-            
-            preds = model.predict(test_ds,verbose=0)
+        for preds in all_preds:
              
             fpr,tpr,_ = roc_curve(trues[:,n],preds[:,n])
             roc_auc = auc(fpr,tpr)
@@ -2,12 +2,11 @@
 
 import numpy as np
 import matplotlib.pyplot as plt
-import tensorflow as tf
-from .tf_data import param_data, position_data, summary_data
-from .load_hdf import load_hdf
+from .ensemble import plate_predictions
+from ..load_hdf import load_hdf
 
 
-def prediction_map(model, data, key, vocab, interval=None, colors=None):
+def prediction_map(model, data, key, vocab, interval=None, colors=None, max_length=None, cache_dir=None):
     """
     makes model predictions on beads from some plate
     plots bead traces, color coded by model-predicted classification.
@@ -17,6 +16,10 @@ def prediction_map(model, data, key, vocab, interval=None, colors=None):
         data (str): path to h5 file primary analysis data for some plate
         key (str): model type ('position', 'param,' 'summary')
         interval (tuple): opt, to plot less beads at a time
+        max_length (int): opt, longest trajectory given to a position model
+                          (as for position_data)
+        cache_dir (str): opt, folder of cached predictions (see
+                         plate_predictions)
         
     """
     
@@ -24,28 +27,17 @@ def prediction_map(model, data, key, vocab, interval=None, colors=None):
     groupby_summary,groupby_positions,_,bounds = load_hdf(data)
     all_beads = list(groupby_summary.groups.keys()) # list uuid
     
-    # load data for model
-    if key =='param':
-        plate_ds,_ = param_data(data)
-    elif key =='position':
-        plate_ds,_ = position_data(data)
-    elif key == 'summary':
-        plate_ds,_ = summary_data(data)
-    else: 
-        raise SyntaxError('key must be one of: position, param, summary')
+    # get predictions of every bead (cached with cache_dir)
+    probs = plate_predictions([model], data, key, cache_dir=cache_dir, max_length=max_length)[0]
     
     # slice data
     if interval is not None:
         start, end = interval
         uuids = all_beads[start:end]
-        plate_ds = plate_ds.skip(start).take(end - start)
+        probs = probs[start:end]
     else:
         uuids = all_beads
-        
-    # get predictions
-    plate_ds = plate_ds.padded_batch(32).prefetch(tf.data.AUTOTUNE)
     
-    probs = model.predict(plate_ds,verbose=0)
     preds = np.argmax(probs,axis=1)
     
     # loop through each bead and plot
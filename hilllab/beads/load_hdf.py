@@ -1,21 +1,37 @@
 # ellen han, 2/27/2026
 
+from pathlib import Path
 import pandas as pd
 
+from ..dynamics._primary_store import _instantaneous_key, _decode_instantaneous
+from ..dynamics.DynamicsDataset import DynamicsDataset
+
 def load_hdf(path):
     """
     Loads a HDF file, sorts summary and position dataframes by bead UUID.
     Returns groupby objects for summary and position, along with metadata dataframe.
     Also returns max xy position, for plotting purposes.
 
+    Positions are read from the 'instantaneous' table (or 'positions' in
+    older files). Files that store bead codes instead of UUIDs get their
+    UUIDs added back as a categorical column.
+
+    A DynamicsDataset folder can be given instead of a file. Its positions
+    are then read one bead at a time, when get_group is called, instead of
+    all being loaded up front.
+
     """
 
+    if Path(path).is_dir():
+        return DynamicsDataset(path).as_groupby()
+
     df_summary = pd.read_hdf(path, key='/summary')
-    df_positions = pd.read_hdf(path, key='/positions')
+    df_positions = pd.read_hdf(path, key=_instantaneous_key(path))
+    df_positions = _decode_instantaneous(df_positions, df_summary)
     df_metadata = pd.read_hdf(path, key='/metadata')
     
     groupby_summary = df_summary.groupby('uuid') 
-    groupby_positions = df_positions.groupby('uuid') 
+    groupby_positions = df_positions.groupby('uuid', observed=True) 
     
     # bounds
     xmax = df_positions['x'].max() 
@@ -0,0 +1,245 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+
+import os
+import json
+from pathlib import Path
+import tensorflow as tf
+import numpy as np
+import pandas as pd
+
+from ._bead_arrays import (LABEL_VOCAB, SPLITS, _plate_arrays, _assign_splits, _length_stats,
+                           _bucket_boundaries)
+from .tf_data import _batch
+
+"""
+functions to cache bead classification datasets as TFRecord shards:
+
+    - export_cache: writes the features and labels of every plate once,
+                    as shards per plate and split, with a manifest
+    - cache_data: reads one split of a cache as a dataset
+    - cache_preprocess: train, val, and test datasets ready for a model,
+                        like data_preprocess but read from the cache
+
+for training: export_cache once per set of plates (re-exporting only
+              changed plates), then cache_preprocess for every run
+"""
+
+def export_cache(plates, cache_path, kind, shard_size=4096, max_length=None, crop=False):
+    """
+    writes the features and labels of plates to a cache folder of TFRecord
+    shards. plates whose data and labels haven't changed since they were
+    cached are skipped.
+
+    ARGUMENTS:
+        plates (list): (data, labels) paths of each plate, as passed to
+            ###_data: the h5 file (or dynamics dataset folder) and the xlsx
+            file of bead classifications.
+        cache_path (str): folder to write the cache to.
+        kind (str): the features to cache, 'param', 'summary', or 'position'
+            (as from param_data, summary_data, and position_data).
+        shard_size (int): the largest number of beads in one shard.
+        max_length (int), crop (bool): opt, as for position_data.
+
+    RETURNS:
+        manifest (dict): the manifest of the cache, also saved to
+            manifest.json in the cache folder.
+
+    NOTES:
+        1. each bead's split comes from a hash of its uuid (see
+        _assign_splits), so a bead is in the same split in every export.
+        the split of every bead is saved in splits.csv.
+        2. each plate's beads are written to separate shards for each split,
+        so reading a split reads only its own shards.
+        3. labels are stored as integers of the label vocabulary.
+        4. the length of every bead is saved in splits.csv too, and
+        statistics of all lengths in the manifest. cache_preprocess buckets
+        positions by length with them.
+    """
+
+    cache_path = Path(cache_path)
+    cache_path.mkdir(parents=True, exist_ok=True)
+    manifest = _read_cache_manifest(cache_path)
+    if manifest.get('kind', kind) != kind:
+        raise ValueError(f"{cache_path} caches {manifest['kind']} features, not {kind}")
+    manifest.update({'kind': kind, 'vocab': LABEL_VOCAB})
+    cached_plates = manifest.setdefault('plates', {})
+
+    # split of every cached bead
+    splits_path = cache_path / 'splits.csv'
+    all_splits = pd.read_csv(splits_path) if splits_path.exists() else pd.DataFrame(columns=['plate', 'uuid', 'split', 'length'])
+
+    for data, labels in plates:
+        name = Path(data).name
+        source = {'files': _source_record(data, labels), 'max_length': max_length, 'crop': crop}
+        if cached_plates.get(name, {}).get('source') == source:
+            continue
+
+        # remove the old shards of a changed plate
+        for shard in cached_plates.pop(name, {}).get('shards', []):
+            (cache_path / shard['path']).unlink(missing_ok=True)
+
+        # features, labels, and split of every bead of this plate
+        arrays = _plate_arrays(data, labels, kind, max_length=max_length, crop=crop)
+        splits = _assign_splits(arrays['uuid'])
+        lengths = np.diff(arrays['row_splits']) if 'row_splits' in arrays else np.ones(len(arrays['uuid']), dtype=np.int64)
+        manifest['width'] = int(arrays['values'].shape[1])
+
+        shards = []
+        for split in SPLITS:
+            beads = np.flatnonzero(splits == split)
+            for i, first in enumerate(range(0, beads.size, shard_size)):
+                shard_beads = beads[first:first + shard_size]
+                shard_path = f'{name}-{split}-{i:05d}.tfrecord'
+                _write_shard(cache_path / shard_path, arrays, shard_beads)
+                shards.append({'path': shard_path, 'split': split, 'count': int(shard_beads.size)})
+
+        cached_plates[name] = {'source': source, 'shards': shards}
+        all_splits = pd.concat([all_splits[all_splits['plate'] != name],
+                                pd.DataFrame({'plate': name, 'uuid': arrays['uuid'], 'split': splits,
+                                              'length': lengths})],
+                               ignore_index=True)
+        print(f'cached {name}: {len(arrays["uuid"])} beads in {len(shards)} shards')
+
+    # drop plates that are no longer cached, then save the split of every
+    # bead and the manifest
+    all_splits = all_splits[all_splits['plate'].isin(list(cached_plates))]
+    manifest['lengths'] = _length_stats(np.concatenate([[0], np.cumsum(all_splits['length'].to_numpy(np.int64))]))
+    all_splits.to_csv(splits_path, index=False)
+    _write_cache_manifest(cache_path, manifest)
+
+    return manifest
+
+
+def cache_data(cache_path, split):
+    """
+    reads one split ('train', 'val', or 'test') of a cache, interleaving
+    its shards in parallel.
+
+    RETURNS:
+        dataset (tf.data.Dataset): (features, integer label) of each bead
+        count (int): number of beads in the dataset
+    """
+
+    manifest = _read_cache_manifest(cache_path)
+    shards = [shard for plate in manifest['plates'].values() for shard in plate['shards']
+              if shard['split'] == split]
+    count = sum(shard['count'] for shard in shards)
+    paths = [str(Path(cache_path) / shard['path']) for shard in shards]
+
+    # read several shards at once, parsing records in parallel
+    dataset = tf.data.Dataset.from_tensor_slices(paths)
+    dataset = dataset.interleave(tf.data.TFRecordDataset, cycle_length=tf.data.AUTOTUNE,
+                                 num_parallel_calls=tf.data.AUTOTUNE, deterministic=(split != 'train'))
+    dataset = dataset.map(_parser(manifest['kind'], manifest['width']), num_parallel_calls=tf.data.AUTOTUNE)
+
+    return dataset, count
+
+
+def cache_preprocess(cache_path, batch_size=32, n_buckets=8):
+    """
+    builds the train, val, and test datasets of a cache, as data_preprocess
+    does from ###_data: shuffle (train only), padded batch (bucketed by
+    length for positions), prefetch. labels are already integers and the
+    split is already stored, so no lookup or take/skip is needed. bucket
+    boundaries come from the stored lengths of the train beads.
+
+    RETURNS:
+        train_ds (tf.data.Dataset): to train the model
+        val_ds (tf.data.Dataset): to validate during training
+        test_ds (tf.data.Dataset): to evaluate after training
+    """
+
+    train_ds, _ = cache_data(cache_path, 'train')
+    val_ds, _ = cache_data(cache_path, 'val')
+    test_ds, _ = cache_data(cache_path, 'test')
+
+    # bucket boundaries from the stored lengths of the train beads
+    boundaries = []
+    if _read_cache_manifest(cache_path)['kind'] == 'position':
+        splits = pd.read_csv(Path(cache_path) / 'splits.csv')
+        boundaries = _bucket_boundaries(splits.loc[splits['split'] == 'train', 'length'], n_buckets)
+
+    train_ds = train_ds.cache().shuffle(buffer_size=10000, seed=42)
+    train_ds = _batch(train_ds, batch_size, boundaries).prefetch(tf.data.AUTOTUNE)
+    val_ds = _batch(val_ds.cache(), batch_size, boundaries).prefetch(tf.data.AUTOTUNE)
+    test_ds = _batch(test_ds.cache(), batch_size, boundaries).prefetch(tf.data.AUTOTUNE)
+
+    return train_ds, val_ds, test_ds
+
+
+def _write_shard(path, arrays, beads):
+    """
+    writes some beads of a plate as tf.train.Examples of their flattened
+    features, number of rows, label, and uuid.
+    """
+
+    temporary_path = f'{path}.tmp'
+    with tf.io.TFRecordWriter(temporary_path) as writer:
+        for bead in beads:
+            if 'row_splits' in arrays:
+                values = arrays['values'][arrays['row_splits'][bead]:arrays['row_splits'][bead + 1]]
+            else:
+                values = arrays['values'][bead:bead + 1]
+            label = -1 if arrays['label'] is None else int(arrays['label'][bead])
+
+            example = tf.train.Example(features=tf.train.Features(feature={
+                'values': tf.train.Feature(float_list=tf.train.FloatList(value=values.ravel())),
+                'length': tf.train.Feature(int64_list=tf.train.Int64List(value=[values.shape[0]])),
+                'label': tf.train.Feature(int64_list=tf.train.Int64List(value=[label])),
+                'uuid': tf.train.Feature(bytes_list=tf.train.BytesList(value=[arrays['uuid'][bead].encode()]))
+            }))
+            writer.write(example.SerializeToString())
+    os.replace(temporary_path, path)
+
+
+def _parser(kind, width):
+    """
+    returns the function parsing a record of a cache into its features
+    (positions of shape (None, 2), or a vector of width features) and label.
+    """
+
+    description = {
+        'values': tf.io.VarLenFeature(tf.float32) if kind == 'position' else tf.io.FixedLenFeature([width], tf.float32),
+        'length': tf.io.FixedLenFeature([], tf.int64),
+        'label': tf.io.FixedLenFeature([], tf.int64),
+    }
+
+    @tf.autograph.experimental.do_not_convert
+    def parse(record):
+        example = tf.io.parse_single_example(record, description)
+        values = example['values']
+        if kind == 'position':
+            values = tf.reshape(tf.sparse.to_dense(values), (-1, width))
+        return values, example['label']
+
+    return parse
+
+
+def _source_record(data, labels):
+    """returns the modification time and size of a plate's files."""
+
+    files = [data] if labels is None else [data, labels]
+    if Path(data).is_dir():
+        files[0] = Path(data) / 'tables.h5'
+
+    return [[os.path.getmtime(path), os.path.getsize(path)] for path in files]
+
+
+def _read_cache_manifest(cache_path):
+    """reads the manifest of a cache, which is empty if there is none."""
+
+    manifest_path = Path(cache_path) / 'manifest.json'
+    if not manifest_path.exists():
+        return {}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_cache_manifest(cache_path, manifest):
+    """writes the manifest of a cache, replacing it only once it is written."""
+
+    manifest_path = Path(cache_path) / 'manifest.json'
+    temporary_path = f'{manifest_path}.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(temporary_path, manifest_path)
@@ -1,10 +1,11 @@
 # ellen han, 3/9/2026
 
 import tensorflow as tf
-import pandas as pd
 import numpy as np
 
-from .load_hdf import load_hdf
+from ._bead_arrays import (PARAM_FEATURES, SUMMARY_FEATURES, LABEL_VOCAB, _read_summary, _join_labels,
+                           _summary_features, _position_arrays, _plate_arrays, _limit_lengths,
+                           _bucket_boundaries)
 
 """
 functions to prepare bead datasets for tensorflow:
@@ -15,11 +16,18 @@ functions to prepare bead datasets for tensorflow:
     
     - data_preprocessing: concatenates formatted datasets (if needed)
                         split into train/test/validation datasets
-                        shuffle, padded batch, prefetch 
+                        shuffle, padded batch (bucketed by length for
+                        positions), prefetch 
+    - inference_data: batched dataset of one plate for model.predict,
+                      sorted by length for positions
                         
 for training: pass path to data and labels to ###_data
               pass that to data_preprocessing
 for classify: just pass path to data to ###_data
+
+datasets are sliced from arrays of every bead (read at once, without a 
+python generator per bead), so the input pipeline runs in tensorflow.
+beads are in uuid order, as before.
                         
 """
 
@@ -39,62 +47,10 @@ def param_data(data,labels=None):
     
     """
     
-    # load primary analysis summary
-    groupby_summary,*_ = load_hdf(data)
-    all_beads = list(groupby_summary.groups.keys()) # list uuid
-    
-    # dataset for model training
-    if labels is not None:
-        
-        # load bead classification labels
-        df_class = pd.read_excel(labels).drop_duplicates(subset='uuid')
-        df_class.set_index('uuid', inplace=True) # index by uuid
-        
-        # filter beads
-        uuids = [uuid for uuid in all_beads 
-        if uuid in df_class.index 
-        and df_class.loc[uuid, 'classification'] != 'idk']
-        
-        def generator():
-            for uuid in uuids:
-            
-                # get label
-                label = df_class.loc[uuid,'classification']
-            
-                # get params
-                bead_data = groupby_summary.get_group(uuid)
-                params = bead_data[['displacement','straightness','circular_variance',
-                                    'bb_area','mean_speed','mean_acceleration']].values[0]
-                
-                yield params.astype('float32'), str(label)
-                
-        output_signature = (
-            tf.TensorSpec(shape=(6,), dtype=tf.float32), # param
-            tf.TensorSpec(shape=(), dtype=tf.string) # label
-            )
-    
-    # dataset for model use
-    else:
-        uuids = all_beads
-        def generator():
-            for uuid in uuids:
-                
-                # get params
-                bead_data = groupby_summary.get_group(uuid)
-                params = bead_data[['displacement','straightness','circular_variance',
-                                    'bb_area','mean_speed','mean_acceleration']].values[0]
-                
-                yield params.astype('float32')
-                
-        output_signature = tf.TensorSpec(shape=(6,), dtype=tf.float32) # param
-                
-    dataset = tf.data.Dataset.from_generator(generator, output_signature = output_signature)
-    count = len(uuids)
-    
-    return dataset, count
+    return _feature_dataset(data, PARAM_FEATURES, labels)
 
         
-def position_data(data,labels=None):
+def position_data(data,labels=None,max_length=None,crop=False):
     """
     takes bead x- and y- position data
     and reformats into a tensorflow dataset object.
@@ -102,78 +58,30 @@ def position_data(data,labels=None):
     ARGUMENTS:
         data (str): path to h5 file primary analysis data
         labels (str): opt, path to xlsx file bead classifications
+        max_length (int): opt, longest trajectory kept. longer trajectories
+            keep every n-th position (the smallest n that fits)
+        crop (bool): opt, keep the first max_length positions instead
         
     RETURNS:
         dataset(tf.data.Dataset): dataset containing position (and label) data
     
     """
     
-    # load primary analysis positions
-    groupby_summary,groupby_positions,*_ = load_hdf(data)
-    all_beads = list(groupby_summary.groups.keys()) # list uuid
+    # load primary analysis summary, and labels for model training
+    summary = _read_summary(data)
+    if labels is not None:
+        summary, label_strings = _join_labels(summary, labels)
+    
+    # positions of every bead (normalized by mean positions) as one flat
+    # array, sliced into one (None, 2) tensor per bead
+    values, row_splits = _limit_lengths(*_position_arrays(data, summary), max_length=max_length, crop=crop)
+    positions = tf.RaggedTensor.from_row_splits(values, row_splits, validate=False)
     
-    # dataset for model training
     if labels is not None:
-        
-        # load bead classification labels
-        df_class = pd.read_excel(labels).drop_duplicates(subset='uuid')
-        df_class.set_index('uuid', inplace=True) # index by uuid
-        
-        # filter beads
-        uuids = [uuid for uuid in all_beads 
-        if uuid in df_class.index 
-        and df_class.loc[uuid, 'classification'] != 'idk']
-    
-        def generator():
-            for uuid in uuids:
-                
-                # get label
-                label = df_class.loc[uuid,'classification']
-                
-                # get positions
-                bead_positions = groupby_positions.get_group(uuid)
-                
-                # normalize by mean positions
-                bead_summary = groupby_summary.get_group(uuid)
-                x_mean = bead_summary['mean_x'].iloc[0]
-                y_mean = bead_summary['mean_y'].iloc[0]
-                
-                x_data = bead_positions['x'] - x_mean
-                y_data = bead_positions['y'] - y_mean
-                positions = np.stack([x_data,y_data],axis=-1).astype('float32')
-    
-                yield positions, str(label)
-                
-        output_signature = (
-            tf.TensorSpec(shape=(None,2), dtype=tf.float32), # positions
-            tf.TensorSpec(shape=(), dtype=tf.string) # label
-            )
-    
-    # dataset for model use
+        dataset = tf.data.Dataset.from_tensor_slices((positions, label_strings))
     else:
-        uuids = all_beads
-        def generator():
-            for uuid in uuids:
-                
-                # get positions
-                bead_positions = groupby_positions.get_group(uuid)
-                
-                # normalize by mean positions
-                bead_summary = groupby_summary.get_group(uuid)
-                x_mean = bead_summary['mean_x'].iloc[0]
-                y_mean = bead_summary['mean_y'].iloc[0]
-                
-                x_data = bead_positions['x'] - x_mean
-                y_data = bead_positions['y'] - y_mean
-                positions = np.stack([x_data,y_data],axis=-1).astype('float32')
-    
-                yield positions
-                
-        output_signature = tf.TensorSpec(shape=(None,2), dtype=tf.float32) # positions
-                
-            
-    dataset = tf.data.Dataset.from_generator(generator, output_signature = output_signature)
-    count = len(uuids)
+        dataset = tf.data.Dataset.from_tensor_slices(positions)
+    count = summary.shape[0]
     
     return dataset, count
 
@@ -192,63 +100,34 @@ def summary_data(data,labels=None):
         
     """
     
-    # load primary analysis summary
-    groupby_summary,*_ = load_hdf(data)
-    all_beads = list(groupby_summary.groups.keys()) # list uuid
+    # all from displacement to bb area
+    return _feature_dataset(data, SUMMARY_FEATURES, labels)
+
+
+def _feature_dataset(data, columns, labels=None):
+    """
+    builds a dataset of fixed-width summary features (and labels) for
+    param_data and summary_data, from arrays of every bead at once.
+    
+    """
     
-    # dataset for model training
+    # load primary analysis summary, and labels for model training
+    summary = _read_summary(data)
     if labels is not None:
-        
-        # load bead classification labels
-        df_class = pd.read_excel(labels).drop_duplicates(subset='uuid')
-        df_class.set_index('uuid', inplace=True) # index by uuid
-        
-        # filter beads
-        uuids = [uuid for uuid in all_beads 
-        if uuid in df_class.index 
-        and df_class.loc[uuid, 'classification'] != 'idk']
-        
+        summary, label_strings = _join_labels(summary, labels)
     
-        def generator():
-            for uuid in uuids:
-
-                # get label
-                label = df_class.loc[uuid,'classification']
-            
-                # get params
-                # all from displacement to bb area
-                bead_data = groupby_summary.get_group(uuid)
-                params = bead_data.iloc[:,28:55].values[0] 
-                
-                yield params.astype('float32'), str(label)
-                
-        output_signature = (
-            tf.TensorSpec(shape=(27,), dtype=tf.float32), # param vector
-            tf.TensorSpec(shape=(), dtype=tf.string) # label
-            )
-        
-    # dataset for model use  
-    else: 
-        uuids = all_beads
-        def generator():
-            for uuid in uuids:
-                
-                # get params
-                # all from displacement to bb area
-                bead_data = groupby_summary.get_group(uuid)
-                params = bead_data.iloc[:,28:55].values[0] 
-                
-                yield params.astype('float32')
-                
-        output_signature = tf.TensorSpec(shape=(27,), dtype=tf.float32) # param vector
-        
-    dataset = tf.data.Dataset.from_generator(generator, output_signature = output_signature)
-    count = len(uuids)
+    features = _summary_features(summary, columns)
+    
+    if labels is not None:
+        dataset = tf.data.Dataset.from_tensor_slices((features, label_strings))
+    else:
+        dataset = tf.data.Dataset.from_tensor_slices(features)
+    count = summary.shape[0]
     
     return dataset, count
    
  
-def data_preprocess(datasets):
+def data_preprocess(datasets, batch_size=32, n_buckets=8):
     """
     preprocesses datasets for tensorflow training:
         concatenates formatted datasets if needed (same features);
@@ -257,9 +136,17 @@ def data_preprocess(datasets):
         shuffle, padded batch, prefetch.
     returns train, val, test datasets ready to be fed to model
     
+    positions are batched by length (bucket_by_sequence_length), so each
+    batch is padded only to the longest trajectory of similar length ones
+    instead of the longest of 32 random ones. bucket boundaries split the
+    trajectories into n_buckets buckets of about the same number of beads.
+    
     ARGUMENTS:
         datasets: output from ###_data (dataset, count)
                   (if list, must be from same ###_data func)
+        batch_size (int): opt, beads per batch
+        n_buckets (int): opt, number of length buckets for positions
+                         (use 1 for plain padded batches)
     
     RETURNS:
         train_ds (tf.data.Dataset): to train the model 
@@ -276,8 +163,15 @@ def data_preprocess(datasets):
             total_beads += count
     else: all_ds, total_beads = datasets
     
+    # bucket boundaries from the length of every trajectory
+    boundaries = []
+    if all_ds.element_spec[0].shape.rank == 2:
+        lengths = np.fromiter(all_ds.map(lambda features, label: tf.shape(features)[0]).as_numpy_iterator(),
+                              dtype=np.int64)
+        boundaries = _bucket_boundaries(lengths, n_buckets)
+    
     # encode labels to integers
-    vocab = ['stuck','transiting','oscillating','discard']
+    vocab = LABEL_VOCAB
     lookup = tf.keras.layers.StringLookup(vocabulary=vocab, num_oov_indices=0)
     
     @tf.autograph.experimental.do_not_convert
@@ -301,9 +195,71 @@ def data_preprocess(datasets):
     test_ds = all_ds.skip(val_size)
     
     # padded batch, prefetch
-    train_ds = train_ds.cache().padded_batch(32).prefetch(tf.data.AUTOTUNE)
-    val_ds = val_ds.cache().padded_batch(32).prefetch(tf.data.AUTOTUNE)
-    test_ds = test_ds.cache().padded_batch(32).prefetch(tf.data.AUTOTUNE)
+    train_ds = _batch(train_ds.cache(), batch_size, boundaries).prefetch(tf.data.AUTOTUNE)
+    val_ds = _batch(val_ds.cache(), batch_size, boundaries).prefetch(tf.data.AUTOTUNE)
+    test_ds = _batch(test_ds.cache(), batch_size, boundaries).prefetch(tf.data.AUTOTUNE)
     
     return train_ds, val_ds, test_ds
+
+
+def inference_data(data, key, batch_size=32, max_length=None, crop=False, interval=None):
+    """
+    builds the batched dataset of one plate for model.predict.
+    positions are sorted by length so each batch holds trajectories of
+    similar length and is barely padded.
+    
+    ARGUMENTS:
+        data (str): path to h5 file primary analysis data
+        key (str): model type ('position', 'param', 'summary')
+        batch_size (int): opt, beads per batch
+        max_length (int), crop (bool): opt, as for position_data
+        interval (tuple): opt, (start, end) of the beads to use, in uuid order
+    
+    RETURNS:
+        dataset (tf.data.Dataset): batched features, ready for model.predict
+        restore (np.ndarray): puts predictions back in uuid order:
+                              probs = model.predict(dataset)[restore]
+    
+    """
+    
+    if key not in ['param', 'position', 'summary']:
+        raise SyntaxError('key must be one of: position, param, summary')
+    arrays = _plate_arrays(data, None, key, max_length=max_length, crop=crop)
+    
+    # slice beads
+    start, end = interval if interval is not None else (0, len(arrays['uuid']))
+    end = min(end, len(arrays['uuid']))
+    
+    if key == 'position':
+        row_splits = arrays['row_splits']
+        values = arrays['values'][row_splits[start]:row_splits[end]]
+        row_splits = row_splits[start:end + 1] - row_splits[start]
+        
+        # sort by length, shortest first
+        order = np.argsort(np.diff(row_splits), kind='stable')
+        positions = tf.RaggedTensor.from_row_splits(values, row_splits, validate=False)
+        dataset = tf.data.Dataset.from_tensor_slices(tf.gather(positions, order))
+    else:
+        order = np.arange(end - start)
+        dataset = tf.data.Dataset.from_tensor_slices(arrays['values'][start:end])
+    
+    dataset = dataset.padded_batch(batch_size).prefetch(tf.data.AUTOTUNE)
+    
+    return dataset, np.argsort(order)
+
+
+def _batch(dataset, batch_size, boundaries):
+    """
+    padded batches of (features, label), bucketed by length if there are
+    bucket boundaries.
+    
+    """
+    
+    if not boundaries:
+        return dataset.padded_batch(batch_size)
+    
+    return dataset.bucket_by_sequence_length(
+        element_length_func=lambda features, label: tf.shape(features)[0],
+        bucket_boundaries=boundaries,
+        bucket_batch_sizes=[batch_size] * (len(boundaries) + 1))
   
\ No newline at end of file
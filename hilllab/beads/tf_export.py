@@ -0,0 +1,138 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+
+import os
+from pathlib import Path
+import tensorflow as tf
+import keras
+import numpy as np
+
+from .eval.exported_models import load_exported, parity_check, benchmark
+
+"""
+functions to export trained bead classification models for CPU inference
+(run them with eval.exported_models, which doesn't need keras):
+
+    - export_numpy: dense models (param_model, summary_model) as numpy weights
+    - export_tflite: any model (e.g. position_model) as TFLite, optionally
+                     quantized to float16 or int8
+    - export_models: exports every .keras model in a folder, checks parity
+                     with the original, and benchmarks both
+
+"""
+
+def export_numpy(model, path):
+    """
+    exports a dense model (only Dense and Dropout layers, as param_model and
+    summary_model) as the weights, biases, and activation of each layer.
+
+    ARGUMENTS:
+        model (tf.keras.Model): the model to export
+        path (str): path to the .npz file
+
+    """
+
+    arrays = {}
+    activations = []
+    for layer in model.layers:
+        kind = layer.__class__.__name__
+        if kind in ['Dropout', 'InputLayer']:
+            continue # nothing to do at inference
+        if kind != 'Dense':
+            raise ValueError(f'{model.name} has a {kind} layer; only dense models can be exported to numpy')
+
+        W, b = layer.get_weights()
+        arrays[f'W{len(activations)}'] = W.astype(np.float32)
+        arrays[f'b{len(activations)}'] = b.astype(np.float32)
+        activations.append(layer.get_config()['activation'])
+
+    np.savez(path, n_layers=len(activations), activations=np.array(activations), **arrays)
+
+
+def export_tflite(model, path, quantize=None, representative_data=None):
+    """
+    exports a model as a TFLite flatbuffer.
+
+    ARGUMENTS:
+        model (tf.keras.Model): the model to export
+        path (str): path to the .tflite file
+        quantize (str): opt, None (float32), 'float16' (half size weights),
+                        or 'int8' (integer weights and activations)
+        representative_data (tf.data.Dataset): batched features (or
+                        features, labels) used to calibrate int8 quantization
+
+    """
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+
+    # LSTMs with masking may need tensorflow ops not built into TFLite
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+
+    if quantize == 'float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantize == 'int8':
+        if representative_data is None:
+            raise ValueError('int8 quantization needs representative_data')
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+        def representative_dataset():
+            for batch in representative_data.take(100):
+                features = batch[0] if isinstance(batch, tuple) else batch
+                yield [tf.cast(features, tf.float32)]
+
+        converter.representative_dataset = representative_dataset
+    elif quantize is not None:
+        raise ValueError(f"quantize must be None, 'float16', or 'int8', not {quantize!r}")
+
+    with open(path, 'wb') as f:
+        f.write(converter.convert())
+
+
+def export_models(path, export_path, test_ds, quantize=None, numpy=True):
+    """
+    exports every .keras model in a folder, checking each export against
+    its original model and benchmarking both on a test dataset.
+
+    ARGUMENTS:
+        path (str): path to folder where models are
+        export_path (str): folder to write the exports to
+        test_ds (tf.data.Dataset): batched test dataset (features, labels)
+        quantize (str): opt, TFLite quantization (see export_tflite)
+        numpy (bool): opt, export dense models with export_numpy instead of TFLite
+
+    RETURNS:
+        report (dict): for each model, its export path, parity_check
+                       results, and beads per second before and after
+
+    """
+
+    export_path = Path(export_path)
+    export_path.mkdir(parents=True, exist_ok=True)
+
+    report = {}
+    for file in sorted(os.listdir(path)):
+        if not file.endswith('.keras'):
+            continue
+        model = keras.models.load_model(os.path.join(path, file))
+        name = file[:-len('.keras')]
+
+        # dense models to numpy, others to tflite
+        dense = all(layer.__class__.__name__ in ['Dense', 'Dropout', 'InputLayer'] for layer in model.layers)
+        if numpy and dense:
+            exported_path = export_path / f'{name}.npz'
+            export_numpy(model, exported_path)
+        else:
+            exported_path = export_path / f'{name}.tflite'
+            export_tflite(model, exported_path, quantize=quantize, representative_data=test_ds)
+        exported = load_exported(exported_path)[0]
+
+        # check the export predicts like the original, then time both
+        parity = parity_check(model, exported, test_ds)
+        print(f'{name}: agreement {parity["agreement"]:.4f}, max prob diff {parity["max_abs_diff"]:.2e}')
+        throughput = benchmark({f'{name} keras': model, f'{name} {exported_path.suffix[1:]}': exported}, test_ds)
+
+        report[name] = {'path': str(exported_path), **parity,
+                        'keras_beads_per_s': throughput[f'{name} keras'],
+                        'exported_beads_per_s': throughput[f'{name} {exported_path.suffix[1:]}']}
+
+    return report
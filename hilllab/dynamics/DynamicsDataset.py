@@ -0,0 +1,360 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+# This class stores the results of the primary analysis as a dataset
+# folder that is partitioned by source VRPN, with an index of where every
+# bead's rows are. Single beads can then be read without loading (or
+# querying) the instantaneous table of the whole dataset.
+
+from pathlib import Path
+import os
+import numpy as np
+import pandas as pd
+import h5py
+
+from ..utilities.print_progress_bar import print_progress_bar
+from ._primary_store import (_read_tables, _iterate_beads, _shift_codes, _DATA_COLUMNS,
+                             _INSTANTANEOUS_INTEGERS)
+
+# Rows per compressed chunk of each partition. Small chunks keep reads of
+# single beads fast, since a read decompresses every chunk it touches.
+_CHUNK_ROWS = 2**10
+
+class DynamicsDataset():
+
+    """
+    A folder of primary analysis results that can read single beads (or
+    single VRPNs) directly from disk.
+
+    ARGUMENTS:
+        folder (string): the path of the dataset folder, as created by
+            DynamicsDataset.build.
+
+    NOTES:
+        1. The dataset folder holds tables.h5, with the summary, metadata,
+        and bead index tables, and one partition file per VRPN holding its
+        instantaneous rows as two compressed matrices: one of the float
+        columns and one of the integer columns.
+        2. The bead index records the partition and row range of every
+        bead. It is loaded when the dataset is opened, so finding a bead is
+        a dictionary lookup and reading it touches only its own rows.
+        3. Codes work like in the primary analysis H5 files: each bead's
+        uuid_code looks up its row in the summary and each VRPN's path_code
+        (which is also its partition) its row in the metadata. Codes are
+        never reused, so removing a VRPN leaves a gap in them.
+    """
+
+    def __init__(self, folder):
+
+        self.folder = Path(folder)
+        tables_path = self.folder / 'tables.h5'
+        if not tables_path.exists():
+            raise FileNotFoundError(f'{folder} is not a dynamics dataset')
+
+        self.summary = pd.read_hdf(tables_path, key='summary')
+        self.metadata = pd.read_hdf(tables_path, key='metadata')
+        self.beads = pd.read_hdf(tables_path, key='beads')
+
+        self._index_beads()
+
+
+    @classmethod
+    def build(cls, sources, folder, chunksize=2**20):
+
+        """
+        Creates a dataset folder from primary analysis H5 files (the
+        partial, subfolder, or compiled files) and returns it. Any existing
+        dataset in the folder is replaced.
+        """
+
+        folder = Path(folder)
+        (folder / 'partitions').mkdir(parents=True, exist_ok=True)
+        for path in (folder / 'partitions').glob('*.h5'):
+            os.remove(path)
+
+        # Start from an empty dataset, then add every source
+        dataset = cls.__new__(cls)
+        dataset.folder = folder
+        dataset.summary = pd.DataFrame()
+        dataset.metadata = pd.DataFrame()
+        dataset.beads = pd.DataFrame({'uuid_code': [], 'partition': [], 'start': [], 'stop': []})
+        dataset.add(sources, chunksize=chunksize)
+
+        return dataset
+
+
+    def add(self, sources, chunksize=2**20):
+
+        """
+        Adds the beads of more primary analysis H5 files to the dataset,
+        each VRPN as a new partition. Existing partitions aren't touched.
+        """
+
+        if isinstance(sources, (str, Path)):
+            sources = [sources]
+        sources = [str(source) for source in sources]
+        if not sources:
+            return
+
+        # New beads and VRPNs are numbered after the existing ones
+        summary, metadata, summaries, offsets = _read_tables(sources, *self.next_codes())
+
+        # Copy the instantaneous rows into their partitions, recording
+        # where every bead starts and stops
+        bead_rows = []
+        for i, (source, source_summary, offset) in enumerate(zip(sources, summaries, offsets)):
+            for chunk in _iterate_beads(source, source_summary, chunksize=chunksize):
+                chunk = _shift_codes(chunk, *offset)
+                bead_rows.append(self._append_rows(chunk))
+            print_progress_bar(progress=i+1, total=len(sources), title='Building dataset')
+
+        beads = pd.concat(bead_rows, ignore_index=True) if bead_rows else self.beads.iloc[0:0]
+        beads.insert(0, 'uuid', pd.Series(summary['uuid'].to_numpy(), index=summary['uuid_code'].to_numpy())
+                     .loc[beads['uuid_code']].to_numpy())
+
+        # Add the new rows to the tables
+        self.summary = pd.concat([self.summary, summary], ignore_index=True)
+        self.metadata = pd.concat([self.metadata, metadata], ignore_index=True)
+        self.beads = pd.concat([self.beads, beads], ignore_index=True).astype(
+            {'uuid_code': np.int64, 'partition': np.int64, 'start': np.int64, 'stop': np.int64})
+        self._index_beads()
+        _write_tables(self.folder, summary=self.summary, metadata=self.metadata, beads=self.beads)
+
+
+    def remove(self, paths):
+
+        """
+        Removes every bead of the given VRPN paths from the dataset,
+        deleting their partitions. Paths not in the dataset are ignored.
+        """
+
+        if isinstance(paths, (str, Path)):
+            paths = [paths]
+        if self.metadata.empty:
+            return
+        removed = self.metadata['path'].isin([str(path) for path in paths]).to_numpy()
+        if not removed.any():
+            return
+
+        path_codes = self.metadata['path_code'].to_numpy()[removed]
+        for path_code in path_codes:
+            self._partition_path(path_code).unlink(missing_ok=True)
+
+        # Drop their rows from every table
+        self.metadata = self.metadata[~removed].reset_index(drop=True)
+        self.summary = self.summary[~self.summary['path_code'].isin(path_codes)].reset_index(drop=True)
+        self.beads = self.beads[~self.beads['partition'].isin(path_codes)].reset_index(drop=True)
+        self._index_beads()
+        _write_tables(self.folder, summary=self.summary, metadata=self.metadata, beads=self.beads)
+
+
+    def update_summary(self, values):
+
+        """
+        Sets summary columns (such as AFV values or clusters) for some
+        beads. values is a dataframe with a uuid_code column and the columns
+        to set; new columns are empty for every other bead.
+        """
+
+        rows = self._summary_codes.get_indexer(values['uuid_code'])
+        if (rows < 0).any():
+            raise KeyError('Some uuid_code values are not in the dataset')
+
+        for column in values.columns.drop('uuid_code'):
+            if column not in self.summary.columns:
+                self.summary[column] = np.nan if values[column].dtype.kind in 'biuf' else None
+            self.summary.iloc[rows, self.summary.columns.get_loc(column)] = values[column].to_numpy()
+
+        _write_tables(self.folder, summary=self.summary, metadata=self.metadata, beads=self.beads)
+
+
+    def next_codes(self):
+
+        """Returns the uuid_code and path_code the next added VRPN starts at."""
+
+        next_uuid_code = int(self.summary['uuid_code'].max()) + 1 if len(self) else 0
+        next_path_code = int(self.metadata['path_code'].max()) + 1 if self.metadata.shape[0] else 0
+
+        return next_uuid_code, next_path_code
+
+
+    def __len__(self):
+        return self.summary.shape[0]
+
+
+    def __repr__(self):
+        return f'DynamicsDataset({len(self)} beads, {self.metadata.shape[0]} VRPNs)'
+
+
+    @property
+    def uuids(self):
+
+        """The UUID of every bead, in summary order."""
+
+        return list(self.summary['uuid'])
+
+
+    def get_bead(self, uuid, columns=None):
+
+        """
+        Reads the instantaneous rows of one bead, by UUID or uuid_code.
+        Only that bead's rows are read from disk.
+        """
+
+        if isinstance(uuid, (int, np.integer)):
+            row = self.beads.iloc[self._codes.get_loc(uuid)]
+        else:
+            row = self.beads.iloc[self._uuids.get_loc(uuid)]
+
+        return self._read_partition(row['partition'], columns=columns, start=row['start'], stop=row['stop'])
+
+
+    def get_summary(self, uuid):
+
+        """Returns the summary row of one bead, by UUID."""
+
+        return self.summary.iloc[self._summary_codes.get_loc(self.beads['uuid_code'].iloc[self._uuids.get_loc(uuid)])]
+
+
+    def get_partition(self, path_code, columns=None):
+
+        """Reads the instantaneous rows of every bead of one VRPN."""
+
+        return self._read_partition(path_code, columns=columns)
+
+
+    def bounds(self):
+
+        """Returns the largest x and y position of any bead."""
+
+        return {'x': self.summary['max_x'].max(), 'y': self.summary['max_y'].max()}
+
+
+    def as_groupby(self):
+
+        """
+        Returns the same (groupby_summary, groupby_positions, metadata,
+        bounds) tuple as beads.load_hdf, except that the positions of each
+        bead are only read from disk when get_group is called.
+        """
+
+        return self.summary.groupby('uuid'), _BeadGroups(self), self.metadata, self.bounds()
+
+
+    def _index_beads(self):
+
+        """
+        Indexes the rows of the bead index by UUID and by uuid_code, and the
+        rows of the summary by uuid_code.
+        """
+
+        self._uuids = pd.Index(self.beads['uuid'])
+        self._codes = pd.Index(self.beads['uuid_code'])
+        self._summary_codes = pd.Index(self.summary['uuid_code'])
+
+
+    def _partition_path(self, partition):
+        return self.folder / 'partitions' / f'{int(partition):06d}.h5'
+
+
+    def _read_partition(self, partition, columns=None, start=0, stop=None):
+
+        """Reads a row range of the columns of one partition."""
+
+        with h5py.File(self._partition_path(partition), 'r') as f:
+            all_columns = list(f.attrs['columns'])
+            columns = all_columns if columns is None else list(columns)
+
+            # Read each matrix only if one of its columns was requested
+            data = {}
+            for kind in ['floats', 'integers']:
+                names = list(f[kind].attrs['columns'])
+                wanted = [names.index(column) for column in columns if column in names]
+                if wanted:
+                    values = f[kind][start:stop]
+                    data.update({names[j]: values[:, j] for j in wanted})
+
+        return pd.DataFrame(data, columns=columns)
+
+
+    def _append_rows(self, chunk):
+
+        """
+        Appends a chunk of whole beads to their partitions. Returns the
+        uuid_code, partition, start, and stop of each bead of the chunk.
+        """
+
+        bead_rows = []
+        partitions = chunk['path_code'].to_numpy()
+        edges = np.concatenate([[0], np.flatnonzero(np.diff(partitions)) + 1, [partitions.size]])
+        for first, last in zip(edges[:-1], edges[1:]):
+            piece = chunk.iloc[first:last]
+            partition = int(partitions[first])
+
+            with h5py.File(self._partition_path(partition), 'a') as f:
+                if 'columns' not in f.attrs:
+                    f.attrs['columns'] = [str(column) for column in piece.columns]
+                    for kind, names, dtype in _matrices(piece.columns):
+                        dataset = f.create_dataset(kind, shape=(0, len(names)), maxshape=(None, len(names)),
+                                                   dtype=dtype, chunks=(_CHUNK_ROWS, len(names)),
+                                                   compression='lzf', shuffle=True)
+                        dataset.attrs['columns'] = names
+
+                # Grow both matrices and write the new rows at the end
+                base = f['floats'].shape[0]
+                for kind in ['floats', 'integers']:
+                    names = list(f[kind].attrs['columns'])
+                    f[kind].resize((base + piece.shape[0], len(names)))
+                    f[kind][base:] = piece[names].to_numpy(dtype=f[kind].dtype)
+
+            # Row range of each bead within the partition
+            codes = piece['uuid_code'].to_numpy()
+            starts = np.concatenate([[0], np.flatnonzero(np.diff(codes)) + 1])
+            stops = np.append(starts[1:], codes.size)
+            bead_rows.append(pd.DataFrame({'uuid_code': codes[starts], 'partition': partition,
+                                           'start': base + starts, 'stop': base + stops}))
+
+        return pd.concat(bead_rows, ignore_index=True)
+
+
+class _BeadGroups():
+
+    """
+    Stands in for a DataFrameGroupBy of the instantaneous table by UUID,
+    reading each group from a DynamicsDataset only when it is requested.
+    """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    @property
+    def groups(self):
+        return dict.fromkeys(self.dataset.uuids)
+
+    def get_group(self, uuid):
+        return self.dataset.get_bead(uuid).assign(uuid=uuid)
+
+
+def _matrices(columns):
+
+    """
+    Splits the instantaneous columns into the float and integer matrices of
+    a partition, returning (name, columns, dtype) for each.
+    """
+
+    integers = [str(column) for column in columns if column in _INSTANTANEOUS_INTEGERS]
+    floats = [str(column) for column in columns if column not in _INSTANTANEOUS_INTEGERS]
+
+    return [('floats', floats, np.float32), ('integers', integers, np.int32)]
+
+
+def _write_tables(folder, summary, metadata, beads):
+
+    """Writes the summary, metadata, and bead index tables of a dataset."""
+
+    path = Path(folder) / 'tables.h5'
+    temporary_path = f'{path}.tmp'
+    summary.to_hdf(temporary_path, key='summary', mode='w', format='table',
+                   data_columns=[c for c in _DATA_COLUMNS['summary'] if c in summary.columns])
+    metadata.to_hdf(temporary_path, key='metadata', mode='a', format='table',
+                    data_columns=[c for c in _DATA_COLUMNS['metadata'] if c in metadata.columns])
+    beads.to_hdf(temporary_path, key='beads', mode='a', format='table', data_columns=['uuid'])
+    os.replace(temporary_path, path)
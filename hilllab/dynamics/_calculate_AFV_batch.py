@@ -0,0 +1,111 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+import numpy as np
+import pandas as pd
+from scipy.signal import find_peaks
+
+from ._segment_stats import _segment_index, _segment_stats
+
+# Columns of the AFV table, in order
+AFV_COLUMNS = ['amplitude_abs', 'amplitude_mean', 'amplitude_quar', 'frequency',
+               'velocity_up_mean', 'velocity_down_mean', 'velocity_up_med', 'velocity_down_med']
+
+def _calculate_AFV_batch(pca, speed, counts, fps):
+
+    """
+    Calculates the amplitude, frequency, and velocity (AFV) of many beads
+    at once. See calculate_AFV for the definition of each value.
+
+    ARGUMENTS:
+        pca (numpy.ndarray): the detrended PCA signal of every bead, one
+            bead after another.
+        speed (numpy.ndarray): the matching instantaneous speeds.
+        counts (numpy.ndarray): the number of rows of each bead.
+        fps (float or numpy.ndarray): the frame rate of all beads, or of
+            each bead.
+
+    RETURNS:
+        afv (pandas.DataFrame): one row per bead with the AFV_COLUMNS.
+            Values that can't be calculated (such as the amplitude of a
+            bead without peaks) are NaN.
+
+    NOTES:
+        1. Stroke speeds are split with masks over all beads at once and
+        reduced per bead, instead of a loop over every frame.
+        2. Beads are grouped by their FFT length (the next power of two of
+        their length), and each group is transformed with one rFFT of a
+        zero-padded matrix.
+        3. Peaks are still found one bead at a time with find_peaks, since
+        prominence depends on the whole signal of each bead.
+    """
+
+    pca = np.asarray(pca, dtype=np.float64)
+    speed = np.asarray(speed, dtype=np.float64)
+    counts = np.asarray(counts, dtype=np.int64)
+    fps = np.broadcast_to(np.asarray(fps, dtype=np.float64), counts.shape)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+    n_beads = counts.size
+
+    afv = {column: np.full(n_beads, np.nan) for column in AFV_COLUMNS}
+
+    # <<<<< CALCULATE AMPLITUDE >>>>>
+    for i, (start, n) in enumerate(zip(starts, counts)):
+        one_pca = pca[start:start + n]
+
+        # Find peaks in PCA signal
+        hipeaks_index, _ = find_peaks(one_pca, prominence=1)
+        lopeaks_index, _ = find_peaks(-one_pca, prominence=1)
+        if (len(hipeaks_index) == 0) or (len(lopeaks_index) == 0):
+            continue
+
+        # Pull the values from these peak indices
+        hipeaks = one_pca[hipeaks_index]
+        lopeaks = one_pca[lopeaks_index]
+
+        # Means of the highest and lowest quartile of peaks
+        hi_quartile_mean = np.mean(hipeaks[hipeaks >= np.percentile(hipeaks, 75)])
+        lo_quartile_mean = np.mean(lopeaks[lopeaks <= np.percentile(lopeaks, 25)])
+
+        afv['amplitude_abs'][i] = hipeaks.max() - lopeaks.min()
+        afv['amplitude_mean'][i] = hipeaks.mean() - lopeaks.mean()
+        afv['amplitude_quar'][i] = hi_quartile_mean - lo_quartile_mean
+
+    # <<<<< CALCULATE FREQUENCY >>>>>
+    # Pad each PCA signal to a length equal to a power of two for a faster
+    # FFT, and transform every bead with the same padded length together
+    target_lengths = np.array([1 << int(n - 1).bit_length() if n > 0 else 0 for n in counts])
+    for target_length in np.unique(target_lengths[counts > 0]):
+        group = np.flatnonzero(target_lengths == target_length)
+
+        # Zero-padded matrix of the signals in this group
+        padded = np.zeros((group.size, target_length))
+        rows = np.repeat(np.arange(group.size), counts[group])
+        columns = np.arange(counts[group].sum()) - np.repeat(np.cumsum(counts[group]) - counts[group], counts[group])
+        padded[rows, columns] = pca[np.repeat(starts[group], counts[group]) + columns]
+
+        # Power spectrum of every signal. The frequency axis must use the
+        # padded length, since that is the length actually transformed.
+        power = np.abs(np.fft.rfft(padded, axis=1))**2
+
+        for row, i in enumerate(group):
+            freqs = np.fft.rfftfreq(target_length, d=1 / fps[i])
+            f_peaks, f_properties = find_peaks(power[row], prominence=300)
+            if len(f_peaks) > 0:
+                afv['frequency'][i] = freqs[f_peaks[np.argmax(f_properties['prominences'])]]
+
+    # <<<<< CALCULATE VELOCITY >>>>>
+    # The direction of each step, paired with the speed at its first row.
+    # The last row of each bead has no step.
+    segment = _segment_index(counts)
+    has_step = np.zeros(pca.size, dtype=bool)
+    has_step[:-1] = segment[1:] == segment[:-1]
+    rising = np.zeros(pca.size, dtype=bool)
+    rising[:-1] = np.diff(pca) > 0
+    valid = has_step & ~np.isnan(speed)
+
+    # Reduce the up- and downstroke speeds of each bead
+    for direction, mask in [('up', valid & rising), ('down', valid & ~rising)]:
+        stats = _segment_stats(speed[mask], np.bincount(segment[mask], minlength=n_beads))
+        afv[f'velocity_{direction}_mean'] = stats['mean']
+        afv[f'velocity_{direction}_med'] = stats['median']
+
+    return pd.DataFrame(afv, columns=AFV_COLUMNS)
@@ -0,0 +1,114 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+import pickle
+import os
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+from sklearn.mixture import GaussianMixture
+
+# Summary columns used as the features of the GMM, and its cluster labels
+GMM_FEATURES = ['displacement', 'straightness', 'circular_variance', 'bb_area', 'mean_speed', 'mean_acceleration']
+GMM_LABELS = ['stuck', 'oscillating', 'transiting']
+
+def _fit_GMM(summary, sample_size=100000, random_state=42):
+
+    """
+    Fits the feature scaler and GMM to the beads of a summary table.
+    Returns the fitted model as a dictionary of the scaler, the GMM, and
+    the label of each of its components.
+
+    NOTES:
+        1. Summaries with more than sample_size complete beads are fit on a
+        subsample stratified by VRPN (path_code, or path in older files),
+        so every video is represented in proportion to its beads.
+        2. Components are labelled by their mean features rather than their
+        (arbitrary) order: the slowest is stuck, the one of the other two
+        with the largest displacement is transiting, and the last is
+        oscillating.
+    """
+
+    complete = summary.dropna(subset=GMM_FEATURES)
+    if (sample_size is not None) and (complete.shape[0] > sample_size):
+        complete = _stratified_sample(complete, sample_size, random_state)
+    X = complete[GMM_FEATURES].to_numpy()  # shape (n_particles, n_features)
+
+    # Scale features
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+
+    # Fit GMM
+    gmm = GaussianMixture(n_components=3, covariance_type='full', random_state=random_state)
+    gmm.fit(X_scaled)
+
+    # Name each component from its mean features, in the original units
+    means = pd.DataFrame(scaler.inverse_transform(gmm.means_), columns=GMM_FEATURES)
+    stuck = int(means['mean_speed'].idxmin())
+    moving = means.drop(index=stuck)
+    transiting = int(moving['displacement'].idxmax())
+    oscillating = int(moving.drop(index=transiting).index[0])
+    labels = {stuck: 'stuck', oscillating: 'oscillating', transiting: 'transiting'}
+    labels = dict(sorted(labels.items()))
+
+    return {'scaler': scaler, 'gmm': gmm, 'labels': labels}
+
+
+def _stratified_sample(summary, sample_size, random_state):
+
+    """Samples about sample_size beads, the same fraction from every VRPN."""
+
+    stratum = 'path_code' if 'path_code' in summary.columns else 'path'
+    fraction = sample_size / summary.shape[0]
+
+    return summary.groupby(stratum, group_keys=False).sample(frac=fraction, random_state=random_state)
+
+
+def _predict_GMM(model, summary, chunksize=2**18):
+
+    """
+    Labels the beads of a summary table with a fitted model, chunksize
+    beads at a time. Returns a dataframe with the same index as the
+    summary, holding the cluster and the weight of every cluster. Beads
+    missing a feature are left empty.
+    """
+
+    labels = model['labels']
+    features = summary[GMM_FEATURES]
+    complete = features.notna().all(axis=1).to_numpy()
+
+    clusters = pd.DataFrame(index=summary.index)
+    clusters['cluster'] = pd.Series(np.nan, index=summary.index, dtype=object)
+    for label in GMM_LABELS:
+        clusters[f'{label}_cluster_weight'] = np.nan
+
+    X = features.to_numpy()
+    rows = np.flatnonzero(complete)
+    names = np.array([labels[component] for component in range(len(labels))], dtype=object)
+    cluster_column = clusters.columns.get_loc('cluster')
+    for first in range(0, rows.size, chunksize):
+        chunk_rows = rows[first:first + chunksize]
+        X_scaled = model['scaler'].transform(X[chunk_rows])
+        cluster_probs = model['gmm'].predict_proba(X_scaled)
+
+        clusters.iloc[chunk_rows, cluster_column] = names[cluster_probs.argmax(axis=1)]
+        for component, label in labels.items():
+            clusters.iloc[chunk_rows, clusters.columns.get_loc(f'{label}_cluster_weight')] = cluster_probs[:, component]
+
+    return clusters
+
+
+def _save_model(model, path):
+
+    """Saves a fitted model, replacing the file only once it is written."""
+
+    temporary_path = f'{path}.tmp'
+    with open(temporary_path, 'wb') as f:
+        pickle.dump(model, f)
+    os.replace(temporary_path, path)
+
+
+def _load_model(path):
+
+    """Loads a model saved by _save_model."""
+
+    with open(path, 'rb') as f:
+        return pickle.load(f)
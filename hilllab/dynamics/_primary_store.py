@@ -0,0 +1,325 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+import os
+import numpy as np
+import pandas as pd
+
+# Column types of the instantaneous table. Every other column is float32,
+# with NaN wherever a value doesn't exist (such as the speed at the first
+# position of a particle).
+_INSTANTANEOUS_INTEGERS = ['index', 'particle_id', 'uuid_code', 'path_code']
+
+# Columns that can be used in where= queries of each table
+_DATA_COLUMNS = {'summary': ['uuid', 'path', 'particle_id', 'uuid_code', 'path_code'],
+                 'instantaneous': ['particle_id', 'uuid_code', 'path_code'],
+                 'metadata': ['path', 'path_code']}
+
+def _instantaneous_key(path):
+
+    """
+    Returns the key of the instantaneous table of a primary analysis H5
+    file. Some older files store it under 'positions' instead.
+    """
+
+    with pd.HDFStore(path, mode='r') as store:
+        return 'positions' if ('/positions' in store.keys()) else 'instantaneous'
+
+
+def _compact_instantaneous(instantaneous):
+
+    """
+    Casts the instantaneous table to its compact types: int32 for the
+    indices and codes and float32 (with NaN instead of None) for the rest.
+    """
+
+    types = {column: (np.int32 if column in _INSTANTANEOUS_INTEGERS else np.float32)
+             for column in instantaneous.columns}
+
+    return instantaneous.astype(types)
+
+
+def _encode_tables(summary, metadata):
+
+    """
+    Makes sure the summary and metadata tables of a primary analysis use
+    codes: 'uuid_code' (the row of the bead in the summary) and
+    'path_code' (the row of the video in the metadata). Older tables
+    without them get them added.
+    """
+
+    summary = summary.reset_index(drop=True)
+    metadata = metadata.reset_index(drop=True)
+
+    if 'path_code' not in metadata.columns:
+        metadata['path_code'] = np.arange(metadata.shape[0], dtype=np.int32)
+    if 'uuid_code' not in summary.columns:
+        summary['uuid_code'] = np.arange(summary.shape[0], dtype=np.int32)
+    if 'path_code' not in summary.columns:
+        path_codes = pd.Series(metadata['path_code'].to_numpy(), index=metadata['path'].astype(str))
+        summary['path_code'] = path_codes.loc[summary['path'].astype(str)].to_numpy()
+
+    return summary, metadata
+
+
+def _encode_instantaneous(instantaneous, summary):
+
+    """
+    Makes sure an instantaneous table (or a chunk of one) uses codes.
+    Older tables that store the UUID and path on every row get the codes
+    of their bead from the (encoded) summary instead, so they can be
+    combined with newer ones.
+    """
+
+    # Look up the codes of each row from its UUID, then drop the strings
+    if 'uuid_code' not in instantaneous.columns:
+        rows = pd.Index(summary['uuid']).get_indexer(instantaneous['uuid'])
+        instantaneous = instantaneous.drop(columns=['uuid', 'path'])
+        instantaneous['uuid_code'] = summary['uuid_code'].to_numpy()[rows]
+        instantaneous['path_code'] = summary['path_code'].to_numpy()[rows]
+
+    return _compact_instantaneous(instantaneous)
+
+
+def _shift_codes(table, uuid_offset, path_offset):
+
+    """Shifts the codes of a table past those of previously combined ones."""
+
+    table = table.copy()
+    if 'uuid_code' in table.columns:
+        table['uuid_code'] += uuid_offset
+    table['path_code'] += path_offset
+
+    return table
+
+
+def _combine_primary(results):
+
+    """
+    Combines the tables of several primary analysis results into one set
+    of tables, renumbering the codes of each so they stay unique.
+
+    ARGUMENTS:
+        results (list): (summary, instantaneous, metadata) tuples, where
+            metadata is either a dict or a dataframe.
+
+    RETURNS:
+        summary (pandas.DataFrame): the combined summary table.
+        instantaneous (pandas.DataFrame): the combined instantaneous table.
+        metadata (pandas.DataFrame): the combined metadata table.
+    """
+
+    summaries, instantaneous_tables, metadata_tables = [], [], []
+    uuid_offset, path_offset = 0, 0
+    for summary, instantaneous, metadata in results:
+        if isinstance(metadata, dict):
+            metadata = pd.DataFrame([metadata])
+        summary, metadata = _encode_tables(summary, metadata)
+        instantaneous = _encode_instantaneous(instantaneous, summary)
+
+        summaries.append(_shift_codes(summary, uuid_offset, path_offset))
+        instantaneous_tables.append(_shift_codes(instantaneous, uuid_offset, path_offset))
+        metadata_tables.append(_shift_codes(metadata, uuid_offset, path_offset))
+        uuid_offset += summary.shape[0]
+        path_offset += metadata.shape[0]
+
+    return (pd.concat(summaries, ignore_index=True),
+            pd.concat(instantaneous_tables, ignore_index=True),
+            pd.concat(metadata_tables, ignore_index=True))
+
+
+def _write_primary(path, summary, instantaneous, metadata):
+
+    """
+    Writes the summary, instantaneous, and metadata tables of a primary
+    analysis to an H5 file. The instantaneous table, which has one row per
+    position, is compressed with LZ4, which is about as fast to read as no
+    compression at all.
+
+    The file is written under a temporary name and then renamed, so an
+    interrupted write never leaves a partial file behind.
+    """
+
+    temporary_path = f'{path}.tmp'
+    summary.to_hdf(temporary_path, key='summary', mode='w', format='table',
+                   data_columns=_DATA_COLUMNS['summary'])
+    instantaneous.to_hdf(temporary_path, key='instantaneous', mode='a', format='table',
+                         data_columns=_DATA_COLUMNS['instantaneous'], complib='blosc:lz4', complevel=5)
+    metadata.to_hdf(temporary_path, key='metadata', mode='a', format='table',
+                    data_columns=_DATA_COLUMNS['metadata'])
+    os.replace(temporary_path, path)
+
+
+def _read_tables(sources, uuid_offset=0, path_offset=0):
+
+    """
+    Reads and combines the summary and metadata tables of several primary
+    analysis H5 files, renumbering their codes to start at the given
+    offsets.
+
+    RETURNS:
+        summary (pandas.DataFrame): the combined summary table.
+        metadata (pandas.DataFrame): the combined metadata table.
+        summaries (list): the summary table of each file with its own codes,
+            needed to encode the instantaneous tables of older files.
+        offsets (list): the (uuid_offset, path_offset) of each file.
+    """
+
+    summaries, metadata_tables, offsets = [], [], []
+    for source in sources:
+        summary, metadata = _encode_tables(pd.read_hdf(source, key='summary'),
+                                           pd.read_hdf(source, key='metadata'))
+        summaries.append(summary)
+        metadata_tables.append(metadata)
+        offsets.append((uuid_offset, path_offset))
+        uuid_offset += summary.shape[0]
+        path_offset += metadata.shape[0]
+
+    combined_summary = pd.concat([_shift_codes(summary, *offset) for summary, offset
+                                  in zip(summaries, offsets)], ignore_index=True)
+    combined_metadata = pd.concat([_shift_codes(metadata, *offset) for metadata, offset
+                                   in zip(metadata_tables, offsets)], ignore_index=True)
+
+    return combined_summary, combined_metadata, summaries, offsets
+
+
+def _stream_primary(sources, path, chunksize=2**20):
+
+    """
+    Combines several primary analysis H5 files into one without holding
+    every instantaneous table in memory at once.
+
+    The summary and metadata tables (one row per bead or video) are small,
+    so they are combined in memory and written in one go. The
+    instantaneous tables are then read one chunk at a time, given their
+    new codes, and appended to the output.
+
+    ARGUMENTS:
+        sources (list): the paths of the H5 files to combine, in order.
+        path (string): the path of the combined H5 file to write.
+        chunksize (int): the number of instantaneous rows read at a time.
+
+    RETURNS:
+        summary (pandas.DataFrame): the combined summary table.
+        metadata (pandas.DataFrame): the combined metadata table.
+    """
+
+    # Combine the small tables, remembering the code offsets of each file
+    combined_summary, combined_metadata, summaries, offsets = _read_tables(sources)
+
+    temporary_path = f'{path}.tmp'
+    combined_summary.to_hdf(temporary_path, key='summary', mode='w', format='table',
+                            data_columns=_DATA_COLUMNS['summary'])
+    combined_metadata.to_hdf(temporary_path, key='metadata', mode='a', format='table',
+                             data_columns=_DATA_COLUMNS['metadata'])
+
+    # Stream the instantaneous rows of each file into the output
+    n_rows = 0
+    with pd.HDFStore(temporary_path, mode='a') as output:
+        for source, summary, offset in zip(sources, summaries, offsets):
+            key = _instantaneous_key(source)
+            with pd.HDFStore(source, mode='r') as store:
+                for chunk in store.select(key, chunksize=chunksize):
+                    chunk = _shift_codes(_encode_instantaneous(chunk, summary), *offset)
+                    chunk.index = pd.RangeIndex(n_rows, n_rows + chunk.shape[0])
+                    n_rows += chunk.shape[0]
+                    output.append('instantaneous', chunk, format='table', index=False,
+                                  data_columns=_DATA_COLUMNS['instantaneous'],
+                                  complib='blosc:lz4', complevel=5)
+
+        # Index the query columns once, after every row is written
+        if 'instantaneous' in output:
+            output.create_table_index('instantaneous', columns=_DATA_COLUMNS['instantaneous'])
+
+    os.replace(temporary_path, path)
+
+    return combined_summary, combined_metadata
+
+
+def _decode_instantaneous(instantaneous, summary):
+
+    """
+    Adds the 'uuid' column back to an instantaneous table stored with
+    codes, as a categorical so it takes almost no memory.
+    """
+
+    if ('uuid' in instantaneous.columns) or ('uuid_code' not in instantaneous.columns):
+        return instantaneous
+
+    # Order the UUIDs by their code so the codes index them directly
+    uuids = summary['uuid'].to_numpy()[np.argsort(summary['uuid_code'].to_numpy())]
+    instantaneous = instantaneous.assign(
+        uuid=pd.Categorical.from_codes(instantaneous['uuid_code'].to_numpy(), categories=uuids))
+
+    return instantaneous
+
+
+def _iterate_beads(path, summary, columns=None, chunksize=2**20):
+
+    """
+    Reads the instantaneous table of a primary analysis H5 file in chunks
+    that each hold only whole beads.
+
+    ARGUMENTS:
+        path (string): the path of the H5 file.
+        summary (pandas.DataFrame): the summary table of the file, encoded
+            with _encode_tables.
+        columns (list): the instantaneous columns to read. The uuid_code
+            column is always included. Defaults to every column.
+        chunksize (int): the number of rows read at a time.
+
+    YIELDS:
+        chunk (pandas.DataFrame): the requested columns of consecutive
+            whole beads.
+
+    NOTES:
+        1. The rows of each bead are stored together, so the rows of the
+        last bead of a chunk are held back and joined to the next chunk
+        whenever a bead continues past the end of the chunk.
+    """
+
+    key = _instantaneous_key(path)
+
+    # Older tables store the UUID and path instead of codes
+    with pd.HDFStore(path, mode='r') as store:
+        stored_columns = store.select(key, stop=0).columns
+        if columns is None:
+            read_columns = None
+        elif 'uuid_code' in stored_columns:
+            read_columns = ['uuid_code'] + [c for c in columns if c != 'uuid_code']
+        else:
+            read_columns = ['uuid', 'path'] + [c for c in columns if c != 'uuid_code']
+
+        carry = None
+        for chunk in store.select(key, columns=read_columns, chunksize=chunksize):
+            chunk = _encode_instantaneous(chunk, summary)
+            if carry is not None:
+                chunk = pd.concat([carry, chunk])
+            if chunk.shape[0] == 0:
+                continue
+
+            # Hold back the last bead, which may continue in the next chunk
+            codes = chunk['uuid_code'].to_numpy()
+            last_start = np.flatnonzero(codes != codes[-1])
+            last_start = last_start[-1] + 1 if last_start.size else 0
+            carry = chunk.iloc[last_start:]
+            if last_start > 0:
+                yield chunk.iloc[:last_start]
+
+        if (carry is not None) and (carry.shape[0] > 0):
+            yield carry
+
+
+def _check_primary_file(path):
+
+    """
+    Raises an error if an H5 file is unreadable or is missing any of the
+    primary analysis tables.
+    """
+
+    with pd.HDFStore(path, mode='r') as store:
+        keys = store.keys()
+
+    for key in ['/summary', '/metadata']:
+        if key not in keys:
+            raise KeyError(f"No '{key[1:]}' table in {path}")
+    if ('/instantaneous' not in keys) and ('/positions' not in keys):
+        raise KeyError(f"No 'instantaneous' table in {path}")
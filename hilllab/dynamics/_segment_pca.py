@@ -0,0 +1,136 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+import numpy as np
+from scipy.ndimage import convolve1d
+from scipy.signal import savgol_coeffs
+
+from ._segment_stats import _segment_index, _segment_mean
+
+def _segment_pca(x, y, counts):
+
+    """
+    Finds the primary axis of the positions of every contiguous segment
+    (particle) at once and projects each segment onto its axis.
+
+    ARGUMENTS:
+        x (numpy.ndarray): the x coordinates of every segment, one segment
+            after another.
+        y (numpy.ndarray): the matching y coordinates.
+        counts (numpy.ndarray): the number of positions in each segment.
+
+    RETURNS:
+        alignment_rad (numpy.ndarray): the angle of each primary axis from
+            0 to pi.
+        alignment_strength (numpy.ndarray): the fraction of the variance
+            explained by each primary axis.
+        projected (numpy.ndarray): every position projected onto the
+            primary axis of its segment, relative to the segment mean.
+
+    NOTES:
+        1. The covariance of two coordinates is a 2x2 matrix, so its
+        eigenvalues and leading eigenvector have a closed form and no
+        per-segment decomposition is needed.
+        2. Just like sklearn's PCA, the sign of each axis is chosen so the
+        projection with the largest magnitude is positive.
+    """
+
+    segment = _segment_index(counts)
+    n_segments = len(counts)
+
+    # Center each segment on its mean
+    dx = x - np.repeat(_segment_mean(x, counts), counts)
+    dy = y - np.repeat(_segment_mean(y, counts), counts)
+
+    # Elements of each 2x2 covariance matrix (the normalization cancels)
+    sxx = np.bincount(segment, weights=dx * dx, minlength=n_segments)
+    syy = np.bincount(segment, weights=dy * dy, minlength=n_segments)
+    sxy = np.bincount(segment, weights=dx * dy, minlength=n_segments)
+
+    # Angle of the leading eigenvector and the two eigenvalues
+    theta = 0.5 * np.arctan2(2 * sxy, sxx - syy)
+    half_trace = (sxx + syy) / 2
+    spread = np.hypot((sxx - syy) / 2, sxy)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        alignment_strength = (half_trace + spread) / (sxx + syy)
+
+    # Project every position onto the axis of its segment
+    axis_x, axis_y = np.cos(theta), np.sin(theta)
+    projected = dx * np.repeat(axis_x, counts) + dy * np.repeat(axis_y, counts)
+
+    # Flip axes so the largest projection of each segment is positive
+    if projected.size > 0:
+        order = np.lexsort((-np.abs(projected), segment))
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        nonempty = counts > 0
+        largest = np.zeros(n_segments)
+        largest[nonempty] = projected[order[starts[nonempty]]]
+        sign = np.where(largest < 0, -1.0, 1.0)
+        axis_x, axis_y = axis_x * sign, axis_y * sign
+        projected = projected * np.repeat(sign, counts)
+
+    alignment_rad = np.arctan2(axis_y, axis_x) % np.pi
+
+    return alignment_rad, alignment_strength, projected
+
+
+def _segment_savgol(values, counts, window_lengths, polyorder=3):
+
+    """
+    Applies a Savitzky-Golay filter to every contiguous segment of an
+    array, with a window length per segment. Gives the same result as
+    calling scipy.signal.savgol_filter with mode='interp' on each segment.
+
+    ARGUMENTS:
+        values (numpy.ndarray): the values of every segment, one segment
+            after another.
+        counts (numpy.ndarray): the number of values in each segment.
+        window_lengths (numpy.ndarray): the odd window length of each
+            segment.
+        polyorder (int): the order of the fitted polynomials.
+
+    RETURNS:
+        smoothed (numpy.ndarray): the filtered values. Segments shorter
+            than their window can't be filtered and are NaN.
+
+    NOTES:
+        1. Segments sharing a window length are filtered together: one
+        convolution of all of them back to back gives the interior of each
+        segment, and one polynomial fit of all their first and last
+        windows gives the edges.
+        2. Interior points are never affected by neighbouring segments,
+        since their whole window lies inside their own segment.
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    smoothed = np.full(values.size, np.nan)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+
+    for window_length in np.unique(window_lengths):
+        group = np.flatnonzero((window_lengths == window_length) & (counts >= window_length))
+        if group.size == 0:
+            continue
+        half = window_length // 2
+
+        # Rows of every segment in this group, back to back
+        group_counts = counts[group]
+        rows = np.repeat(starts[group], group_counts) + (np.arange(group_counts.sum())
+               - np.repeat(np.cumsum(group_counts) - group_counts, group_counts))
+        group_values = values[rows]
+
+        # Interior points from one convolution of the whole group
+        coeffs = savgol_coeffs(window_length, polyorder)
+        convolved = convolve1d(group_values, coeffs, mode='constant')
+        position = rows - np.repeat(starts[group], group_counts)
+        interior = (position >= half) & (position < np.repeat(group_counts, group_counts) - half)
+        smoothed[rows[interior]] = convolved[interior]
+
+        # Edge points from polynomials fit to the first and last windows
+        window = np.arange(window_length)
+        for first, points in [(starts[group], np.arange(half)),
+                              (starts[group] + group_counts - window_length,
+                               np.arange(window_length - half, window_length))]:
+            windows = values[first[None, :] + window[:, None]]
+            poly_coeffs = np.polyfit(window, windows, polyorder)
+            fitted = np.polyval(poly_coeffs, points.reshape(-1, 1))
+            smoothed[first[None, :] + points[:, None]] = fitted
+
+    return smoothed
@@ -0,0 +1,97 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+import numpy as np
+
+def _segment_index(counts):
+
+    """
+    Returns the segment number of every value, given the number of values
+    in each contiguous segment.
+    """
+
+    return np.repeat(np.arange(len(counts)), counts)
+
+
+def _same_segment(counts):
+
+    """
+    Returns a mask over each pair of consecutive values that is True when
+    both values belong to the same segment. Used to take differences
+    within segments only.
+    """
+
+    segment = _segment_index(counts)
+
+    return segment[1:] == segment[:-1]
+
+
+def _segment_sum(values, counts):
+
+    """Sum of each segment; zero for empty segments."""
+
+    return np.bincount(_segment_index(counts), weights=values, minlength=len(counts))
+
+
+def _segment_mean(values, counts):
+
+    """Mean of each segment; NaN for empty segments."""
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return _segment_sum(values, counts) / counts
+
+
+def _segment_stats(values, counts):
+
+    """
+    Calculates the mean, median, standard deviation, minimum, and maximum
+    of every contiguous segment of an array at once.
+
+    ARGUMENTS:
+        values (numpy.ndarray): the values of every segment, one segment
+            after another.
+        counts (numpy.ndarray): the number of values in each segment.
+
+    RETURNS:
+        stats (dict): arrays with one value per segment for 'mean',
+            'median', 'std', 'min', and 'max'.
+
+    NOTES:
+        1. Empty segments give NaN for every statistic, and any NaN within
+        a segment makes all of its statistics NaN, just like the NumPy
+        functions they replace.
+        2. The standard deviation is the population standard deviation
+        (ddof=0), matching np.std.
+        3. Medians are taken from a single sort of every value by segment
+        and then value.
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    counts = np.asarray(counts, dtype=np.int64)
+    n_segments = len(counts)
+    stats = {name: np.full(n_segments, np.nan) for name in ['mean', 'median', 'std', 'min', 'max']}
+
+    nonempty = counts > 0
+    if not np.any(nonempty):
+        return stats
+
+    # Only non-empty segments hold values, so reduce over those
+    kept_counts = counts[nonempty]
+    starts = np.concatenate([[0], np.cumsum(kept_counts)[:-1]])
+    segment = _segment_index(kept_counts)
+
+    mean = np.add.reduceat(values, starts) / kept_counts
+    deviations = values - np.repeat(mean, kept_counts)
+    std = np.sqrt(np.add.reduceat(deviations**2, starts) / kept_counts)
+
+    # Sort by segment and then value, and take the middle of each segment
+    ordered = values[np.lexsort((values, segment))]
+    median = (ordered[starts + (kept_counts - 1) // 2] + ordered[starts + kept_counts // 2]) / 2
+    has_nan = np.add.reduceat(np.isnan(values), starts) > 0
+    median[has_nan] = np.nan
+
+    stats['mean'][nonempty] = mean
+    stats['median'][nonempty] = median
+    stats['std'][nonempty] = std
+    stats['min'][nonempty] = np.minimum.reduceat(values, starts)
+    stats['max'][nonempty] = np.maximum.reduceat(values, starts)
+
+    return stats
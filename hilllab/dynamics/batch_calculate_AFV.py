@@ -1,63 +1,116 @@
 # Christopher Esther, Hill Lab, 1/9/2026
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import pandas as pd
 import numpy as np
 from pathlib import Path
 
 from ..utilities.print_progress_bar import print_progress_bar
-from .calculate_AFV import calculate_AFV
+from ._calculate_AFV_batch import _calculate_AFV_batch
+from ._primary_store import _encode_tables, _iterate_beads
 
-def batch_calculate_AFV(path):
+def batch_calculate_AFV(path, n_workers=None, chunksize=2**20):
 
     """
     Runs AFV calculations on every bead in a H5 file output from the
     primary analysis function. AFV data is saved as a separate H5 file
     in the same directory.
-    
+
     ARGUMENTS:
         path (str): the path to the H5 file with primary analysis data
+        n_workers (int): the number of processes used for the calculations.
+            Defaults to the number of CPUs; use 1 to calculate in this
+            process.
+        chunksize (int): the number of instantaneous rows read at a time.
+
+    RETURNS:
+        output_path (Path): the path to the H5 file of AFV values, with one
+            row per bead.
+
+    NOTES:
+        1. The instantaneous table is read once, in chunks of whole beads,
+        rather than queried once per bead, so the time taken grows linearly
+        with the number of beads.
+        2. Each chunk is sent to a worker process as soon as it is read. Only
+        a few chunks are in flight at once, which bounds memory use.
     """
 
     # Open the summary and metadata tables
-    summary = pd.read_hdf(path, key='summary')
-    metadata = pd.read_hdf(path, key='metadata')
+    summary, metadata = _encode_tables(pd.read_hdf(path, key='summary'),
+                                       pd.read_hdf(path, key='metadata'))
 
-    # Create list for storing AFV dfs and calculate total beads
+    # Look up the frame rate of every bead from the video it came from
+    fps_by_path = pd.Series(metadata['fps'].to_numpy(), index=metadata['path_code'].to_numpy())
+    bead_fps = np.zeros(summary['uuid_code'].max() + 1)
+    bead_fps[summary['uuid_code'].to_numpy()] = fps_by_path.loc[summary['path_code'].to_numpy()].to_numpy()
+
+    # Calculate AFV for each chunk of beads as it is read
+    total = summary.shape[0]
+    n_workers = n_workers or os.cpu_count()
+    chunks = _iterate_beads(path, summary, columns=['pca', 'speed'], chunksize=chunksize)
     afv_dfs = []
-    total = len(summary['uuid'])
 
-    # Iterate over each bead and run calculation
-    for i, particle_uuid in enumerate(summary['uuid']):
+    def record(chunk_afv):
+        afv_dfs.append(chunk_afv)
+        print_progress_bar(progress=sum(df.shape[0] for df in afv_dfs), total=total, title='Calculating AFV')
 
-        # Print a progress bar
-        print_progress_bar(progress=i+1, total=total, title='Calculating AFV')
-        
-        # Load the particle data
-        position_data = pd.read_hdf(path, key='positions', where=f"uuid == '{particle_uuid}'")
+    if n_workers == 1:
+        for chunk in chunks:
+            record(_calculate_AFV_chunk(*_chunk_arguments(chunk, bead_fps)))
 
-        if i > 100:
-            break
-            
-        # Calculate AFV
-        fps = metadata.loc[metadata['path'] == np.unique(position_data['path'])[0], 'fps'].iloc[0]
-        afv_values = calculate_AFV(position_data=position_data, fps=fps)
-        
-        # Save the AFV values as dataframe to the list
-        afv_values['uuid'] = particle_uuid
-        one_afv_df = pd.DataFrame([afv_values])
-        afv_dfs.append(one_afv_df)
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            pending = set()
+            for chunk in chunks:
+                pending.add(executor.submit(_calculate_AFV_chunk, *_chunk_arguments(chunk, bead_fps)))
 
-    # Drop all-NA columns in each DataFrame before concatenation
-    clean_dfs = [df.dropna(axis=1, how='all') for df in afv_dfs]
+                # Wait for a worker before reading further ahead
+                if len(pending) >= 2 * n_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record(future.result())
 
-    # Only concatenate if there's at least one DataFrame with columns left
-    clean_dfs = [df for df in clean_dfs if not df.empty]
+            for future in pending:
+                record(future.result())
 
-    all_afv = pd.concat(clean_dfs, ignore_index=True)
+    # Combine the values of every bead, in the order of the summary
+    all_afv = pd.concat(afv_dfs, ignore_index=True)
+    uuids = pd.Series(summary['uuid'].to_numpy(), index=summary['uuid_code'].to_numpy())
+    all_afv.insert(0, 'uuid', uuids.loc[all_afv['uuid_code']].to_numpy())
+    all_afv = all_afv.sort_values('uuid_code').reset_index(drop=True)
 
     # Write these values to a H5 file in the same folder
     output_path = Path(path).parent / f'{Path(path).stem}_.afv.h5'
-    all_afv = all_afv.map(lambda x: np.nan if x is None else x)
     all_afv.to_hdf(output_path, key='afv', mode='w', format='table',
-                                data_columns=['uuid'])
-    
+                                data_columns=['uuid', 'uuid_code'])
+
     return output_path
+
+
+def _chunk_arguments(chunk, bead_fps):
+
+    """
+    Splits a chunk of whole beads into the plain arrays sent to
+    _calculate_AFV_chunk: the code, first row, and frame rate of each bead,
+    and the PCA and speed of every row.
+    """
+
+    codes = chunk['uuid_code'].to_numpy()
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(codes)) + 1])
+    bead_codes = codes[starts]
+
+    return (bead_codes, np.append(starts, codes.size), bead_fps[bead_codes],
+            chunk['pca'].to_numpy(), chunk['speed'].to_numpy())
+
+
+def _calculate_AFV_chunk(bead_codes, bounds, fps, pca, speed):
+
+    """
+    Runs the batched AFV calculation on every bead of a chunk. Returns a
+    dataframe of AFV values with one row per bead, including its uuid_code.
+    """
+
+    afv = _calculate_AFV_batch(pca, speed, counts=np.diff(bounds), fps=fps)
+    afv.insert(0, 'uuid_code', bead_codes)
+
+    return afv
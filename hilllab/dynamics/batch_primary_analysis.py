@@ -1,13 +1,15 @@
 # Christopher Esther, Hill Lab, 12/8/2025
 import os
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
-import numpy as np
 
 from ..utilities.print_progress_bar import print_progress_bar
 from .primary_analysis import primary_analysis
+from ._primary_store import _combine_primary, _write_primary, _stream_primary
 
-def batch_primary_analysis(folder_path, fps, pixel_width, compile=True, skip_existing=True):
+def batch_primary_analysis(folder_path, fps, pixel_width, compile=True, skip_existing=True,
+                           n_workers=None):
 
     """
     Runs the primary_analysis function on a batch of folders containing
@@ -16,20 +18,35 @@ def batch_primary_analysis(folder_path, fps, pixel_width, compile=True, skip_exi
 
     ARGUMENTS:
         folder_path (string): the path to the folder containing VRPN files
-            or containing folders with VRPN files. 
+            or containing folders with VRPN files.
         fps (int): the frame rate of the video
         pixel_width (float): the width of a pixel in micrometers
-        
+        compile (bool): whether to also compile every subfolder into one
+            set of files in folder_path.
+        skip_existing (bool): whether to skip VRPNs whose partial results
+            are already up to date.
+        n_workers (int): the number of processes used to analyze VRPNs.
+            Defaults to the number of CPUs; use 1 to analyze them in this
+            process.
 
     RETURNS:
         Outputs a .xlsx file within each subfolder containing the
         compiled data from each VRPN. Certain data is also saved
-        to pickle files for faster loading. 
+        to H5 files for faster loading.
+
+    NOTES:
+        1. The results of each VRPN are written to their own partial file
+        ({name}.primary.h5 next to the VRPN) as soon as it is analyzed, so
+        an interrupted batch only loses the VRPNs still being analyzed.
+        Reruns skip every VRPN whose partial file is newer than it.
+        2. Subfolder and compiled files are then assembled from the partial
+        files one at a time, without holding every instantaneous table in
+        memory. A subfolder file is only rebuilt when one of its partial
+        files has changed.
     """
 
     # Get all the subfolders and their files
     folders = {}
-    file_count = 0
     for root, _, files in os.walk(folder_path):
         for file in files:
             if file.endswith('.vrpn.mat'):
@@ -37,112 +54,146 @@ def batch_primary_analysis(folder_path, fps, pixel_width, compile=True, skip_exi
                 if root not in folders:
                     folders[root] = []
                 folders[root].append(full_path)
-                file_count += 1
 
-    # Create list to store the outputs from all files if compiling
-    summary_all_dfs = []
-    instantaneous_all_dfs = []
-    metadata_all_dicts = []
+    # Find the VRPNs without an up-to-date partial file
+    vrpn_files = [path for files in folders.values() for path in files]
+    to_analyze = [path for path in vrpn_files
+                  if not (skip_existing and _partial_is_current(path))]
 
-    # Iterate over each subfolder
-    processing_count = 0
-    skipped_folder_count = 0
-    for sub_index, subfolder in enumerate(folders.keys()):
-        vrpn_files = folders[subfolder]  # get the paths within this subfolder
+    # Run primary analysis on each VRPN file, writing its partial file
+    exceptions = []
+    if to_analyze:
+        exceptions = _analyze_batch(to_analyze, fps=fps, pixel_width=pixel_width, n_workers=n_workers)
+    for exception in exceptions:
+        for path, error in exception.items():
+            print(f'\nPrimary analysis failed for {path}: {error!r}')
+
+    # Assemble the partial files of each subfolder
+    analyzed = set(to_analyze)
+    all_partial_paths = []
+    for subfolder, files in folders.items():
 
         # Generate the save names for this subfolder
         name = Path(subfolder).name
         subfolder_excel_file_path = os.path.join(subfolder, f'{name}.xlsx')
         subfolder_h5_file_path = os.path.join(subfolder, f'{name}.h5')
 
-        # Check if the processing files already exist, and skip if requested
-        if (os.path.exists(subfolder_h5_file_path)) and skip_existing:
-            skipped_folder_count += 1
-            processing_count += len(vrpn_files)
+        # Empty VRPNs have no partial file
+        partial_paths = [_partial_path(path) for path in files if os.path.exists(_partial_path(path))]
+        if not partial_paths:
             continue
-        
-        # Create some variables to store the results just within this subfolder
-        summary_subfolder_dfs = []
-        instantaneous_subfolder_dfs = []
-        metadata_subfolder_dicts = []
-        
-        # Run primary analysis on each VRPN file
-        for file_index, sub_file in enumerate(vrpn_files):
-
-            # Print a progress bar
-            processing_count += 1
-            print_progress_bar(progress=processing_count, total=file_count, title=f'Primary analysis ({processing_count} of {file_count})')
-
-            # Run analysis
-            one_summary_data, one_instantaneous_data, one_metadata = primary_analysis(path=sub_file, fps=fps, pixel_width=pixel_width)
-
-            # Save the results (if any)
-            if one_summary_data is not None:
-                summary_subfolder_dfs.append(one_summary_data)
-                instantaneous_subfolder_dfs.append(one_instantaneous_data)
-                metadata_subfolder_dicts.append(one_metadata)
-
-        # Compile the resuts into their dfs for this subfolder
-        summary_subfolder = pd.concat(summary_subfolder_dfs)
-        instantaneous_subfolder = pd.concat(instantaneous_subfolder_dfs)
-        metadata_sub = pd.DataFrame(metadata_subfolder_dicts)
-        
-        # Only save the subfolder results if compiling all the data afterwards
-        if compile:
-            summary_all_dfs.append(summary_subfolder)
-            instantaneous_all_dfs.append(instantaneous_subfolder)
-            metadata_all_dicts.extend(metadata_subfolder_dicts)
-
-        # Save the results to Excel files for this subfolder
+        all_partial_paths.extend(partial_paths)
+
+        # Skip subfolders whose files are newer than all of their partials,
+        # unless one of their VRPNs was analyzed again (a VRPN that is now
+        # empty removes its partial without changing the others)
+        if skip_existing and os.path.exists(subfolder_h5_file_path) and not analyzed.intersection(files):
+            newest_partial = max(os.path.getmtime(path) for path in partial_paths)
+            if os.path.getmtime(subfolder_h5_file_path) >= newest_partial:
+                continue
+
+        # Save the results to H5 and Excel files for this subfolder
+        summary_subfolder, metadata_sub = _stream_primary(partial_paths, subfolder_h5_file_path)
         with pd.ExcelWriter(subfolder_excel_file_path, engine='openpyxl') as writer:
             summary_subfolder.to_excel(writer, sheet_name='Summary Data', index=False)
             metadata_sub.to_excel(writer, sheet_name='Metadata', index=False)
 
-        # And save the results to H5 files for this subfolder
-        # Save to H5 as well
-        summary_subfolder.to_hdf(subfolder_h5_file_path, key='summary', mode='w', format='table',
-                            data_columns=['uuid', 'path', 'particle_id'])
-
-        # Replace None with NaN for instantaneous data
-        instantaneous_subfolder = instantaneous_subfolder.map(lambda x: np.nan if x is None else x)
-        instantaneous_subfolder.to_hdf(subfolder_h5_file_path, key='instantaneous', mode='a', format='table',
-                                    data_columns=['uuid', 'path', 'particle_id'])
-
-        metadata_sub.to_hdf(subfolder_h5_file_path, key='metadata', mode='a', format='table',
-                                data_columns=['path'])
-
-    # Compile these Excel files into one, if requested
+    # Compile these files into one, if requested
     if compile:
 
         print('\nSaving data. This may take a minute...')
-        compiled_summary = pd.concat(summary_all_dfs)  # compile the data
-        compiled_instantaneous = pd.concat(instantaneous_all_dfs)
-        compiled_metadata = pd.DataFrame(metadata_all_dicts)
 
         # Generate the save name and paths
         compiled_name = Path(folder_path).name
         compiled_excel_path = os.path.join(folder_path, f'{compiled_name}.xlsx')
         compiled_h5_path = os.path.join(folder_path, f'{compiled_name}.h5')
-        
+
+        # Compile the partial files of every subfolder
+        compiled_summary, compiled_metadata = _stream_primary(all_partial_paths, compiled_h5_path)
+
         # Save the compiled data to Excel file
         with pd.ExcelWriter(compiled_excel_path, engine='openpyxl') as writer:
             compiled_summary.to_excel(writer, sheet_name='summary', index=False)
             compiled_metadata.to_excel(writer, sheet_name='metadata', index=False)
 
-        # Save to H5 as well
-        compiled_summary.to_hdf(compiled_h5_path, key='summary', mode='w', format='table',
-                            data_columns=['uuid', 'path', 'particle_id'])
-
-        # Replace None with NaN for instantaneous data
-        compiled_instantaneous = compiled_instantaneous.map(lambda x: np.nan if x is None else x)
-        compiled_instantaneous.to_hdf(compiled_h5_path, key='instantaneous', mode='a', format='table',
-                                    data_columns=['uuid', 'path', 'particle_id'])
-
-        compiled_metadata.to_hdf(compiled_h5_path, key='metadata', mode='a', format='table',
-                                data_columns=['path'])
         print('Data save completed!')
 
         return compiled_excel_path, compiled_h5_path
-    
+
     else:
         return None, None
+
+
+def _partial_path(vrpn_path):
+
+    """Returns the path of the partial primary analysis file of a VRPN."""
+
+    vrpn_path = Path(vrpn_path)
+    stem = vrpn_path.name[:-len('.vrpn.mat')]
+
+    return str(vrpn_path.parent / f'{stem}.primary.h5')
+
+
+def _partial_is_current(vrpn_path):
+
+    """Checks whether a VRPN's partial file exists and is newer than it."""
+
+    partial_path = _partial_path(vrpn_path)
+
+    return os.path.exists(partial_path) and (os.path.getmtime(partial_path) >= os.path.getmtime(vrpn_path))
+
+
+def _primary_analysis_file(vrpn_path, fps, pixel_width):
+
+    """
+    Runs the primary analysis of one VRPN and writes its partial file.
+    Returns the path of the partial file, or None for an empty VRPN.
+    """
+
+    result = primary_analysis(path=vrpn_path, fps=fps, pixel_width=pixel_width)
+    partial_path = _partial_path(vrpn_path)
+
+    # An empty VRPN has no partial file, so remove one left from before
+    if result[0] is None:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        return None
+
+    _write_primary(partial_path, *_combine_primary([result]))
+
+    return partial_path
+
+
+def _analyze_batch(files, fps, pixel_width, n_workers=None):
+
+    """
+    Runs _primary_analysis_file on every VRPN, in a process pool unless
+    n_workers is 1. Returns a list of {path: exception} for every VRPN that
+    failed, so one bad file doesn't stop the rest of the batch.
+    """
+
+    n_files = len(files)
+    exceptions = []
+    title = 'Primary analysis'
+
+    # Analyze in this process when requested, which is easier to debug
+    if n_workers == 1:
+        for i, path in enumerate(files):
+            try:
+                _primary_analysis_file(path, fps, pixel_width)
+            except Exception as e:
+                exceptions.append({path: e})
+            print_progress_bar(progress=i+1, total=n_files, title=f'{title} ({i+1} of {n_files})')
+
+        return exceptions
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = {executor.submit(_primary_analysis_file, path, fps, pixel_width): path for path in files}
+        for i, future in enumerate(as_completed(futures)):
+            try:
+                future.result()
+            except Exception as e:
+                exceptions.append({futures[future]: e})
+            print_progress_bar(progress=i+1, total=n_files, title=f'{title} ({i+1} of {n_files})')
+
+    return exceptions
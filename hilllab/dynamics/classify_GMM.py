@@ -1,54 +1,58 @@
 # Christopher Esther, Hill Lab, 1/16/2026
-from sklearn.preprocessing import StandardScaler
-from sklearn.mixture import GaussianMixture
+import os
 import pandas as pd
 
-def classify_GMM(h5_path, identifier=None):
+from ._gmm_model import GMM_FEATURES, _fit_GMM, _predict_GMM, _save_model, _load_model
+
+def classify_GMM(h5_path, identifier=None, sample_size=100000, model_path=None, chunksize=2**18):
 
     """
     Classifies beads into three clusters (stuck, oscillating, and
-    transiting as 0, 1, and 2, respectively) when provided the summary
-    data from the primary_analysis function.
+    transiting) using the summary data from the primary_analysis function.
 
     ARGUMENTS:
-        summary_data (pandas.DataFrame): the summary data as calcualted
-            by the primary_analysis function.
-    """
-
-    # Load the summary data
-    summary = pd.read_hdf(h5_path, key='summary')
-
-    # Select the features
-    n_clusters = 3
-    features = ['displacement', 'straightness', 'circular_variance', 'bb_area', 'mean_speed', 'mean_acceleration']
-    X = summary[features].dropna().to_numpy()  # shape (n_particles, n_features)
-
-    # Scale features
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+        h5_path (string): the path to a H5 file of primary analysis data.
+        identifier (string): if provided, a summary column used to count
+            the beads of each cluster in a pivot table.
+        sample_size (int): the largest number of beads the GMM is fit on.
+            Larger summaries are fit on a subsample stratified by VRPN.
+            Use None to fit on every bead.
+        model_path (string): if provided, the fitted scaler and GMM are
+            saved to this file, or loaded from it if it already exists,
+            so later calls label beads without fitting again.
+        chunksize (int): the number of beads read and labelled at a time.
 
-    # Fit GMM
-    gmm = GaussianMixture(n_components=n_clusters, covariance_type='full', random_state=42)
-    gmm.fit(X_scaled)  # or X if not scaling
+    RETURNS:
+        summary (pandas.DataFrame): the summary data with the cluster of
+            every bead and the weight of each cluster.
+        cluster_pivot (pandas.DataFrame): the number of beads of each
+            cluster per identifier value, or None without an identifier.
 
-    # Generate cluster labels
-    cluster_labels = gmm.predict(X_scaled)  # array of cluster indices for each particle
-    cluster_probs = gmm.predict_proba(X_scaled)
-
-    # Convert these numerical labels to sensible strings
-    cluster_strings = {
-        0: 'stuck',
-        1: 'oscillating',
-        2: 'transiting'
-    }
-    cluster_label_strings = [cluster_strings[label] for label in cluster_labels]
+    NOTES:
+        1. Clusters are named from the mean features of the GMM components
+        (the slowest is stuck, the faster one with the largest displacement
+        is transiting), since the order of the components is arbitrary.
+        2. Only the feature columns are read to fit the GMM. The summary is
+        then read and labelled in chunks.
+        3. Beads missing a feature have no cluster.
+    """
 
-    # Save cluster labels to data
-    summary['cluster'] = cluster_label_strings
+    # Load the fitted model, or fit it on the feature columns only
+    if (model_path is not None) and os.path.exists(model_path):
+        model = _load_model(model_path)
+    else:
+        with pd.HDFStore(h5_path, mode='r') as store:
+            stored_columns = store.select('summary', stop=0).columns
+            stratum = 'path_code' if 'path_code' in stored_columns else 'path'
+            features = store.select('summary', columns=GMM_FEATURES + [stratum])
+        model = _fit_GMM(features, sample_size=sample_size)
+        if model_path is not None:
+            _save_model(model, model_path)
 
-    # Save cluster weights as well
-    for cluster_number in list(cluster_strings.keys()):
-        summary[f'{cluster_strings[cluster_number]}_cluster_weight'] = cluster_probs[:, cluster_number]
+    # Label every bead with its cluster and cluster weights, a chunk at a time
+    with pd.HDFStore(h5_path, mode='r') as store:
+        summary = pd.concat([chunk.join(_predict_GMM(model, chunk, chunksize=chunksize))
+                             for chunk in store.select('summary', chunksize=chunksize)])
 
     # If provided with an identifier column, we can create a pivot table with this value
     if identifier is not None:
@@ -61,6 +65,6 @@ def classify_GMM(h5_path, identifier=None):
         )
 
         return summary, cluster_pivot
-    
+
     else:
         return summary, None
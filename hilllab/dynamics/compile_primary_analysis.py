@@ -3,10 +3,10 @@ from pathlib import Path
 import os
 import datetime
 import pandas as pd
-import numpy as np
 
 from ..utilities.walk_dir import walk_dir
 from ..utilities.print_progress_bar import print_progress_bar
+from ._primary_store import _combine_primary, _stream_primary, _instantaneous_key, _check_primary_file
 
 def compile_primary_analysis(folder_path, save_file=True):
 
@@ -20,6 +20,26 @@ def compile_primary_analysis(folder_path, save_file=True):
             H5 files, or containing subfolders with H5 files.
         save_file (bool): controls whether the compiled dataset is saved
             to an H5 file or just returned. 
+
+    RETURNS:
+        If save_file is True:
+        compiled_path (Path): the path to the compiled H5 file.
+        exceptions (list): a list of {path: exception} for every file that
+            could not be compiled.
+
+        Otherwise:
+        summary (pandas.DataFrame): the compiled summary table.
+        instantaneous (pandas.DataFrame): the compiled instantaneous table.
+        metadata (pandas.DataFrame): the compiled metadata table.
+
+    NOTES:
+        1. When saving, the instantaneous tables are copied into the
+        compiled file chunk by chunk, so memory use doesn't grow with the
+        size of the data. Every chunk is cast to the compact instantaneous
+        types (int32 codes and float32 values) on the way, and older files
+        storing UUIDs and paths on every row are converted to codes.
+        2. Files missing any of the summary, instantaneous, and metadata
+        tables are skipped and reported.
     """
 
     # First, create the path to the compiled file and check if it exists
@@ -43,50 +63,39 @@ def compile_primary_analysis(folder_path, save_file=True):
     # Walk the directory for h5 files
     h5_files = walk_dir(folder_path, extension='h5')
 
-    # Create some arrays to save our loaded dataframes
-    summary_dfs = []
-    positions_dfs = []
-    metadata_dfs = []
-    exceptions = []  # and a list of any errors we encounter
-
-    # Iterate over each file and load the data
+    # Check that each file holds every primary analysis table, recording
+    # the error of any that don't so one bad file doesn't stop the rest
+    valid_files = []
+    exceptions = []
     for i, file in enumerate(h5_files):
 
-        print_progress_bar(total=len(h5_files), progress=i + 1, title='Reading data')
+        print_progress_bar(total=len(h5_files), progress=i + 1, title='Checking files')
 
-        # Open each table and read the data into the lists
         try:
-            summary_dfs.append(pd.read_hdf(file, key='summary'))
-            positions_dfs.append(pd.read_hdf(file, key='instantaneous'))
-            metadata_dfs.append(pd.read_hdf(file, key='metadata'))
-        except Exception:
-            exceptions.append({file: Exception})
+            _check_primary_file(file)
+            valid_files.append(file)
+        except Exception as e:
+            exceptions.append({file: e})
 
-    # Concat the data into each respective dataframe and reset index 
-    compiled_summary = pd.concat(summary_dfs).reset_index(drop=True)
-    compiled_instantaneous = pd.concat(positions_dfs).reset_index(drop=True)
-    compiled_metadata = pd.concat(metadata_dfs).reset_index(drop=True)
+    for exception in exceptions:
+        for file, error in exception.items():
+            print(f'\nSkipped {file}: {error!r}')
 
     # Save the file, if requested
     if save_file:
-        # Save the compiled H5 file to the initial directory
+        # Stream each file's tables into the compiled H5 file one chunk at a
+        # time, renumbering the bead and video codes of each file
         print('\nSaving data. This may take a minute...')
-        compiled_summary.to_hdf(compiled_path, key='summary', mode='w', format='table',
-                            data_columns=['uuid', 'path', 'particle_id'])
-
-        # Save the instantaneous data, and replace None with NaN first
-        compiled_instantaneous = compiled_instantaneous.map(lambda x: np.nan if x is None else x)
-        compiled_instantaneous.to_hdf(compiled_path, key='instantaneous', mode='a', format='table',
-                                    data_columns=['uuid', 'path', 'particle_id'])
-
-        # Save the metadata
-        compiled_metadata.to_hdf(compiled_path, key='metadata', mode='a', format='table',
-                                data_columns=['path'])
+        _stream_primary(valid_files, str(compiled_path))
 
         # Some final prints
         print(f'Saved compiled data as {compiled_path}')
 
-    # Otherwise just return the compiled dataframes
+        return compiled_path, exceptions
+
+    # Otherwise just return the compiled dataframes, which are held in memory
     else:
-        return compiled_summary, compiled_instantaneous, compiled_metadata
-    
\ No newline at end of file
+        results = [(pd.read_hdf(file, key='summary'), pd.read_hdf(file, key=_instantaneous_key(file)),
+                    pd.read_hdf(file, key='metadata')) for file in valid_files]
+
+        return _combine_primary(results)
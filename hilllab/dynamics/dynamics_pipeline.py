@@ -1,23 +1,194 @@
 # Christopher Esther, Hill Lab, 1/16/2026
+import os
+import json
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+import pandas as pd
 
-def dynamics_pipeline():
+from ..utilities.print_progress_bar import print_progress_bar
+from .DynamicsDataset import DynamicsDataset
+from .batch_primary_analysis import _analyze_batch, _partial_path
+from .batch_calculate_AFV import _chunk_arguments, _calculate_AFV_chunk
+from ._gmm_model import _fit_GMM, _predict_GMM, _save_model, _load_model
+
+def dynamics_pipeline(folder_path, fps, pixel_width, dataset_path=None, classify=True, n_workers=None):
 
     """
-    Runs a series of bead dynamics calculations on all VRPN files within 
+    Runs a series of bead dynamics calculations on all VRPN files within
     a folder and its subfolders. Skips files for which processing has
     already completed to allow for iterative expansion of datasets.
 
     ARGUMENTS:
-        folder_path (str): path (string): the path to the VRPN file
+        folder_path (str): the path to the folder containing VRPN files
+            or containing folders with VRPN files.
         fps (int): the frame rate of the video
-        pixel_width (float): if provided, distance-related 
+        pixel_width (float): if provided, distance-related
             values will be converted with this factor allowing the conversion
             of pixels into any arbitrary unit.
-         
+        dataset_path (str): the DynamicsDataset folder the results are
+            merged into. Defaults to {name}.dynamics inside folder_path.
+        classify (bool): whether to label new beads with the GMM clusters.
+        n_workers (int): the number of processes used for the primary
+            analysis and AFV calculations. Defaults to the number of CPUs;
+            use 1 to run everything in this process.
+
+    RETURNS:
+        dataset (DynamicsDataset): the updated dataset, whose summary holds
+            the primary analysis, AFV, and cluster values of every bead.
+
+    NOTES:
+        1. A manifest (manifest.json in the dataset folder) records the
+        modification time, size, fps, and pixel_width of every processed
+        VRPN. Only VRPNs that are new, or whose record no longer matches,
+        are processed; a changed VRPN has its old beads replaced.
+        2. New beads are merged into the dataset as new partitions, so the
+        beads of earlier runs are never recomputed or rewritten.
+        3. The GMM is fit on the first run that has beads and saved to the
+        dataset folder (gmm.pkl). Later runs label their new beads with the
+        saved model, so earlier labels stay valid. Delete gmm.pkl to refit.
+        4. VRPNs that fail are reported and left out of the manifest, so
+        they are retried on the next run.
     """
 
-    try:
-        from IPython.display import clear_output
-        in_jupyter = True
-    except ModuleNotFoundError:
-        in_jupyter = False
\ No newline at end of file
+    # Open the dataset, creating it on the first run
+    if dataset_path is None:
+        dataset_path = os.path.join(folder_path, f'{Path(folder_path).name}.dynamics')
+    dataset_path = Path(dataset_path)
+    if (dataset_path / 'tables.h5').exists():
+        dataset = DynamicsDataset(dataset_path)
+    else:
+        dataset = DynamicsDataset.build([], dataset_path)
+    manifest = _read_manifest(dataset_path)
+
+    # Find the VRPNs that are new or have changed since they were processed
+    vrpn_files = sorted(os.path.join(root, file) for root, _, files in os.walk(folder_path)
+                        for file in files if file.endswith('.vrpn.mat'))
+    records = {path: _manifest_record(path, fps, pixel_width) for path in vrpn_files}
+    to_process = [path for path in vrpn_files if manifest.get(path) != records[path]]
+    if not to_process:
+        print('Every VRPN is already processed.')
+        return dataset
+    print(f'Processing {len(to_process)} of {len(vrpn_files)} VRPNs...')
+
+    # Drop any beads of these VRPNs already in the dataset: the old beads of
+    # changed VRPNs, and beads merged by a run that stopped before saving
+    # its manifest
+    dataset.remove(to_process)
+    for path in to_process:
+        manifest.pop(path, None)
+
+    # Run primary analysis on each VRPN, writing its partial file
+    exceptions = _analyze_batch(to_process, fps=fps, pixel_width=pixel_width, n_workers=n_workers)
+    failed = set()
+    for exception in exceptions:
+        for path, error in exception.items():
+            print(f'\nPrimary analysis failed for {path}: {error!r}')
+            failed.add(path)
+    processed = [path for path in to_process if path not in failed]
+
+    # Merge the new beads into the dataset (empty VRPNs have no partial)
+    first_uuid_code, first_path_code = dataset.next_codes()
+    dataset.add([_partial_path(path) for path in processed if os.path.exists(_partial_path(path))])
+    new_beads = dataset.summary['uuid_code'].to_numpy() >= first_uuid_code
+    new_path_codes = dataset.metadata['path_code'].to_numpy()
+    new_path_codes = new_path_codes[new_path_codes >= first_path_code]
+
+    # Calculate AFV for the new beads only
+    if new_path_codes.size:
+        dataset.update_summary(_dataset_AFV(dataset, new_path_codes, n_workers=n_workers))
+
+    # Label the new beads with the saved GMM, fitting it if there is none
+    if classify and new_beads.any():
+        model_path = dataset_path / 'gmm.pkl'
+        if model_path.exists():
+            model = _load_model(model_path)
+        else:
+            model = _fit_GMM(dataset.summary)
+            _save_model(model, model_path)
+        new_summary = dataset.summary[new_beads]
+        clusters = _predict_GMM(model, new_summary)
+        clusters.insert(0, 'uuid_code', new_summary['uuid_code'].to_numpy())
+        dataset.update_summary(clusters)
+
+    # Record the processed VRPNs only once their results are saved
+    for path in processed:
+        manifest[path] = records[path]
+    _write_manifest(dataset_path, manifest)
+
+    return dataset
+
+
+def _manifest_record(vrpn_path, fps, pixel_width):
+
+    """Returns the manifest record of a VRPN processed with these parameters."""
+
+    stat = os.stat(vrpn_path)
+
+    return {'mtime': stat.st_mtime, 'size': stat.st_size, 'fps': fps, 'pixel_width': pixel_width}
+
+
+def _read_manifest(dataset_path):
+
+    """Reads the manifest of a dataset, which is empty if there is none."""
+
+    manifest_path = Path(dataset_path) / 'manifest.json'
+    if not manifest_path.exists():
+        return {}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_manifest(dataset_path, manifest):
+
+    """Writes the manifest of a dataset, replacing it only once it is written."""
+
+    manifest_path = Path(dataset_path) / 'manifest.json'
+    temporary_path = f'{manifest_path}.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(temporary_path, manifest_path)
+
+
+def _dataset_AFV(dataset, path_codes, n_workers=None):
+
+    """
+    Calculates AFV for every bead of some partitions of a dataset, one
+    partition per task. Returns a dataframe of AFV values with one row per
+    bead, including its uuid_code.
+    """
+
+    # Look up the frame rate of every bead from the video it came from
+    fps_by_path = pd.Series(dataset.metadata['fps'].to_numpy(), index=dataset.metadata['path_code'].to_numpy())
+    bead_fps = np.zeros(int(dataset.summary['uuid_code'].max()) + 1)
+    bead_fps[dataset.summary['uuid_code'].to_numpy()] = fps_by_path.loc[dataset.summary['path_code'].to_numpy()].to_numpy()
+
+    def arguments(path_code):
+        return _chunk_arguments(dataset.get_partition(path_code, columns=['uuid_code', 'pca', 'speed']), bead_fps)
+
+    afv_dfs = []
+    def record(partition_afv):
+        afv_dfs.append(partition_afv)
+        print_progress_bar(progress=len(afv_dfs), total=len(path_codes), title='Calculating AFV')
+
+    if n_workers == 1:
+        for path_code in path_codes:
+            record(_calculate_AFV_chunk(*arguments(path_code)))
+
+    else:
+        n_workers = n_workers or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            pending = set()
+            for path_code in path_codes:
+                pending.add(executor.submit(_calculate_AFV_chunk, *arguments(path_code)))
+
+                # Wait for a worker before reading further partitions
+                if len(pending) >= 2 * n_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record(future.result())
+
+            for future in pending:
+                record(future.result())
+
+    return pd.concat(afv_dfs, ignore_index=True)
@@ -1,42 +1,110 @@
 # Christopher Esther, 5/1/2026
+import os
 import pandas as pd
 from pathlib import Path
 import numpy as np
 
 from ..utilities.print_dict_table import print_dict_table
+from ._primary_store import _instantaneous_key
 
-def inspect_h5(h5_path, show_parents=True):
+def inspect_h5(h5_path, show_parents=True, show_columns=True):
 
     """
-    Displays various information about the dataset contained with in 
-    an h5 file produced in the dynamics pipeline. 
+    Displays various information about the dataset contained with in
+    an h5 file produced in the dynamics pipeline.
 
     ARGUMENTS:
         h5_path (string): the file path to the h5 file to inspect
-        show_parents (bool): controls whether the parent folders of 
-            every VRPN included in the h5 file should be printed. 
+        show_parents (bool): controls whether the parent folders of
+            every VRPN included in the h5 file should be printed.
+        show_columns (bool): controls whether the type and size of every
+            column of the instantaneous table should be printed.
+
+    RETURNS:
+        file_info (dict): the values of the printed details table.
+
+    NOTES:
+        1. No table is loaded. Row counts and sizes come from the stored
+        table attributes, and the VRPN paths from the small metadata table
+        (or only the path column of the summary in files without one).
+        2. Column sizes are uncompressed. Columns are stored together in
+        compressed blocks, so the on-disk size is only known for the table
+        as a whole.
     """
 
-    # Load the summary table
-    summary = pd.read_hdf(h5_path, key='summary')
+    with pd.HDFStore(h5_path, mode='r') as store:
+        keys = store.keys()
+        summary = store.get_storer('summary')
+        instantaneous = store.get_storer(_instantaneous_key(h5_path))
+
+        # Paths of every VRPN, without reading the rest of the summary
+        if '/metadata' in keys:
+            paths = store.select('metadata', columns=['path'])['path'].to_numpy()
+        else:
+            paths = np.unique(store.select_column('summary', 'path'))
+
+        # Type and uncompressed size of every instantaneous column
+        columns = _column_sizes(instantaneous)
+        table = instantaneous.table
+
+        # Compile information about this H5 file
+        file_info = {}
 
-    # Compile information about this H5 file
-    file_info = {}
+        file_info['Name'] = Path(h5_path).stem
+        file_info['File Size'] = _format_bytes(os.path.getsize(h5_path))
+        file_info['# Beads'] = summary.nrows
+        file_info['# VRPNs Compiled'] = len(np.unique(paths))
 
-    file_info['Name'] = Path(h5_path).stem
-    file_info['# Beads'] = summary.shape[0]
-    file_info['# VRPNs Compiled'] = len(np.unique(summary['path']))
+        # Get list of parent folders
+        parents = np.unique([str(Path(p).parent) for p in paths])
+        file_info['# Parent Folders'] = len(parents)
 
-    # Get list of parent folders
-    parents = np.unique([Path(p).parent for p in np.unique(summary['path'])])
-    file_info['# Parent Folders'] = len(parents)
+        file_info['# Instantaneous Rows'] = instantaneous.nrows
+        file_info['Instantaneous Size'] = _format_bytes(table.size_on_disk)
+        file_info['Compression Ratio'] = f'{table.size_in_memory / max(table.size_on_disk, 1):.1f}'
+        file_info['Bead Columns'] = 'codes' if 'uuid_code' in columns else 'uuid, path'
 
     # Print the details table
     print_dict_table(file_info, title='H5 File Inspection')
 
+    # Print the instantaneous columns, if requested
+    if show_columns:
+        print_dict_table({column: f'{dtype}  {_format_bytes(size)}' for column, (dtype, size) in columns.items()},
+                         title='Instantaneous Columns')
+
     # Print all parent folders, if requested
     if show_parents:
         print('------ PARENT FOLDERS ------')
         for parent in parents:
             print(parent)
-    return
+
+    return file_info
+
+
+def _column_sizes(storer):
+
+    """
+    Returns the dtype and uncompressed size of every column of a table
+    stored by pandas, from its attributes alone.
+    """
+
+    sizes = {}
+    for axis in storer.index_axes + storer.values_axes:
+        names = axis.values if isinstance(axis.values, list) else [axis.name]
+        dtype = np.dtype(storer.table.coldtypes[axis.cname].base)
+        for name in names:
+            sizes[str(name)] = (str(dtype), dtype.itemsize * storer.nrows)
+
+    return sizes
+
+
+def _format_bytes(n_bytes):
+
+    """Formats a number of bytes with a readable unit."""
+
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if n_bytes < 1024:
+            break
+        n_bytes /= 1024
+
+    return f'{n_bytes:.1f} {unit}'
@@ -2,10 +2,11 @@
 import pandas as pd
 import numpy as np
 import uuid
-from sklearn.decomposition import PCA
-from scipy.signal import savgol_filter
 
 from ..utilities.load_vrpn import load_vrpn
+from ._segment_stats import _segment_stats, _segment_sum, _segment_mean, _same_segment
+from ._segment_pca import _segment_pca, _segment_savgol
+from ._primary_store import _compact_instantaneous
 
 def primary_analysis(path, fps, pixel_width):
 
@@ -85,6 +86,11 @@ def primary_analysis(path, fps, pixel_width):
     - alignment_deg: the angle of the primary direction of motion in degrees
     - alignment_rad: the angle of the primary direction of motion in radians
     - alignment_strength: the strength of the alignment from 0.5 to 1.0
+
+    - path: the path to the VRPN from which this bead originated
+    - uuid: a unique identifier assigned to this bead
+    - uuid_code: an integer code for this bead, unique within the file
+    - path_code: an integer code for the VRPN, unique within the file
         
     Additionally, the function calculates and returns certain instantaneous
     values for each particle, including:
@@ -101,9 +107,9 @@ def primary_analysis(path, fps, pixel_width):
     - distance: the distance traveled during this frame
     - total_distance: the cumulative distance traveled by this frame
     - pca: the position data projected onto the primary axis from the PCA
-    - path: the path to the VRPN from which this bead originated
     - particle_id: the particle ID in the VRPN
-    - uuid: a unique identifier assigned to this bead
+    - uuid_code: the row of this bead in the summary, which holds its uuid
+    - path_code: the row of this video in the metadata, which holds its path
 
     Metadata calculated for the entire video:
     - path: the path to the VRPN
@@ -119,10 +125,24 @@ def primary_analysis(path, fps, pixel_width):
     RETURNS:
         summary (pandas.DataFrame): a dataframe containing the
             summary data for each particle
-        instantaneous (dict): a dict of dataframes for the instantaneous
-            data for each particle by particle ID
+        instantaneous (pandas.DataFrame): a dataframe containing the
+            instantaneous data for every position of every particle
         metadata (dict): a few "metadata" like parameters for the entire
             video. 
+
+    NOTES:
+        1. The rows are sorted by particle once, and every parameter is then
+        calculated for all particles at once over their contiguous blocks of
+        rows. Differences are never taken across two particles.
+        2. Particles with too few positions for a parameter (such as the
+        angle, which needs three) get NaN for it instead of an error.
+        3. The instantaneous table is stored compactly: float32 values with
+        NaN where a value doesn't exist, and integer codes instead of the
+        uuid and path strings (see the uuid_code and path_code columns
+        of the summary).
+        4. The PCA of each particle is the closed-form eigendecomposition of
+        its 2x2 covariance matrix, and the Savitzky-Golay detrend is applied
+        to all particles sharing a window length at once.
     """
 
     # Load the data and isolate the components
@@ -145,222 +165,240 @@ def primary_analysis(path, fps, pixel_width):
     metadata['fps'] = fps
     metadata['n_particles'] = len(all_particles)
 
-    # Iterate over each bead and perform calculations
-    all_particle_data_dfs = []
-    all_instant_data_dfs = []
-    for particle_id in all_particles:
-
-        # Generate a UUID to help identify this particle
-        uid = str(uuid.uuid4())
-
-        particle_data = {}
-        particle_data['particle_id'] = particle_id
-
-        # Get position data for this bead
-        one_particle_VRPN = clean_data[clean_data['particle_id'] == particle_id]
-
-        # Start with some of the easy "metadata" calculations
-        frame_numbers = one_particle_VRPN['frame']  # the frame number at which this particle exists
-        birth_frame = int(min(frame_numbers))
-        death_frame = int(max(frame_numbers))
-        particle_data['birth_frame'] = birth_frame
-        particle_data['death_frame'] = death_frame
-        particle_data['birth_seconds'] = birth_frame * frame_duration
-        particle_data['death_seconds'] = death_frame * frame_duration
-
-        particle_data['lifetime_frames'] = len(frame_numbers)
-        lifetime_range_frames = int(particle_data['death_frame'] - particle_data['birth_frame']) + 1
-        particle_data['lifetime_range_frames'] = lifetime_range_frames
-        lifetime_seconds = len(frame_numbers) * frame_duration
-        particle_data['lifetime_seconds'] = lifetime_seconds
-        particle_data['lifetime_range_seconds'] = lifetime_range_frames * frame_duration
-        
-        particle_data['life_fraction_alive'] = particle_data['lifetime_frames'] / (particle_data['lifetime_range_frames'])
-        particle_data['total_fraction_alive'] = particle_data['lifetime_frames'] / n_frames
-
-        # Pull just the coordinate positions
-        x = np.array(one_particle_VRPN['x']) * pixel_width  # convert to provided unit of measure
-        y = np.array(one_particle_VRPN['y']) * pixel_width
-
-        # Coordinate-related calculations
-        mean_x = np.mean(x)
-        mean_y = np.mean(y)
-
-        x0, y0 = x[0], y[0]
-        particle_data['birth_x'] = x0
-        particle_data['birth_y'] = y0
-        particle_data['death_x'] = x[-1]
-        particle_data['death_y'] = y[-1]
-        
-        particle_data['mean_x'] = mean_x
-        particle_data['mean_y'] = mean_y
-        particle_data['median_x'] = np.median(x)
-        particle_data['median_y'] = np.median(y)
-        particle_data['std_x'] = np.std(x)
-        particle_data['std_y'] = np.std(y)
-        particle_data['min_x'] = np.min(x)
-        particle_data['min_y'] = np.min(y)
-        particle_data['max_x'] = np.max(x)
-        particle_data['max_y'] = np.max(y)
-        particle_data['range_x'] = particle_data['max_x'] - particle_data['min_x']
-        particle_data['range_y'] = particle_data['max_y'] - particle_data['min_y']
-
-        # Distance and path-related parameters
-        displacement = np.linalg.norm([x[-1] - x[0], y[-1] - y[0]])
-        length_segments = np.sqrt(np.diff(x)**2 + np.diff(y)**2)
-        path_length = np.sum(length_segments)
-        straightness = displacement / path_length if path_length > 0 else 0
-        rg = np.sqrt(np.mean((x - mean_x)**2 + (y - mean_y)**2))
-        distances_from_origin = np.sqrt((x - x0)**2 + (y - y0)**2)
-
-        particle_data['displacement'] = displacement
-        particle_data['path_length'] = path_length
-        particle_data['straightness'] = straightness
-        particle_data['rg'] = rg
-        particle_data['max_distance'] = max(distances_from_origin)
-        
-        # Step vectors
-        dx = np.diff(x)
-        dy = np.diff(y)
-
-        # Calculate heading at each point
-        headings_rad = np.arctan2(dy, dx)
-        headings_deg = np.degrees(headings_rad)
-        headings_deg = (headings_deg + 360) % 360
-        particle_data['mean_heading'] = np.mean(headings_deg)
-        particle_data['median_heading'] = np.median(headings_deg)
-        particle_data['std_heading'] = np.std(headings_deg)
-        particle_data['min_heading'] = np.min(headings_deg)
-        particle_data['max_heading'] = np.max(headings_deg)
-
-        # Calculate circular variance
-        resultant = np.sqrt(np.mean(np.cos(headings_rad))**2 + np.mean(np.sin(headings_rad))**2)
-        circular_variance = 1 - resultant
-        particle_data['circular_variance'] = circular_variance
-
-        # Calculate directional change angles between each subsequent segment
-        vectors = np.column_stack((dx, dy))
-        norms = np.linalg.norm(vectors, axis=1)  # norms of vectors
-        dot_products = np.einsum('ij,ij->i', vectors[:-1], vectors[1:])  # dot products between consecutives
-        angles_rad = np.arccos(np.clip(dot_products / (norms[:-1] * norms[1:]), -1.0, 1.0))
-        angles_deg = np.degrees(angles_rad)
-        particle_data['mean_angle'] = np.mean(angles_deg)
-        particle_data['median_angle'] = np.median(angles_deg)
-        particle_data['std_angle'] = np.std(angles_deg)
-        particle_data['min_angle'] = np.min(angles_deg)
-        particle_data['max_angle'] = np.max(angles_deg)
-
-        # Calculate speed at each point
-        dt = 1 / fps
-        vx = dx / dt
-        vy = dy / dt
-        speed = np.sqrt(vx**2 + vy**2)
-        mean_speed = np.mean(speed)
-        particle_data['mean_speed'] = mean_speed
-        particle_data['median_speed'] = np.median(speed)
-        particle_data['std_speed'] = np.std(speed)
-        particle_data['min_speed'] = np.min(speed)
-        particle_data['max_speed'] = np.max(speed)
-        
-        # Calculate acceleration at each point
-        ax = np.diff(vx) / dt
-        ay = np.diff(vy) / dt
-        acceleration = np.sqrt(ax**2 + ay**2)
-        particle_data['mean_acceleration'] = np.mean(acceleration)
-        particle_data['median_acceleration'] = np.median(acceleration)
-        particle_data['std_acceleration'] = np.std(acceleration)
-        particle_data['min_acceleration'] = np.min(acceleration)
-        particle_data['max_acceleration'] = np.max(acceleration)
-
-        # Calculate linearity of forward progression
-        mean_straight_speed = displacement / lifetime_seconds
+    # Sort once so every particle's rows are one contiguous segment. The
+    # sort is stable, so each particle keeps the row order of the VRPN.
+    order = np.argsort(clean_data['particle_id'].to_numpy(), kind='stable')
+    row_particle_ids = clean_data['particle_id'].to_numpy()[order].astype(int)
+    frames = clean_data['frame'].to_numpy()[order]
+    x_pixels = clean_data['x'].to_numpy(dtype=np.float64)[order]
+    y_pixels = clean_data['y'].to_numpy(dtype=np.float64)[order]
+    particle_ids, starts, counts = np.unique(row_particle_ids, return_index=True, return_counts=True)
+    ends = starts + counts
+    n_particles = len(particle_ids)
+
+    # Generate a UUID to help identify each particle
+    uids = [str(uuid.uuid4()) for _ in range(n_particles)]
+
+    # Differences are only taken within a particle, so each particle has
+    # one fewer step than positions and two fewer turns and accelerations
+    same_particle = _same_segment(counts)
+    step_counts = np.maximum(counts - 1, 0)
+    same_step_particle = _same_segment(step_counts)
+    turn_counts = np.maximum(counts - 2, 0)
+
+    particle_data = {}
+    particle_data['particle_id'] = particle_ids
+
+    # Start with some of the easy "metadata" calculations
+    birth_frame = np.minimum.reduceat(frames, starts).astype(int)
+    death_frame = np.maximum.reduceat(frames, starts).astype(int)
+    particle_data['birth_frame'] = birth_frame
+    particle_data['death_frame'] = death_frame
+    particle_data['birth_seconds'] = birth_frame * frame_duration
+    particle_data['death_seconds'] = death_frame * frame_duration
+
+    particle_data['lifetime_frames'] = counts
+    lifetime_range_frames = (death_frame - birth_frame) + 1
+    particle_data['lifetime_range_frames'] = lifetime_range_frames
+    lifetime_seconds = counts * frame_duration
+    particle_data['lifetime_seconds'] = lifetime_seconds
+    particle_data['lifetime_range_seconds'] = lifetime_range_frames * frame_duration
+
+    particle_data['life_fraction_alive'] = counts / lifetime_range_frames
+    particle_data['total_fraction_alive'] = counts / n_frames
+
+    # Convert the coordinates to the provided unit of measure
+    x = x_pixels * pixel_width
+    y = y_pixels * pixel_width
+
+    # Coordinate-related calculations
+    x_stats = _segment_stats(x, counts)
+    y_stats = _segment_stats(y, counts)
+    mean_x = x_stats['mean']
+    mean_y = y_stats['mean']
+
+    x0, y0 = x[starts], y[starts]
+    particle_data['birth_x'] = x0
+    particle_data['birth_y'] = y0
+    particle_data['death_x'] = x[ends - 1]
+    particle_data['death_y'] = y[ends - 1]
+
+    particle_data['mean_x'] = mean_x
+    particle_data['mean_y'] = mean_y
+    particle_data['median_x'] = x_stats['median']
+    particle_data['median_y'] = y_stats['median']
+    particle_data['std_x'] = x_stats['std']
+    particle_data['std_y'] = y_stats['std']
+    particle_data['min_x'] = x_stats['min']
+    particle_data['min_y'] = y_stats['min']
+    particle_data['max_x'] = x_stats['max']
+    particle_data['max_y'] = y_stats['max']
+    particle_data['range_x'] = particle_data['max_x'] - particle_data['min_x']
+    particle_data['range_y'] = particle_data['max_y'] - particle_data['min_y']
+
+    # Step vectors
+    dx = np.diff(x)[same_particle]
+    dy = np.diff(y)[same_particle]
+
+    # Distance and path-related parameters
+    displacement = np.hypot(x[ends - 1] - x0, y[ends - 1] - y0)
+    length_segments = np.sqrt(dx**2 + dy**2)
+    path_length = _segment_sum(length_segments, step_counts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        straightness = np.where(path_length > 0, displacement / path_length, 0)
+    rg = np.sqrt(_segment_mean((x - np.repeat(mean_x, counts))**2 + (y - np.repeat(mean_y, counts))**2, counts))
+    distances_from_origin = np.sqrt((x - np.repeat(x0, counts))**2 + (y - np.repeat(y0, counts))**2)
+
+    particle_data['displacement'] = displacement
+    particle_data['path_length'] = path_length
+    particle_data['straightness'] = straightness
+    particle_data['rg'] = rg
+    particle_data['max_distance'] = np.maximum.reduceat(distances_from_origin, starts)
+
+    # Calculate heading at each point
+    headings_rad = np.arctan2(dy, dx)
+    headings_deg = np.degrees(headings_rad)
+    headings_deg = (headings_deg + 360) % 360
+    heading_stats = _segment_stats(headings_deg, step_counts)
+    particle_data['mean_heading'] = heading_stats['mean']
+    particle_data['median_heading'] = heading_stats['median']
+    particle_data['std_heading'] = heading_stats['std']
+    particle_data['min_heading'] = heading_stats['min']
+    particle_data['max_heading'] = heading_stats['max']
+
+    # Calculate circular variance
+    resultant = np.sqrt(_segment_mean(np.cos(headings_rad), step_counts)**2
+                        + _segment_mean(np.sin(headings_rad), step_counts)**2)
+    circular_variance = 1 - resultant
+    particle_data['circular_variance'] = circular_variance
+
+    # Calculate directional change angles between each subsequent segment
+    dot_products = (dx[:-1] * dx[1:] + dy[:-1] * dy[1:])[same_step_particle]
+    norm_products = (length_segments[:-1] * length_segments[1:])[same_step_particle]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        angles_rad = np.arccos(np.clip(dot_products / norm_products, -1.0, 1.0))
+    angles_deg = np.degrees(angles_rad)
+    angle_stats = _segment_stats(angles_deg, turn_counts)
+    particle_data['mean_angle'] = angle_stats['mean']
+    particle_data['median_angle'] = angle_stats['median']
+    particle_data['std_angle'] = angle_stats['std']
+    particle_data['min_angle'] = angle_stats['min']
+    particle_data['max_angle'] = angle_stats['max']
+
+    # Calculate speed at each point
+    dt = 1 / fps
+    vx = dx / dt
+    vy = dy / dt
+    speed = np.sqrt(vx**2 + vy**2)
+    speed_stats = _segment_stats(speed, step_counts)
+    mean_speed = speed_stats['mean']
+    particle_data['mean_speed'] = mean_speed
+    particle_data['median_speed'] = speed_stats['median']
+    particle_data['std_speed'] = speed_stats['std']
+    particle_data['min_speed'] = speed_stats['min']
+    particle_data['max_speed'] = speed_stats['max']
+
+    # Calculate acceleration at each point
+    ax = np.diff(vx)[same_step_particle] / dt
+    ay = np.diff(vy)[same_step_particle] / dt
+    acceleration = np.sqrt(ax**2 + ay**2)
+    acceleration_stats = _segment_stats(acceleration, turn_counts)
+    particle_data['mean_acceleration'] = acceleration_stats['mean']
+    particle_data['median_acceleration'] = acceleration_stats['median']
+    particle_data['std_acceleration'] = acceleration_stats['std']
+    particle_data['min_acceleration'] = acceleration_stats['min']
+    particle_data['max_acceleration'] = acceleration_stats['max']
+
+    # Calculate linearity of forward progression
+    mean_straight_speed = displacement / lifetime_seconds
+    with np.errstate(invalid='ignore', divide='ignore'):
         linearity = mean_straight_speed / mean_speed
-        particle_data['linearity'] = linearity
-
-        # Calculate bounding box area
-        x_min, x_max = np.min(x), np.max(x)
-        y_min, y_max = np.min(y), np.max(y)
-        bb_width = x_max - x_min
-        bb_height = y_max - y_min
-        bb_area = bb_width * bb_height
-        particle_data['bb_area'] = bb_area
-
-        # Calculate the PCA of the coordinate data
-        # Format data for PCA and interpolate missing values
-        xy_data = one_particle_VRPN[['x', 'y']].interpolate(method='linear')
-
-        # Run PCA
-        pca = PCA(n_components=1)
-        pca.fit(xy_data)
-
-        # Extract the first principal axis (a 2-element vector) and normalize
-        axis = pca.components_[0]
-        axis = axis / np.linalg.norm(axis)
-
-        # Project xy data onto the axis from the PCA
-        centered = xy_data - xy_data.mean()
-        projected = centered.values @ axis
-
-        # Record alignment from the PCA
-        alignment_rad = np.arctan2(axis[1], axis[0]) % np.pi
-        alignment_deg = np.degrees(alignment_rad)
-        alignment_strength = pca.explained_variance_ratio_[0]
-        particle_data['alignment_deg'] = alignment_deg 
-        particle_data['alignment_rad'] = alignment_rad 
-        particle_data['alignment_strength'] = alignment_strength 
-
-        # Also save the path to the particle row for later analysis
-        particle_data['path'] = path
-        particle_data['uuid'] = uid
-
-        # Determine window length as 10% of signal length
-        window_length = max(int(len(projected) * 0.1), 5)  # ensure at least 5 samples
-
-        # Make window length odd
-        if window_length % 2 == 0:
-            window_length += 1
-
-        # Ensure window length > polyorder
-        polyorder = 3
-        if window_length <= polyorder:
-            window_length = polyorder + 2  # make it bigger than polyorder
-            if window_length % 2 == 0:     # and still odd
-                window_length += 1
-
-        # Apply Savitzky-Golay filter
-        trend = savgol_filter(projected, window_length=window_length, polyorder=polyorder, mode='interp')
-        projected_detrend = projected - trend
-
-        # Append the particle data to the list
-        all_particle_data_dfs.append(pd.DataFrame([particle_data]))
-
-        # At this point we'll also compile all the instantaneous data calculated
-        # for this partcile into a dataframe and then save it to a dict based
-        # on that particles ID number.
-        instant_data = pd.DataFrame({
-            'x': x,
-            'y': y,
-            'heading_deg': np.append(None, headings_deg),  # append None at end b/c array is n-1 to coords
-            'heading_rad': np.append(None, headings_rad),
-            'angle_deg': np.append([None, None], angles_deg),
-            'angle_rad': np.append([None, None], angles_rad),
-            'vx': np.append(None, vx),
-            'vy': np.append(None, vy),
-            'speed': np.append(None, speed),
-            'ax': np.append([None, None], ax),
-            'ay': np.append([None, None], ay),
-            'acceleration': np.append([None, None], acceleration),
-            'distance': np.append(0, length_segments),
-            'total_distance': np.append(0, np.cumsum(length_segments)),
-            'pca': projected_detrend,
-            'path': np.repeat(path, len(x)),
-            'particle_id': np.repeat(particle_id, len(x)),
-            'uuid': np.repeat(uid, len(x))
-        })
-        all_instant_data_dfs.append(instant_data)
-
-    # Combine all the dfs into one
-    summary = pd.concat(all_particle_data_dfs).reset_index()
-    instantaneous = pd.concat(all_instant_data_dfs).reset_index()
-    
+    particle_data['linearity'] = linearity
+
+    # Calculate bounding box area
+    bb_area = particle_data['range_x'] * particle_data['range_y']
+    particle_data['bb_area'] = bb_area
+
+    # Rows without an x coordinate were removed above, so only y can still
+    # be missing. Fill any gaps by interpolating within the particle.
+    pca_x, pca_y = x_pixels, y_pixels
+    if np.any(np.isnan(pca_y)):
+        pca_y = pd.Series(pca_y).groupby(row_particle_ids).transform(
+            lambda values: values.interpolate(method='linear')).to_numpy()
+
+    # Find the primary axis of every particle and project onto it
+    alignment_rad, alignment_strength, projected = _segment_pca(pca_x, pca_y, counts)
+
+    # Determine window length as 10% of signal length, with at least 5
+    # samples (which also keeps it above the polynomial order) and odd
+    polyorder = 3
+    window_lengths = np.maximum((counts * 0.1).astype(int), 5)
+    window_lengths += (window_lengths % 2 == 0)
+
+    # Detrend with a Savitzky-Golay filter. Particles shorter than their
+    # window can't be filtered and are left as NaN.
+    trend = _segment_savgol(projected, counts, window_lengths, polyorder=polyorder)
+    projected_detrend = projected - trend
+
+    # Record alignment from the PCA
+    particle_data['alignment_deg'] = np.degrees(alignment_rad)
+    particle_data['alignment_rad'] = alignment_rad
+    particle_data['alignment_strength'] = alignment_strength
+
+    # Also save the path to the particle row for later analysis
+    particle_data['path'] = np.repeat(path, n_particles)
+    particle_data['uuid'] = uids
+
+    # Codes of the bead and video, which the instantaneous table stores
+    # instead of repeating the UUID and path on every row
+    particle_data['uuid_code'] = np.arange(n_particles, dtype=np.int32)
+    particle_data['path_code'] = np.zeros(n_particles, dtype=np.int32)
+
+    # Combine everything into one row per particle. The index column is
+    # kept for compatibility with the previous per-particle concatenation.
+    summary = pd.DataFrame(particle_data)
+    summary.insert(0, 'index', 0)
+
+    # Compile the instantaneous data, one row per position. Values that are
+    # calculated from differences don't exist for the first one or two
+    # positions of each particle, which are NaN.
+    position = np.arange(x.size) - np.repeat(starts, counts)
+    has_step = position >= 1
+    has_turn = position >= 2
+
+    def _pad(values, mask):
+        padded = np.full(x.size, np.nan, dtype=np.float32)
+        padded[mask] = values
+        return padded
+
+    # Distance traveled during each frame (zero at the first position) and
+    # its running total within each particle
+    distance = np.zeros(x.size)
+    distance[has_step] = length_segments
+    cumulative_distance = np.cumsum(distance)
+    total_distance = cumulative_distance - np.repeat(cumulative_distance[starts], counts)
+
+    instantaneous = pd.DataFrame({
+        'index': position,
+        'x': x,
+        'y': y,
+        'heading_deg': _pad(headings_deg, has_step),
+        'heading_rad': _pad(headings_rad, has_step),
+        'angle_deg': _pad(angles_deg, has_turn),
+        'angle_rad': _pad(angles_rad, has_turn),
+        'vx': _pad(vx, has_step),
+        'vy': _pad(vy, has_step),
+        'speed': _pad(speed, has_step),
+        'ax': _pad(ax, has_turn),
+        'ay': _pad(ay, has_turn),
+        'acceleration': _pad(acceleration, has_turn),
+        'distance': distance,
+        'total_distance': total_distance,
+        'pca': projected_detrend,
+        'particle_id': row_particle_ids,
+        'uuid_code': np.repeat(summary['uuid_code'].to_numpy(), counts),
+        'path_code': 0
+    })
+    instantaneous = _compact_instantaneous(instantaneous)
+
     return summary, instantaneous, metadata
@@ -0,0 +1,372 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+# This class collects many tracking files (replicate videos, conditions,
+# etc.) into a single dataset so that ensemble results can be calculated
+# across any grouping of them. Files are only ever loaded one at a time,
+# and the per-file results are cached so regrouping is nearly free.
+
+from pathlib import Path
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from ..utilities.walk_dir import walk_dir
+from ..utilities.print_progress_bar import print_progress_bar
+from ..visual._get_camera_info import _get_camera_info
+from ._track_store import _read_track, _memmap_track_column
+from ._calculate_msd_fft import _calculate_msd_fft, _log_spaced_lags
+from ._calculate_gser import _calculate_gser
+from ._calculate_van_hove import _VanHoveAccumulator
+
+# Factors converting micrometers into each supported unit
+_UNIT_FACTORS = {'m': 1e-6, 'cm': 1e-4, 'mm': 1e-3, 'um': 1, 'nm': 1e3}
+
+class PTMRDataset():
+
+    """
+    A collection of PTMR tracking files indexed by condition metadata.
+
+    ARGUMENTS:
+        files (list): the paths to the tracking files (.track.h5 or
+            legacy .track.csv).
+        fps (int): the frame rate of the videos.
+        camera (str): the three charcter code of the camera.
+        magnification (float): the factor of magnification applied when
+            the videos were recorded.
+        metadata (pandas.DataFrame): optional condition metadata with a
+            'path' column and one column per condition. Files without an
+            entry keep NaN conditions. By default the only condition is
+            the name of the folder containing each file.
+        units (string): the units of the MSDs, either 'm', 'cm', 'mm',
+            'um', or 'nm'.
+        cache_folder (string): optional folder where per-file results are
+            saved so they can be reused across sessions.
+
+    NOTES:
+        1. The ensemble statistics are built from streaming accumulators
+        (the number of beads, and the sum and sum of squares of their MSDs
+        at each lag), so only one file is ever in memory at a time.
+        2. The MSD of each file is calculated in pixels, and the unit
+        scaling is applied to the MSDs rather than to the coordinates.
+        3. Per-file accumulators are cached in memory and, if a cache
+        folder is provided, on disk. They are keyed by the file's size and
+        modification time, so edited files are recalculated.
+    """
+
+    def __init__(self, files, fps, camera, magnification, metadata=None, units='um',
+                 cache_folder=None):
+
+        if units not in _UNIT_FACTORS:
+            raise ValueError(f"'{units}' is not a valid value for units.")
+
+        self.fps = fps
+        self.camera = camera
+        self.magnification = magnification
+        self.units = units
+        self.cache_folder = cache_folder
+        self._partials = {}
+
+        # Size of one pixel in the requested units
+        camera_info = _get_camera_info(camera=camera, magnification=magnification)
+        self.pixel_size = camera_info['magnified_pixel_width_um'] * _UNIT_FACTORS[units]
+
+        # Index the files by their conditions
+        index = pd.DataFrame({'path': [str(path) for path in files]})
+        if metadata is None:
+            index['folder'] = [Path(path).parent.name for path in index['path']]
+        else:
+            metadata = metadata.assign(path=metadata['path'].astype(str))
+            index = index.merge(metadata, on='path', how='left')
+        self.index = index
+
+
+    @classmethod
+    def from_folder(cls, folder, fps, camera, magnification, extension='track.h5', **kwargs):
+
+        """
+        Creates a dataset of every tracking file in a folder and its
+        subfolders. Drift subtracted files can be selected with
+        extension='drift.track.h5'.
+        """
+
+        files = walk_dir(folder, extension=extension)
+
+        # A .track.h5 search also matches .drift.track.h5 files
+        if extension == 'track.h5':
+            files = [path for path in files if not path.endswith('.drift.track.h5')]
+
+        return cls(files, fps=fps, camera=camera, magnification=magnification, **kwargs)
+
+
+    def __len__(self):
+        return self.index.shape[0]
+
+
+    def __repr__(self):
+        conditions = [column for column in self.index.columns if column != 'path']
+        return f'PTMRDataset({len(self)} files, conditions={conditions})'
+
+
+    def load(self, path, columns=None, particles=None):
+
+        """
+        Loads the raw tracking data (in pixels) of one file of the
+        dataset. When every particle is requested, columns of .track.h5
+        files that can be memory mapped are mapped instead of read.
+        """
+
+        if Path(path).suffix != '.h5':
+            data = pd.read_csv(path, usecols=columns)
+            if particles is not None:
+                data = data[data['particle_id'].isin(particles)]
+            return data
+
+        # Particle subsets are read directly, since they are small
+        if particles is not None:
+            return _read_track(path, columns=columns, particles=particles)
+
+        # Map what can be mapped and read the rest
+        if columns is None:
+            columns = list(_read_track(path, particles=[]).columns)
+        mapped = {column: _memmap_track_column(path, column) for column in columns}
+        read = _read_track(path, columns=[column for column in columns if mapped[column] is None])
+        data = {column: (read[column] if mapped[column] is None else mapped[column]) for column in columns}
+
+        return pd.DataFrame(data, columns=columns, copy=False)
+
+
+    def file_msd(self, path, lag_frames):
+
+        """
+        Returns the accumulators of the bead MSDs of one file: the number
+        of beads with an MSD at each lag, and the sum and sum of squares
+        of their MSDs. Results are cached.
+        """
+
+        lag_frames = np.asarray(lag_frames, dtype=np.int64)
+        key = self._cache_key(path, lag_frames)
+
+        # Look in memory, then on disk
+        if key in self._partials:
+            return self._partials[key]
+        cache_path = None
+        if self.cache_folder is not None:
+            cache_path = Path(self.cache_folder) / f'{key}.npz'
+            if cache_path.exists():
+                with np.load(cache_path) as cached:
+                    partial = {name: cached[name] for name in cached.files}
+                self._partials[key] = partial
+                return partial
+
+        # Calculate the MSD of every bead in pixels, then scale it
+        particle_ids, frames, x, y = self._load_coordinates(path)
+        _, msd, _ = _calculate_msd_fft(particle_ids=particle_ids, frames=frames, x=x, y=y,
+                                       lag_frames=lag_frames)
+        msd = msd * self.pixel_size**2
+
+        # Accumulate over the beads with a value at each lag
+        present = ~np.isnan(msd)
+        values = np.where(present, msd, 0)
+        partial = {'count': present.sum(axis=0).astype(np.int64),
+                   'sum': values.sum(axis=0),
+                   'sum_squares': (values**2).sum(axis=0),
+                   'n_beads': np.array(msd.shape[0])}
+
+        self._partials[key] = partial
+        if cache_path is not None:
+            os.makedirs(self.cache_folder, exist_ok=True)
+            np.savez(cache_path, **partial)
+
+        return partial
+
+
+    def ensemble_msd(self, by=None, lag_frames=None):
+
+        """
+        Calculates the ensemble MSD of every group of files, averaged over
+        all beads in the group.
+
+        ARGUMENTS:
+            by (string or list): the metadata column(s) to group the files
+                by. Defaults to every file together.
+            lag_frames (list): the frame lags at which the MSD is
+                evaluated. Defaults to 31 lags spaced evenly on a log
+                scale from 1 to 1000 frames.
+
+        RETURNS:
+            ensemble (pandas.DataFrame): one row per group per lag with
+                the number of beads and files, the lag time (tau), and the
+                mean, standard deviation, and standard error of the bead
+                MSDs (in units squared).
+        """
+
+        if lag_frames is None:
+            lag_frames = _log_spaced_lags(max_lag=1000, n_lags=31)
+        lag_frames = np.asarray(lag_frames, dtype=np.int64)
+        by = [] if by is None else ([by] if isinstance(by, str) else list(by))
+
+        # Calculate (or fetch) the accumulators of every file once
+        partials = []
+        for i, path in enumerate(self.index['path']):
+            partials.append(self.file_msd(path, lag_frames))
+            print_progress_bar(progress=i+1, total=len(self), title='Calculating MSDs')
+
+        # Combining accumulators is just a sum within each group
+        groups = self.index.groupby(by, dropna=False, sort=True) if by else [((), self.index)]
+        rows = []
+        for group_key, group in groups:
+            count = sum(partials[i]['count'] for i in group.index)
+            total = sum(partials[i]['sum'] for i in group.index)
+            total_squares = sum(partials[i]['sum_squares'] for i in group.index)
+
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = np.where(count > 0, total / count, np.nan)
+                variance = np.maximum(total_squares / count - mean**2, 0) * count / (count - 1)
+            std = np.where(count > 1, np.sqrt(variance), np.nan)
+
+            group_key = group_key if isinstance(group_key, tuple) else (group_key,)
+            row = {column: value for column, value in zip(by, group_key)}
+            rows.append(pd.DataFrame({**row,
+                                      'n_files': group.shape[0],
+                                      'lag_frames': lag_frames,
+                                      'tau': lag_frames / self.fps,
+                                      'n_beads': count,
+                                      'msd': mean,
+                                      'msd_std': std,
+                                      'msd_sem': std / np.sqrt(count)}))
+
+        return pd.concat(rows, ignore_index=True)
+
+
+    def ensemble_moduli(self, by=None, lag_frames=None, bead_diameter=1, temperature=298.15):
+
+        """
+        Calculates the moduli of every group of files from its ensemble
+        MSD with the generalized Stokes-Einstein relation.
+
+        ARGUMENTS:
+            by (string or list): the metadata column(s) to group the files
+                by. Defaults to every file together.
+            lag_frames (list): the frame lags at which the moduli are
+                evaluated. Defaults to 31 lags spaced evenly on a log
+                scale from 1 to 1000 frames.
+            bead_diameter (float): the diameter of the tracked beads in um.
+            temperature (float): the temperature of the samples in Kelvin.
+
+        RETURNS:
+            moduli (pandas.DataFrame): the ensemble MSD table with the
+                frequency (omega), local log-slope (alpha), and |G*|, G',
+                and G'' (Pa) added.
+
+        NOTES:
+            Confidence intervals aren't calculated here since they need
+            every bead's MSD, which the streaming accumulators don't keep.
+            Use calculate_ensemble_moduli for bootstrapped intervals.
+        """
+
+        moduli = self.ensemble_msd(by=by, lag_frames=lag_frames)
+        by = [] if by is None else ([by] if isinstance(by, str) else list(by))
+
+        # Convert each group's curve to m^2 and calculate the moduli
+        to_meters = (1e-6 / _UNIT_FACTORS[self.units])**2
+        groups = moduli.groupby(by, dropna=False, sort=False).groups.values() if by else [moduli.index]
+        for rows in groups:
+            curve = moduli.loc[rows]
+            gser = _calculate_gser(curve['msd'].to_numpy() * to_meters, tau=curve['tau'].to_numpy(),
+                                   bead_radius=(bead_diameter / 2) * 1e-6, temperature=temperature)
+            for key, values in gser.items():
+                moduli.loc[rows, key] = values
+
+        return moduli
+
+
+    def van_hove(self, by=None, lag_frames=None, bin_edges=None):
+
+        """
+        Calculates the displacement distribution (van Hove correlation)
+        and its moments for every group of files in a single pass over
+        the files. See calculate_van_hove for details of the results.
+
+        ARGUMENTS:
+            by (string or list): the metadata column(s) to group the files
+                by. Defaults to every file together.
+            lag_frames (list): the frame lags at which displacements are
+                taken. Defaults to 1, 10, and 100 frames.
+            bin_edges (numpy.ndarray): the edges of the displacement bins,
+                in the units of the dataset. Defaults to 200 bins from -1
+                to 1.
+
+        RETURNS:
+            histogram (pandas.DataFrame): one row per group per lag per bin.
+            statistics (pandas.DataFrame): one row per group per lag.
+        """
+
+        if lag_frames is None:
+            lag_frames = [1, 10, 100]
+        if bin_edges is None:
+            bin_edges = np.linspace(-1, 1, 201)
+        by = [] if by is None else ([by] if isinstance(by, str) else list(by))
+
+        # One accumulator per group, each file streamed into its group's
+        groups = self.index.groupby(by, dropna=False, sort=True) if by else [((), self.index)]
+        histograms, statistics = [], []
+        progress = 0
+        for group_key, group in groups:
+            accumulator = _VanHoveAccumulator(lag_frames=lag_frames, bin_edges=bin_edges)
+            for path in group['path']:
+                particle_ids, frames, x, y = self._load_coordinates(path)
+                accumulator.add(particle_ids, frames, x, y, scale=self.pixel_size)
+                progress += 1
+                print_progress_bar(progress=progress, total=len(self), title='Calculating displacements')
+
+            group_key = group_key if isinstance(group_key, tuple) else (group_key,)
+            row = {column: value for column, value in zip(by, group_key)}
+            histograms.append(accumulator.histogram(self.fps).assign(**row))
+            statistics.append(accumulator.statistics(self.fps).assign(**row))
+
+        # Put the group columns first
+        histogram = pd.concat(histograms, ignore_index=True)
+        statistics = pd.concat(statistics, ignore_index=True)
+        histogram = histogram[by + [c for c in histogram.columns if c not in by]]
+        statistics = statistics[by + [c for c in statistics.columns if c not in by]]
+
+        return histogram, statistics
+
+
+    def _load_coordinates(self, path):
+
+        """
+        Returns the particle IDs, frames, and X and Y coordinates (pixels)
+        of one file, memory mapping the coordinates where possible.
+        """
+
+        if Path(path).suffix != '.h5':
+            data = pd.read_csv(path, usecols=['particle_id', 'frame', 'x', 'y'])
+            return (data['particle_id'].to_numpy(), data['frame'].to_numpy(),
+                    data['x'].to_numpy(), data['y'].to_numpy())
+
+        ids = _read_track(path, columns=['particle_id', 'frame'])
+        coordinates = []
+        for column in ['x', 'y']:
+            values = _memmap_track_column(path, column)
+            if values is None:
+                values = _read_track(path, columns=[column])[column].to_numpy()
+            coordinates.append(values)
+
+        return ids['particle_id'].to_numpy(), ids['frame'].to_numpy(), coordinates[0], coordinates[1]
+
+
+    def _cache_key(self, path, lag_frames):
+
+        """
+        Key of the per-file results, which changes whenever the file or
+        any setting that affects its MSD changes.
+        """
+
+        stat = os.stat(path)
+        payload = json.dumps({'path': str(Path(path).resolve()), 'size': stat.st_size,
+                              'mtime_ns': stat.st_mtime_ns, 'lag_frames': lag_frames.tolist(),
+                              'pixel_size': self.pixel_size})
+
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
@@ -0,0 +1,97 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+import numpy as np
+from scipy.special import gamma
+
+# Boltzmann constant in J/K
+K_B = 1.380649e-23
+
+def _calculate_gser(msd, tau, bead_radius, temperature, dimensions=2):
+
+    """
+    Converts MSD curves into viscoelastic moduli using the generalized
+    Stokes-Einstein relation (Mason, 2000). Every leading axis of the MSD
+    array is treated as a separate curve, so many files or bootstrap
+    resamples can be converted in a single call.
+
+    ARGUMENTS:
+        msd (numpy.ndarray): MSD values in m^2 with the lag times along
+            the last axis.
+        tau (numpy.ndarray): the lag times in seconds, one per MSD column.
+        bead_radius (float): the radius of the tracked beads in meters.
+        temperature (float): the temperature of the sample in Kelvin.
+        dimensions (int): the number of dimensions in which the MSD was
+            measured. Defaults to 2 for XY tracking.
+
+    RETURNS:
+        gser (dict): a dictionary of arrays with the same shape as the MSD
+            array, containing 'omega' (rad/s), 'alpha' (the local log-slope
+            of the MSD), 'g_star' (|G*|, Pa), 'g_prime' (G', Pa), and
+            'g_double_prime' (G'', Pa).
+
+    NOTES:
+        1. The local slope alpha = dln(MSD)/dln(tau) is estimated with
+        second-order central differences on the log-log curve, which
+        handles unevenly spaced lags.
+        2. An MSD measured in d dimensions is scaled to its 3D equivalent,
+        giving |G*(w)| = d kT / (3 pi a MSD(1/w) Gamma(1 + alpha)).
+    """
+
+    msd = np.asarray(msd, dtype=np.float64)
+    tau = np.asarray(tau, dtype=np.float64)
+
+    # Local power-law slope of the MSD at every lag
+    with np.errstate(invalid='ignore', divide='ignore'):
+        log_msd = np.log(msd)
+    alpha = np.gradient(log_msd, np.log(tau), axis=-1)
+
+    # Magnitude of the complex modulus, then split into its components
+    with np.errstate(invalid='ignore', divide='ignore'):
+        g_star = (dimensions * K_B * temperature) / (3 * np.pi * bead_radius * msd * gamma(1 + alpha))
+    g_prime = g_star * np.cos(np.pi * alpha / 2)
+    g_double_prime = g_star * np.sin(np.pi * alpha / 2)
+
+    # Frequency is the inverse of the lag time
+    omega = np.broadcast_to(1 / tau, msd.shape)
+
+    gser = {'omega': omega,
+            'alpha': alpha,
+            'g_star': g_star,
+            'g_prime': g_prime,
+            'g_double_prime': g_double_prime}
+
+    return gser
+
+
+def _bootstrap_ensemble_msd(msd, n_bootstrap, rng):
+
+    """
+    Resamples the beads of one file with replacement and returns the
+    ensemble MSD of each resample. Each resample is a row of bead counts,
+    so all resamples are computed together as one matrix product across
+    the beads.
+
+    ARGUMENTS:
+        msd (numpy.ndarray): the MSD of every bead (rows) at every lag
+            (columns). NaN where a bead has no value.
+        n_bootstrap (int): the number of resamples to draw
+        rng (numpy.random.Generator): the random number generator
+
+    RETURNS:
+        bootstrap_msd (numpy.ndarray): the ensemble MSD of each resample
+            (rows) at every lag (columns).
+    """
+
+    n_beads = msd.shape[0]
+    if n_beads == 0:
+        return np.full((n_bootstrap, msd.shape[1]), np.nan)
+
+    # How many times each bead is drawn in each resample
+    weights = rng.multinomial(n_beads, np.full(n_beads, 1 / n_beads), size=n_bootstrap).astype(np.float64)
+
+    # Weighted sums that skip missing values
+    present = ~np.isnan(msd)
+    sums = weights @ np.where(present, msd, 0)
+    counts = weights @ present.astype(np.float64)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts
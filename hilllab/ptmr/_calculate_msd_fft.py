@@ -0,0 +1,223 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+import numpy as np
+from scipy import fft
+
+def _group_particles(particle_ids, frames):
+
+    """
+    Sorts tracking data by particle ID and frame number once and returns
+    the information needed to address each particle as a contiguous slice
+    of the sorted arrays.
+
+    ARGUMENTS:
+        particle_ids (numpy.ndarray): the particle ID of every row
+        frames (numpy.ndarray): the frame number of every row
+
+    RETURNS:
+        order (numpy.ndarray): the indices that sort the rows by particle
+            ID and then by frame number.
+        unique_ids (numpy.ndarray): the unique particle IDs in sorted order
+        starts (numpy.ndarray): the index in the sorted arrays at which
+            each particle's rows begin.
+        counts (numpy.ndarray): the number of rows belonging to each particle
+    """
+
+    # Sort by particle ID first and frame second. Data that has already been
+    # through _format_vrpn is sorted this way, so the sort is skipped.
+    id_steps = np.diff(particle_ids)
+    if np.all((id_steps > 0) | ((id_steps == 0) & (np.diff(frames) > 0))):
+        order = np.arange(len(particle_ids))
+    else:
+        order = np.lexsort((frames, particle_ids))
+    sorted_ids = particle_ids[order]
+
+    # The first occurrence of each ID marks the start of its slice
+    unique_ids, starts, counts = np.unique(sorted_ids, return_index=True, return_counts=True)
+
+    return order, unique_ids, starts, counts
+
+
+def _segment_indices(starts, counts):
+
+    """
+    Returns the concatenated row indices of several contiguous slices,
+    each given by its start index and length.
+    """
+
+    counts = np.asarray(counts)
+    total = int(counts.sum())
+    if total == 0:
+        return np.array([], dtype=np.int64)
+
+    # Shift a running index so each slice begins at its own start
+    slice_offsets = np.cumsum(counts) - counts
+    return np.arange(total) + np.repeat(np.asarray(starts) - slice_offsets, counts)
+
+
+def _log_spaced_lags(max_lag, n_lags):
+
+    """
+    Generates up to n_lags unique integer lag values (in frames) spaced
+    evenly on a log scale between 1 and max_lag.
+    """
+
+    if max_lag < 1:
+        return np.array([], dtype=int)
+
+    lags = np.logspace(0, np.log10(max_lag), num=n_lags)
+    return np.unique(np.round(lags).astype(int))
+
+
+def _calculate_msd_fft(particle_ids, frames, x, y, lag_frames, max_chunk_size=2**22):
+
+    """
+    Calculates the MSD of every particle at every requested lag using the
+    FFT autocorrelation algorithm. The MSD for all lags of a track with L
+    frames is computed in O(L log L) instead of O(L^2), and particles with
+    similar lifetimes are stacked and transformed together.
+
+    ARGUMENTS:
+        particle_ids (numpy.ndarray): the particle ID of every row
+        frames (numpy.ndarray): the frame number of every row
+        x (numpy.ndarray): the X coordinate of every row
+        y (numpy.ndarray): the Y coordinate of every row
+        lag_frames (numpy.ndarray): the lag values (in frames) at which
+            the MSD should be sampled.
+        max_chunk_size (int): the maximum number of elements in each
+            stacked FFT array. Limits peak memory usage on large files.
+
+    RETURNS:
+        unique_ids (numpy.ndarray): the particle IDs, one per row of the
+            returned arrays.
+        msd (numpy.ndarray): the MSD of each particle (rows) at each lag
+            (columns). NaN where a particle has no pairs at that lag.
+        n_pairs (numpy.ndarray): the number of displacement pairs that
+            went into each MSD value.
+
+    NOTES:
+        1. Lags are true frame lags. Each track is placed on a frame grid
+        with a mask, so frames missing from a track are excluded instead
+        of being bridged by the neighbouring rows.
+        2. For a mask w and positions r, the sum of squared displacements
+        at lag m is corr(w, |r|^2) + corr(|r|^2, w) - 2 corr(r, r) and the
+        number of pairs is corr(w, w). Each correlation is one rFFT product.
+        Tracks without gaps reduce the first two terms to prefix sums.
+    """
+
+    particle_ids = np.asarray(particle_ids)
+    frames = np.asarray(frames).astype(np.int64)
+    lag_frames = np.asarray(lag_frames).astype(np.int64)
+    n_lags = len(lag_frames)
+
+    # Group the rows by particle once
+    order, unique_ids, starts, counts = _group_particles(particle_ids, frames)
+    n_beads = len(unique_ids)
+
+    msd = np.full((n_beads, n_lags), np.nan)
+    n_pairs = np.zeros((n_beads, n_lags), dtype=np.int64)
+    if n_beads == 0:
+        return unique_ids, msd, n_pairs
+
+    # Sort the coordinates into contiguous per-particle slices
+    frames = frames[order]
+    x = np.asarray(x, dtype=np.float64)[order]
+    y = np.asarray(y, dtype=np.float64)[order]
+    bead_index = np.repeat(np.arange(n_beads), counts)  # which bead each row belongs to
+
+    # Drop rows without coordinates; they are simply absent from the mask
+    valid = ~(np.isnan(x) | np.isnan(y))
+
+    # Center each track on its mean position. The MSD is unaffected, but it
+    # keeps the squared positions small so the FFT sums don't lose precision.
+    n_valid_rows = np.bincount(bead_index[valid], minlength=n_beads)
+    n_valid = np.maximum(n_valid_rows, 1)
+    x_mean = np.bincount(bead_index[valid], weights=x[valid], minlength=n_beads) / n_valid
+    y_mean = np.bincount(bead_index[valid], weights=y[valid], minlength=n_beads) / n_valid
+    x = x - x_mean[bead_index]
+    y = y - y_mean[bead_index]
+
+    # Frame offset of every row from the first frame of its particle, and
+    # the length of each particle's frame grid
+    first_frames = frames[starts]
+    offsets = frames - first_frames[bead_index]
+    grid_lengths = frames[starts + counts - 1] - first_frames + 1
+
+    # Zero-pad to at least twice the grid length so the circular correlation
+    # doesn't wrap around. Tracks sharing an FFT length are stacked together.
+    fft_lengths = np.array([fft.next_fast_len(int(2 * n), real=True) for n in grid_lengths])
+
+    for fft_length in np.unique(fft_lengths):
+        bucket = np.where(fft_lengths == fft_length)[0]
+        chunk_beads = max(1, max_chunk_size // int(fft_length))
+
+        # Only lags shorter than the FFT length can be read off the result
+        lag_mask = lag_frames < fft_length
+        lags_in_range = lag_frames[lag_mask]
+
+        for chunk_start in range(0, len(bucket), chunk_beads):
+            chunk = bucket[chunk_start:chunk_start + chunk_beads]
+
+            # Pull the rows for every bead in this chunk. Each bead is a
+            # contiguous slice, so no search over the full table is needed.
+            rows = _segment_indices(starts[chunk], counts[chunk])
+            chunk_rows = np.repeat(np.arange(len(chunk)), counts[chunk])
+            keep = valid[rows]
+            rows, chunk_rows = rows[keep], chunk_rows[keep]
+            chunk_offsets = offsets[rows]
+
+            # Place the coordinates onto each bead's frame grid
+            xs = np.zeros((len(chunk), fft_length))
+            ys = np.zeros((len(chunk), fft_length))
+            xs[chunk_rows, chunk_offsets] = x[rows]
+            ys[chunk_rows, chunk_offsets] = y[rows]
+            r2 = xs**2 + ys**2
+
+            # The position autocorrelation is needed either way.
+            # corr(a, b)[m] = sum_i a[i] * b[i + m] = irfft(conj(A) * B)[m]
+            fx = fft.rfft(xs, axis=1, workers=-1)
+            fy = fft.rfft(ys, axis=1, workers=-1)
+            position_corr = fft.irfft(fx.real**2 + fx.imag**2 + fy.real**2 + fy.imag**2,
+                                      n=fft_length, axis=1, workers=-1)[:, lags_in_range]
+            chunk_lengths = grid_lengths[chunk]
+
+            # Tracks without gaps (the usual case) have L - m pairs at lag m,
+            # and the squared position terms are plain prefix sums
+            if np.all(n_valid_rows[chunk] == chunk_lengths):
+                chunk_pairs = np.maximum(chunk_lengths[:, None] - lags_in_range[None, :], 0)
+
+                cumulative = np.cumsum(r2, axis=1)
+                bead_rows = np.arange(len(chunk))[:, None]
+                total = cumulative[bead_rows, chunk_lengths[:, None] - 1]
+                head = np.where(lags_in_range > 0, cumulative[:, np.maximum(lags_in_range - 1, 0)], 0)
+                tail_index = chunk_lengths[:, None] - 1 - lags_in_range[None, :]
+                tail = np.where(tail_index >= 0, cumulative[bead_rows, np.maximum(tail_index, 0)], 0)
+                r2_sums = (total - head) + tail
+
+            # Otherwise the mask w is correlated with |r|^2 and with itself
+            else:
+                w = np.zeros((len(chunk), fft_length))
+                w[chunk_rows, chunk_offsets] = 1
+                fw = fft.rfft(w, axis=1, workers=-1)
+                fr2 = fft.rfft(r2, axis=1, workers=-1)
+
+                pairs = fft.irfft(fw.real**2 + fw.imag**2, n=fft_length, axis=1, workers=-1)
+                r2_sums = fft.irfft(2 * (fw.real * fr2.real + fw.imag * fr2.imag),
+                                    n=fft_length, axis=1, workers=-1)[:, lags_in_range]
+
+                # Indices past a bead's own grid length hold the negative
+                # lags of the circular correlation
+                chunk_pairs = np.rint(pairs[:, lags_in_range]).astype(np.int64)
+                chunk_pairs[lags_in_range[None, :] >= chunk_lengths[:, None]] = 0
+
+            chunk_squared = r2_sums - 2 * position_corr
+
+            with np.errstate(invalid='ignore', divide='ignore'):
+                chunk_msd = np.where(chunk_pairs > 0, chunk_squared / chunk_pairs, np.nan)
+
+            # A zero lag can come out as a tiny negative number from rounding
+            chunk_msd = np.where(chunk_msd < 0, 0.0, chunk_msd)
+
+            msd[np.ix_(chunk, np.where(lag_mask)[0])] = chunk_msd
+            n_pairs[np.ix_(chunk, np.where(lag_mask)[0])] = chunk_pairs
+
+    return unique_ids, msd, n_pairs
@@ -0,0 +1,183 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+import numpy as np
+import pandas as pd
+
+def _lag_pairs(particle_ids, frames, lag):
+
+    """
+    Finds every pair of rows belonging to the same particle exactly one
+    lag apart. Rows sorted by particle ID and frame (as they are after
+    _format_vrpn) are searched directly; other rows, such as frame-major
+    .track.csv files, are sorted first.
+
+    RETURNS:
+        start (numpy.ndarray): the row at the beginning of each pair.
+        stop (numpy.ndarray): the row at the end of each pair.
+    """
+
+    particle_ids = np.asarray(particle_ids).astype(np.int64)
+    frames = np.asarray(frames).astype(np.int64)
+    if frames.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    # A single key per row, spaced so particles can't overlap
+    frames = frames - frames.min()
+    stride = frames.max() + lag + 1
+    key = particle_ids * stride + frames
+
+    # Sort the keys unless they already are, like _group_particles
+    if np.all(np.diff(key) > 0):
+        order = np.arange(key.size)
+    else:
+        order = np.argsort(key, kind='stable')
+        key = key[order]
+
+    # Look up the row one lag later for every row
+    stop = np.searchsorted(key, key + lag)
+    found = stop < key.size
+    found[found] = key[stop[found]] == key[found] + lag
+
+    return order[found], order[stop[found]]
+
+
+class _VanHoveAccumulator():
+
+    """
+    Accumulates the distribution of displacements at a set of lags over
+    any number of calls, using memory that depends only on the number of
+    lags and bins.
+
+    ARGUMENTS:
+        lag_frames (list): the frame lags at which displacements are taken.
+        bin_edges (numpy.ndarray): the edges of the displacement bins.
+            Displacements outside of them are counted separately.
+
+    NOTES:
+        1. The histogram pools the X and Y displacements, since the
+        self part of the van Hove correlation is the same along both axes
+        for an isotropic sample.
+        2. The raw moments of dx, dy, and r^2 = dx^2 + dy^2 are summed so
+        the mean, MSD, and non-Gaussian parameter can be calculated exactly
+        at the end.
+    """
+
+    def __init__(self, lag_frames, bin_edges):
+        self.lag_frames = np.asarray(lag_frames, dtype=np.int64)
+        self.bin_edges = np.asarray(bin_edges, dtype=np.float64)
+        n_lags, n_bins = len(self.lag_frames), len(self.bin_edges) - 1
+
+        self.counts = np.zeros((n_lags, n_bins), dtype=np.int64)
+        self.underflow = np.zeros(n_lags, dtype=np.int64)
+        self.overflow = np.zeros(n_lags, dtype=np.int64)
+
+        # Number of displacements and raw moment sums at each lag
+        self.n = np.zeros(n_lags, dtype=np.int64)
+        self.moments = {name: np.zeros(n_lags) for name in
+                        ['dx', 'dy', 'dx2', 'dy2', 'dx4', 'dy4', 'r2', 'r4']}
+
+
+    def add(self, particle_ids, frames, x, y, scale=1):
+
+        """
+        Adds the displacements of one set of tracks, in any row order.
+        Coordinates are multiplied by scale first, which
+        allows converting pixels to other units on the displacements only.
+        """
+
+        x = np.asarray(x)
+        y = np.asarray(y)
+        for i, lag in enumerate(self.lag_frames):
+            start, stop = _lag_pairs(particle_ids, frames, lag)
+            dx = (x[stop].astype(np.float64) - x[start]) * scale
+            dy = (y[stop].astype(np.float64) - y[start]) * scale
+
+            # Missing coordinates don't give a displacement
+            valid = ~(np.isnan(dx) | np.isnan(dy))
+            dx, dy = dx[valid], dy[valid]
+            r2 = dx**2 + dy**2
+
+            self.n[i] += dx.size
+            for name, values in [('dx', dx), ('dy', dy), ('dx2', dx**2), ('dy2', dy**2),
+                                 ('dx4', dx**4), ('dy4', dy**4), ('r2', r2), ('r4', r2**2)]:
+                self.moments[name][i] += values.sum()
+
+            # Bin both axes together. The last bin includes its right edge,
+            # just like numpy.histogram.
+            steps = np.concatenate([dx, dy])
+            bins = np.searchsorted(self.bin_edges, steps, side='right') - 1
+            bins[steps == self.bin_edges[-1]] = self.counts.shape[1] - 1
+            inside = (bins >= 0) & (bins < self.counts.shape[1])
+            self.counts[i] += np.bincount(bins[inside], minlength=self.counts.shape[1])
+            self.underflow[i] += np.count_nonzero(steps < self.bin_edges[0])
+            self.overflow[i] += np.count_nonzero(steps > self.bin_edges[-1])
+
+
+    def merge(self, other):
+
+        """Adds the accumulated results of another accumulator to this one."""
+
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        self.n += other.n
+        for name in self.moments:
+            self.moments[name] += other.moments[name]
+
+
+    def histogram(self, fps):
+
+        """
+        Returns the van Hove histogram as a long table with one row per
+        lag per bin, including the probability density of each bin.
+        """
+
+        n_lags, n_bins = self.counts.shape
+        widths = np.diff(self.bin_edges)
+
+        # Density over all binned and unbinned displacements of both axes
+        totals = 2 * self.n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            density = self.counts / (totals[:, None] * widths[None, :])
+
+        histogram = pd.DataFrame({'lag_frames': np.repeat(self.lag_frames, n_bins),
+                                  'tau': np.repeat(self.lag_frames / fps, n_bins),
+                                  'bin_left': np.tile(self.bin_edges[:-1], n_lags),
+                                  'bin_right': np.tile(self.bin_edges[1:], n_lags),
+                                  'bin_center': np.tile((self.bin_edges[:-1] + self.bin_edges[1:]) / 2, n_lags),
+                                  'count': self.counts.ravel(),
+                                  'density': density.ravel()})
+
+        return histogram
+
+
+    def statistics(self, fps):
+
+        """
+        Returns the moments of the displacements at each lag, including
+        the MSD and the non-Gaussian parameters.
+        """
+
+        m = self.moments
+        with np.errstate(invalid='ignore', divide='ignore'):
+            n = np.where(self.n > 0, self.n, np.nan)
+            mean_r2 = m['r2'] / n
+            mean_dx2 = m['dx2'] / n
+            mean_dy2 = m['dy2'] / n
+
+            statistics = pd.DataFrame({
+                'lag_frames': self.lag_frames,
+                'tau': self.lag_frames / fps,
+                'n': self.n,
+                'n_outside': self.underflow + self.overflow,
+                'mean_dx': m['dx'] / n,
+                'mean_dy': m['dy'] / n,
+                'msd': mean_r2,
+                'var_dx': mean_dx2 - (m['dx'] / n)**2,
+                'var_dy': mean_dy2 - (m['dy'] / n)**2,
+                # 2D non-Gaussian parameter, zero for Gaussian displacements
+                'alpha2': (m['r4'] / n) / (2 * mean_r2**2) - 1,
+                # 1D non-Gaussian parameter along each axis
+                'alpha2_x': (m['dx4'] / n) / (3 * mean_dx2**2) - 1,
+                'alpha2_y': (m['dy4'] / n) / (3 * mean_dy2**2) - 1})
+
+        return statistics
@@ -38,33 +38,31 @@ def _format_vrpn(data, fps, camera, magnification, units='um'):
     # Convert the frame numbers into seconds values using the FPS
     data['timestamp'] = data['frame'] * (1 / fps)
 
-    # Get rid of the microseconds column; we don't need it
-    data.drop(columns=['microseconds'], inplace=True)
+    # Get rid of the microseconds column; we don't need it. Files that have
+    # already been formatted once won't have it.
+    data.drop(columns=['microseconds'], inplace=True, errors='ignore')
 
     # Sort by the particle ID and frame number
     data.sort_values(by=['particle_id', 'frame'], inplace=True)
 
+    # Coordinates are left in pixels if any other unit is requested, in
+    # which case the camera information isn't needed
+    unit_factors = {'m': 1e-6, 'cm': 1e-4, 'mm': 1e-3, 'um': 1, 'nm': 1e3}
+    if units not in unit_factors:
+        return data
+
     # Pull the magnified pixel width using the camera and magnification values
     camera_info = _get_camera_info(camera=camera, magnification=magnification)
     magnified_pixel_width_um = camera_info['magnified_pixel_width_um']
 
     # Determine the conversion factor to be used on the coordinates based on
-    # the provided pixel argument
-    if units == 'm':
-        conversion_factor = magnified_pixel_width_um / 1e6
-    elif units == 'cm':
-        conversion_factor = magnified_pixel_width_um / 1e4
-    elif units == 'mm':
-        conversion_factor = magnified_pixel_width_um / 1e3
-    elif units == 'um':
-        conversion_factor = magnified_pixel_width_um
-    elif units == 'nm':
-        conversion_factor = magnified_pixel_width_um * 1e3
-    else:
-        conversion_factor = 1  # otherwise just return in pixels
+    # the provided units argument
+    conversion_factor = magnified_pixel_width_um * unit_factors[units]
 
-    # Apply this conversion factor to the coordinate data (X, Y, and Z)
+    # Apply this conversion factor to the coordinate data (X, Y, and Z),
+    # skipping any coordinate that wasn't loaded
     for column in ['x', 'y', 'z']:
-        data[column] = data[column] * conversion_factor
+        if column in data.columns:
+            data[column] = data[column] * conversion_factor
 
     return data
@@ -0,0 +1,84 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+from pathlib import Path
+import hashlib
+import json
+import os
+
+from ..utilities.hash_file import hash_file
+
+def _cache_path(vrpn_path):
+
+    """
+    Returns the path to the JSON file that records the processing state
+    of one VRPN. It sits next to the VRPN and shares its stem.
+    """
+
+    stem = Path(vrpn_path).name.split('.')[0]
+    return Path(vrpn_path).parent / f'{stem}.ptmr.json'
+
+
+def _load_cache(vrpn_path):
+
+    """
+    Loads the processing state of a VRPN, or an empty state if the VRPN
+    hasn't been processed before (or the state file can't be read).
+    """
+
+    path = _cache_path(vrpn_path)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+
+    cache.setdefault('hashes', {})
+    cache.setdefault('stages', {})
+
+    return cache
+
+
+def _save_cache(vrpn_path, cache):
+
+    """
+    Saves the processing state of a VRPN. The state is written to a
+    temporary file first so an interrupted run can't leave it half written.
+    """
+
+    path = _cache_path(vrpn_path)
+    temporary_path = path.with_suffix('.json.tmp')
+    with open(temporary_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(temporary_path, path)
+
+
+def _cached_file_hash(path, cache):
+
+    """
+    Returns the content hash of a file. The hash is only recalculated if
+    the file's size or modification time has changed since it was last
+    recorded in the cache.
+    """
+
+    stat = os.stat(path)
+    record = cache['hashes'].get(str(path))
+    if (record is not None) and (record['size'] == stat.st_size) and (record['mtime_ns'] == stat.st_mtime_ns):
+        return record['sha256']
+
+    digest = hash_file(path)
+    cache['hashes'][str(path)] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+
+    return digest
+
+
+def _stage_key(stage, input_hash, params):
+
+    """
+    Combines a stage name, the content hash of its input, and its
+    parameters into a single key. A stage only needs to be rerun when
+    this key changes.
+    """
+
+    payload = json.dumps({'stage': stage, 'input': input_hash, 'params': params},
+                         sort_keys=True, default=str)
+
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
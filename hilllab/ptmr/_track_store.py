@@ -0,0 +1,168 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+import numpy as np
+import pandas as pd
+import h5py
+
+# Columns stored as integers; everything else is stored as float32 except
+# the raw timestamp, which needs float64 to keep sub-second precision.
+_INTEGER_COLUMNS = ['particle_id', 'frame']
+_FLOAT64_COLUMNS = ['timestamp']
+
+# Rows per compressed chunk of each column
+_CHUNK_ROWS = 2**17
+
+def _write_track(data, path):
+
+    """
+    Writes tracking data to a columnar .track.h5 file.
+
+    Each column is its own typed, compressed dataset, so any subset of
+    columns can be read without touching the rest. Rows are sorted by
+    particle ID and frame, and the first row of every particle is stored
+    in an index so single particles can be read without reading the
+    whole file. Columns holding a single value (such as z, roll, pitch,
+    and yaw in 2D tracking) are stored as one attribute instead of a
+    full column.
+
+    ARGUMENTS:
+        data (pandas.DataFrame): the tracking data, with at least the
+            particle_id and frame columns.
+        path (string): the path of the .track.h5 file to write.
+    """
+
+    # Sort the rows so each particle is a contiguous block
+    data = data.sort_values(by=['particle_id', 'frame'], kind='stable')
+    particle_ids = data['particle_id'].to_numpy().astype(np.int32)
+
+    # Find the first row of every particle for the index
+    unique_ids, starts = np.unique(particle_ids, return_index=True)
+    offsets = np.append(starts, len(particle_ids)).astype(np.int64)
+
+    with h5py.File(path, 'w') as f:
+
+        # Remember the original column order and the number of rows
+        f.attrs['columns'] = [str(column) for column in data.columns]
+        f.attrs['n_rows'] = data.shape[0]
+
+        index = f.create_group('index')
+        index.create_dataset('particle_ids', data=unique_ids.astype(np.int32))
+        index.create_dataset('offsets', data=offsets)
+
+        columns = f.create_group('columns')
+        for column in data.columns:
+            values = data[column].to_numpy()
+
+            # Pick the storage type of this column
+            if column in _INTEGER_COLUMNS:
+                values = values.astype(np.int32)
+            elif column in _FLOAT64_COLUMNS:
+                values = values.astype(np.float64)
+            else:
+                values = values.astype(np.float32)
+
+            # Constant columns are stored as a single value
+            if (values.size > 0) and np.all(values == values[0]):
+                columns.attrs[column] = values[0]
+                continue
+
+            # Coordinates are close to random and barely compress, so they
+            # are stored contiguously, which is fastest to read. Empty
+            # columns can't be chunked, so they are stored the same way.
+            if (values.dtype == np.float32) or (values.size == 0):
+                columns.create_dataset(column, data=values)
+                continue
+
+            # IDs, frames, and timestamps compress very well once shuffled
+            columns.create_dataset(column, data=values, chunks=(min(values.size, _CHUNK_ROWS),),
+                                   compression='lzf', shuffle=True)
+
+
+def _read_track(path, columns=None, particles=None):
+
+    """
+    Reads tracking data from a .track.h5 file written by _write_track.
+
+    ARGUMENTS:
+        path (string): the path of the .track.h5 file.
+        columns (list): the columns to read. Defaults to every column.
+        particles (list): the particle IDs to read. Defaults to every
+            particle. IDs not present in the file are ignored.
+
+    RETURNS:
+        data (pandas.DataFrame): the requested columns and rows, sorted by
+            particle ID and frame.
+    """
+
+    with h5py.File(path, 'r') as f:
+
+        all_columns = list(f.attrs['columns'])
+        if columns is None:
+            columns = all_columns
+
+        # Find the blocks of rows belonging to the requested particles
+        if particles is None:
+            blocks = [(0, int(f.attrs['n_rows']))]
+        else:
+            unique_ids = f['index/particle_ids'][:]
+            offsets = f['index/offsets'][:]
+            positions = np.flatnonzero(np.isin(unique_ids, np.asarray(particles)))
+            blocks = _merge_blocks(offsets[positions], offsets[positions + 1])
+        n_rows = sum(stop - start for start, stop in blocks)
+
+        # Read each requested column, either from its dataset or by
+        # repeating its constant value
+        data = {}
+        for column in columns:
+            if column in f['columns']:
+                dataset = f['columns'][column]
+                if len(blocks) == 1:
+                    data[column] = dataset[blocks[0][0]:blocks[0][1]]
+                else:
+                    data[column] = np.concatenate([dataset[0:0]] + [dataset[start:stop] for start, stop in blocks])
+            elif column in f['columns'].attrs:
+                value = f['columns'].attrs[column]
+                data[column] = np.full(n_rows, value, dtype=np.asarray(value).dtype)
+            else:
+                raise KeyError(f"'{column}' is not a column of {path}")
+
+    return pd.DataFrame(data, columns=columns)
+
+
+def _merge_blocks(starts, stops):
+
+    """
+    Merges row blocks that touch each other so that neighbouring
+    particles are read in a single slice.
+    """
+
+    blocks = []
+    for start, stop in zip(starts.tolist(), stops.tolist()):
+        if blocks and (blocks[-1][1] == start):
+            blocks[-1] = (blocks[-1][0], stop)
+        else:
+            blocks.append((start, stop))
+
+    return blocks
+
+
+def _memmap_track_column(path, column):
+
+    """
+    Memory maps a column of a .track.h5 file so it can be used without
+    being read into memory. Only contiguous (uncompressed) columns can be
+    mapped; None is returned for any other column.
+    """
+
+    with h5py.File(path, 'r') as f:
+        dataset = f['columns'].get(column)
+        if (dataset is None) or (dataset.chunks is not None) or (dataset.compression is not None):
+            return None
+
+        # Empty datasets have no data on disk to map
+        offset = dataset.id.get_offset()
+        if offset is None:
+            return None
+
+        dtype, shape = dataset.dtype, dataset.shape
+
+    return np.memmap(path, mode='r', dtype=dtype, offset=offset, shape=shape)
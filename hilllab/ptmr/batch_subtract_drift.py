@@ -3,17 +3,42 @@ from pathlib import Path
 import os
 import pandas as pd
 from ..utilities.load_vrpn import load_vrpn
+from ._track_store import _read_track, _write_track
 from ._format_vrpn import _format_vrpn
 from .drift._subtract_linear_drift import _subtract_linear_drift
+from .drift._subtract_com_drift import _subtract_com_drift
 
-def batch_subtract_drift(files, fps, method='linear', drift_start_time=None, 
+def batch_subtract_drift(files, fps, method='linear', drift_start_time=None,
                          drift_end_time=None, skip_existing=True, pipeline='python'):
 
     """
-    Docstring for batch_subtract_drift
-    
-    :param vrpn_files: Description
-    :param method: Description
+    Applies drift subtraction to a batch of tracking files and saves the
+    drift subtracted data alongside each original file.
+
+    ARGUMENTS:
+        files (list): the paths to the tracking files (.track.h5 or legacy
+            .track.csv for the Python pipeline, or .vrpn.mat for the MATLAB
+            pipeline).
+        fps (int): the frame rate of the videos used for converting frame
+            numbers to timestamps.
+        method (string): the method of drift subtraction. Either 'linear'
+            (a separate linear fit for each bead) or 'com' (the shared
+            center-of-mass drift of all beads).
+        drift_start_time (float): start time of the window used for
+            computing drift (seconds). Defaults to the start of each video.
+        drift_end_time (float): end time of the window used for computing
+            drift (seconds). Defaults to the end of each video.
+        skip_existing (bool): whether files that already have a drift
+            subtracted output should be skipped.
+        pipeline (string): either 'python' or 'matlab'. Controls which
+            type of file is loaded and saved.
+
+    NOTES:
+        1. The drift subtracted data is saved in pixels, just like the data
+        it was calculated from, so it can be loaded and formatted the same
+        way by load_tracking_data.
+        2. The Python pipeline always saves a .drift.track.h5 file, even
+        when the input is a legacy .track.csv file.
     """
 
     # Iterate over every path in the list of VRPN files
@@ -22,45 +47,42 @@ def batch_subtract_drift(files, fps, method='linear', drift_start_time=None,
         # Generate the appropriate output path based on the pipeline
         stem = Path(path).name.split('.')[0]
         if pipeline == 'python':
-            drift_subtracted_path = Path(path).parent / f'{stem}.drift.track.csv'
-        
+            drift_subtracted_path = Path(path).parent / f'{stem}.drift.track.h5'
+
         elif pipeline == 'matlab':
             drift_subtracted_path = Path(path).parent / f'{stem}.evt.evt.mat'
 
         else:
             raise ValueError(f"'{pipeline}' is not a valid pipeline value")
-        
+
         # Check whether this output path exists, and skip if true and requested
         if (os.path.exists(drift_subtracted_path) and (skip_existing)):
             continue
-        
+
         # Load the file type depending on the pipeline
         if pipeline == 'matlab':
             data = load_vrpn(path)    # load from .vrpn.mat
+        elif Path(path).suffix == '.h5':
+            data = _read_track(path)  # load from .track.h5
         else:
-            data = pd.read_csv(path)  # load from .track.csv
-
-        # Format the VRPN data
-        data = _format_vrpn(data=data, fps=fps)
+            data = pd.read_csv(path)  # load from legacy .track.csv
 
-        # Determine the default drift window if none was provided
-        if drift_start_time is None:
-            drift_start_time = data['timestamp'].min()  # beginning of the video
+        # Format the VRPN data, keeping the coordinates in pixels
+        data = _format_vrpn(data=data, fps=fps, camera=None, magnification=None, units='px')
 
-        if drift_end_time is None:
-            drift_end_time = data['timestamp'].max()  # end of the video
-
-        # Apply the requested method of drift subtraction
+        # Apply the requested method of drift subtraction. A missing window
+        # bound means the drift is computed to that end of the video.
         if method == 'linear':
             drift_subtracted_data = _subtract_linear_drift(data, drift_start_time, drift_end_time)
+        elif method == 'com':
+            drift_subtracted_data = _subtract_com_drift(data, drift_start_time, drift_end_time)
         else:
             raise ValueError(f"'{method}' is not a valid value for method.")
-        
+
         # And finally export the files based on the pipeline
         if pipeline == 'matlab':
             pass
             # TODO implement this
 
         else:
-            drift_subtracted_data.to_csv(drift_subtracted_path, header=True, index=False)
-        
\ No newline at end of file
+            _write_track(drift_subtracted_data, drift_subtracted_path)
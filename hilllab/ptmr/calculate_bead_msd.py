@@ -5,6 +5,7 @@ import matplotlib.pyplot as plt
 from pathlib import Path
 
 from .load_tracking_data import load_tracking_data
+from ._calculate_msd_fft import _calculate_msd_fft, _log_spaced_lags
 from ..utilities.custom_axes import custom_axes
 
 def calculate_bead_msd(path, fps, camera, magnification, units='um', lag_frames=None, 
@@ -24,8 +25,9 @@ def calculate_bead_msd(path, fps, camera, magnification, units='um', lag_frames=
         magnification (float): the factor of magnification applied when
             this video was recorded. 
         units (string): the units that the MSD values should use
-        lag_frames (list): a list of frame indices which should be used
-            to calculate the MSD.
+        lag_frames (list or int): a list of frame lags at which the MSD
+            should be sampled. If an integer is provided, that many lags
+            spaced evenly on a log scale up to the longest track are used.
         plot (bool): whether a plot of the MSD over time should be created
         save_plot (bool): whether the MSD plot created should be saved 
             as a PNG to the same directory as the VRPN
@@ -33,67 +35,48 @@ def calculate_bead_msd(path, fps, camera, magnification, units='um', lag_frames=
             files are saved as MATLAB files compatible with legacy code
             or as CSV and Excel docs compatible with this Python library.
 
-    RETUNRS:
+    RETURNS:
         ensemble_msd (pandas.DataFrame): a dataframe containing the ensemble
             MSD, its standard deviation, and the timestamp. 
         msd (pandas.DataFrame): a dataframe containing the MSDs for each
             particle individually. 
 
     NOTES:
-        The ensemble MSD value is simply the average of the MSD of each
+        1. The ensemble MSD value is simply the average of the MSD of each
         individual bead at each provided lag frame. 
+        2. The MSD of each bead is calculated for every lag at once with
+        the FFT autocorrelation algorithm and then sampled at the requested
+        lags, so dense lag grids cost almost nothing extra. 
     """
 
-    # Set the lag_frames default values if none were provided
+    # Load the tracking data
+    vrpn_data = load_tracking_data(path=path, fps=fps, camera=camera, 
+                                   magnification=magnification, pipeline=pipeline,
+                                   units=units, columns=['x', 'y'])
+
+    # Set the lag_frames default values if none were provided. An integer
+    # requests that many log-spaced lags up to the longest track.
     if lag_frames is None:
         lag_frames = np.array([1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 1001])
+    elif np.isscalar(lag_frames):
+        frame_range = vrpn_data.groupby('particle_id')['frame'].agg(lambda f: f.max() - f.min())
+        max_lag = int(frame_range.max()) if vrpn_data.shape[0] else 0
+        lag_frames = _log_spaced_lags(max_lag=max_lag, n_lags=int(lag_frames))
     else:
         lag_frames = np.asarray(lag_frames)
 
-    # Load the tracking data
-    vrpn_data = load_tracking_data(path=path, fps=fps, camera=camera, 
-                                   magnification=magnification, pipeline=pipeline)
-
-    # Calculate a few random things
-    unique_ids = np.unique(vrpn_data['particle_id']).astype(int)  # all unique bead IDs
+    # Calculate the MSD of every bead at every lag in one pass
+    unique_ids, msd_values, _ = _calculate_msd_fft(particle_ids=vrpn_data['particle_id'].to_numpy(),
+                                                   frames=vrpn_data['frame'].to_numpy(),
+                                                   x=vrpn_data['x'].to_numpy(),
+                                                   y=vrpn_data['y'].to_numpy(),
+                                                   lag_frames=lag_frames)
 
-    # Generate a dataframe for storing the calculated MSD for each particle
-    # at each lag frame
-    msd = pd.DataFrame(columns=lag_frames)
-    msd['particle_id'] = unique_ids
-    msd = msd.set_index('particle_id')
+    # Store the calculated MSD for each particle at each lag frame
+    msd = pd.DataFrame(msd_values, columns=lag_frames,
+                       index=pd.Index(unique_ids.astype(int), name='particle_id'))
     n_beads = len(unique_ids)
 
-    # Iterate over every bead in the data
-    for bead_index, bead_id in enumerate(unique_ids):
-
-        # Pull just the data from this bead
-        bead_data = vrpn_data[vrpn_data['particle_id'] == bead_id]
-
-        # Calculate the number of frames in which this bead appears
-        n_frames = bead_data.shape[0]
-
-        # Pull the X and Y coordinate values
-        x = bead_data['x'].to_numpy()
-        y = bead_data['y'].to_numpy()
-
-        # Loop over each lag value to calculate the MSD
-        for lag_index, lag in enumerate(lag_frames):
-
-            # If this lag values is longer than the particle's lifetime
-            if lag >= n_frames:
-                continue  # skip
-
-            # Calculate distances traveled with X and Y coordinates
-            dx = x[lag:n_frames] - x[:n_frames - lag]
-            dy = y[lag:n_frames] - y[:n_frames - lag]
-
-            # Calculate squared displacement
-            squared_displacement = dx**2 + dy**2
-            
-            # Save this squared displacement value into the MSD dataframe
-            msd.loc[bead_index, lag] = np.mean(squared_displacement)
-
     # Calculate ensemble (all beads) MSD and standard deviation
     ensemble_msd_mean = msd.mean(axis=0)
     ensemble_msd_std = msd.std(axis=0)
@@ -110,7 +93,7 @@ def calculate_bead_msd(path, fps, camera, magnification, units='um', lag_frames=
                             title=Path(path).stem, subtitle=path)
         
         # Display every beads MSD as a subtle line
-        for i, row in msd.iterrows():
+        for i, (_, row) in enumerate(msd.iterrows()):
 
             # Only add label to first one for cleaner legend
             if i == 0:
@@ -1,9 +1,164 @@
 # Christopher Esther, Hill Lab, 2/12/2026
+from pathlib import Path
+import warnings
+import numpy as np
+import pandas as pd
 
-def calculate_ensemble_moduli(files):
+from .calculate_bead_msd import calculate_bead_msd
+from ._calculate_msd_fft import _log_spaced_lags
+from ._calculate_gser import _calculate_gser, _bootstrap_ensemble_msd
 
+def calculate_ensemble_moduli(files, fps, camera, magnification, bead_diameter=1,
+                              temperature=298.15, lag_frames=None, n_bootstrap=1000,
+                              confidence=0.95, save_path=None, seed=None, pipeline='python'):
+
+    """
+    Calculates the storage (G') and loss (G'') moduli of the sample in
+    each file from its ensemble MSD using the generalized Stokes-Einstein
+    relation. Replaces the legacy MATLAB calculation of the moduli.
+
+    ARGUMENTS:
+        files (list): the paths to the tracking files to be processed. A
+            single path may also be provided.
+        fps (int): the frame rate of the videos used for converting frame
+            numbers to timestamps.
+        camera (str): the three charcter code used for pulling the
+            pixel width of the camera for converting the coordiantes
+            into um from pixels.
+        magnification (float): the factor of magnification applied when
+            these videos were recorded.
+        bead_diameter (float): the diameter of the tracked beads in um.
+        temperature (float): the temperature of the sample in Kelvin.
+        lag_frames (list): the frame lags at which the MSD and moduli are
+            evaluated. The same lags are used for every file. Defaults to
+            31 lags spaced evenly on a log scale from 1 to 1000 frames.
+        n_bootstrap (int): the number of bead resamples used to calculate
+            the confidence intervals. Set to 0 to skip them.
+        confidence (float): the width of the confidence intervals
+        save_path (string): if provided, the results are saved to an H5
+            file at this path.
+        seed (int): an optional seed for the bootstrap resampling
+        pipeline (string): either 'python' or 'matlab'. Controls which
+            type of tracking file is loaded.
+
+    RETURNS:
+        moduli (pandas.DataFrame): a table with one row per file per lag
+            containing the lag time (tau), frequency (omega), ensemble MSD
+            (m^2), local log-slope (alpha), and |G*|, G', and G'' (Pa),
+            along with the bounds of their confidence intervals.
+
+    NOTES:
+        1. The MSD of every bead is calculated once per file. Everything
+        after that is vectorized across all lags and files at once.
+        2. Confidence intervals are percentiles of the moduli calculated
+        from ensemble MSDs of beads resampled with replacement. All
+        resamples of a file are computed as one matrix product over its
+        beads.
+        3. When saved, the numerical columns are stored as float32 and the
+        file paths are stored once in a separate 'files' table and
+        referenced by an integer code.
     """
-    Docstring for calculate_ensemble_moduli
+
+    # Allow a single path to be provided
+    if isinstance(files, (str, Path)):
+        files = [files]
+    files = [str(f) for f in files]
+
+    # Use one lag grid for every file so the results can be stacked
+    if lag_frames is None:
+        lag_frames = _log_spaced_lags(max_lag=1000, n_lags=31)
+    lag_frames = np.asarray(lag_frames)
+    tau = lag_frames / fps
+
+    bead_radius = (bead_diameter / 2) * 1e-6  # um to m
+    rng = np.random.default_rng(seed)
+
+    # Calculate the MSD of every bead in each file (um^2 to m^2)
+    bead_msds = []
+    for path in files:
+        _, bead_msd = calculate_bead_msd(path=path, fps=fps, camera=camera, magnification=magnification,
+                                         units='um', lag_frames=lag_frames, pipeline=pipeline)
+        bead_msds.append(bead_msd.to_numpy(dtype=np.float64).T * 1e-12)  # beads as rows
+
+    # Convert the MSDs of every file into moduli
+    moduli = _moduli_table(paths=files, bead_msds=bead_msds, lag_frames=lag_frames, tau=tau,
+                           bead_radius=bead_radius, temperature=temperature, n_bootstrap=n_bootstrap,
+                           confidence=confidence, rng=rng)
+
+    # Save the results, if requested
+    if save_path is not None:
+        _save_moduli(moduli, save_path)
+
+    return moduli
+
+
+def _moduli_table(paths, bead_msds, lag_frames, tau, bead_radius, temperature,
+                  n_bootstrap, confidence, rng):
+
     """
+    Converts the bead MSDs (in m^2, beads as rows) of one or more files
+    into a long table of moduli with one row per file per lag.
+    """
+
+    # Ensemble MSD of each file over the beads with a value at each lag
+    ensemble_msds = []
+    bootstrap_msds = []
+    for bead_msd in bead_msds:
+        present = ~np.isnan(bead_msd)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ensemble_msds.append(np.where(present, bead_msd, 0).sum(axis=0) / present.sum(axis=0))
+
+        if n_bootstrap > 0:
+            bootstrap_msds.append(_bootstrap_ensemble_msd(bead_msd, n_bootstrap=n_bootstrap, rng=rng))
+
+    # Convert every file's ensemble MSD at once (files x lags)
+    ensemble_msds = np.vstack(ensemble_msds)
+    gser = _calculate_gser(ensemble_msds, tau=tau, bead_radius=bead_radius, temperature=temperature)
+
+    # Format as a long table with one row per file per lag
+    n_files, n_lags = ensemble_msds.shape
+    moduli = pd.DataFrame({'path': np.repeat(paths, n_lags),
+                           'lag_frames': np.tile(lag_frames, n_files),
+                           'tau': np.tile(tau, n_files),
+                           'msd': ensemble_msds.ravel()})
+    for key, values in gser.items():
+        moduli[key] = values.ravel()
+
+    # Convert every bootstrap resample of every file at once
+    # (files x resamples x lags) and take percentiles over the resamples
+    if n_bootstrap > 0:
+        bootstrap_gser = _calculate_gser(np.stack(bootstrap_msds), tau=tau, bead_radius=bead_radius,
+                                         temperature=temperature)
+        percentiles = [50 * (1 - confidence), 50 * (1 + confidence)]
+        for key in ['g_star', 'g_prime', 'g_double_prime']:
+
+            # Lags that no bead reaches are all NaN, which is expected
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', category=RuntimeWarning)
+                lower, upper = np.nanpercentile(bootstrap_gser[key], percentiles, axis=1)
+            moduli[f'{key}_lower'] = lower.ravel()
+            moduli[f'{key}_upper'] = upper.ravel()
+
+    return moduli
+
+
+def _save_moduli(moduli, save_path):
+
+    """
+    Saves a moduli table to an H5 file with float32 values and the file
+    paths replaced by integer codes that index into a separate table.
+    """
+
+    # Replace the path strings with integer codes
+    codes, unique_paths = pd.factorize(moduli['path'])
+    compact = moduli.drop(columns=['path'])
+    compact = compact.astype({c: np.float32 for c in compact.columns if c != 'lag_frames'})
+    compact['lag_frames'] = compact['lag_frames'].astype(np.int32)
+    compact.insert(0, 'path_code', codes.astype(np.int32))
 
+    path_table = pd.DataFrame({'path_code': np.arange(len(unique_paths), dtype=np.int32),
+                               'path': unique_paths.astype(str)})
 
+    compact.to_hdf(save_path, key='moduli', mode='w', format='table', complevel=5,
+                   complib='blosc', data_columns=['path_code'])
+    path_table.to_hdf(save_path, key='files', mode='a', format='table')
@@ -0,0 +1,70 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+import numpy as np
+
+from .load_tracking_data import load_tracking_data
+from ._calculate_van_hove import _VanHoveAccumulator
+from ..utilities.print_progress_bar import print_progress_bar
+
+def calculate_van_hove(files, fps, camera, magnification, lag_frames=None,
+                       bin_edges=None, units='um', pipeline='python'):
+
+    """
+    Calculates the distribution of bead displacements (the self part of
+    the van Hove correlation) and its moments at a set of lags, pooled
+    over every bead in every file. Heterogeneous samples show up as
+    non-Gaussian, heavy-tailed distributions that the MSD alone hides.
+
+    ARGUMENTS:
+        files (list): the paths to the tracking files to be processed. A
+            single path may also be provided.
+        fps (int): the frame rate of the videos used for converting frame
+            numbers to timestamps.
+        camera (str): the three charcter code used for pulling the
+            pixel width of the camera for converting the coordiantes
+            into um from pixels.
+        magnification (float): the factor of magnification applied when
+            these videos were recorded.
+        lag_frames (list): the frame lags at which displacements are taken.
+            Defaults to 1, 10, and 100 frames.
+        bin_edges (numpy.ndarray): the edges of the displacement bins, in
+            the requested units. Defaults to 200 bins from -1 to 1.
+        units (string): the units of the displacements. Defaults to 'um',
+            but valid values include 'm', 'cm', 'mm', 'um', and 'nm'.
+        pipeline (string): either 'python' or 'matlab'. Controls which
+            type of tracking file is loaded.
+
+    RETURNS:
+        histogram (pandas.DataFrame): one row per lag per bin with the
+            count and probability density of the X and Y displacements.
+        statistics (pandas.DataFrame): one row per lag with the number of
+            displacements, their mean and variance along each axis, the
+            MSD, and the non-Gaussian parameter in 2D (alpha2) and along
+            each axis (alpha2_x, alpha2_y).
+
+    NOTES:
+        1. Displacements are only taken between frames exactly one lag
+        apart, so gaps in a track never create false displacements.
+        2. Files are streamed one at a time into fixed-size histograms and
+        moment sums, so memory does not grow with the number of files.
+        3. The 2D non-Gaussian parameter is <r^4> / (2 <r^2>^2) - 1, which
+        is zero for Brownian motion.
+    """
+
+    if isinstance(files, str):
+        files = [files]
+    if lag_frames is None:
+        lag_frames = [1, 10, 100]
+    if bin_edges is None:
+        bin_edges = np.linspace(-1, 1, 201)
+
+    accumulator = _VanHoveAccumulator(lag_frames=lag_frames, bin_edges=bin_edges)
+
+    # Add the displacements of each file in turn
+    for i, path in enumerate(files):
+        data = load_tracking_data(path=path, fps=fps, camera=camera, magnification=magnification,
+                                  pipeline=pipeline, units=units, columns=['x', 'y'])
+        accumulator.add(particle_ids=data['particle_id'].to_numpy(), frames=data['frame'].to_numpy(),
+                        x=data['x'].to_numpy(), y=data['y'].to_numpy())
+        print_progress_bar(progress=i+1, total=len(files), title='Calculating displacements')
+
+    return accumulator.histogram(fps), accumulator.statistics(fps)
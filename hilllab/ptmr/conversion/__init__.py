@@ -3,8 +3,8 @@
 
 """
 Functions used to convert data between the MATLAB pipeline and this
-newer Python pipeline. Focuses mainly on converting between VRPNs and 
-CSVs.
+newer Python pipeline. Focuses mainly on converting VRPNs and legacy
+CSVs into the binary .track.h5 files used by the Python pipeline.
 """
 
 __all__ = []
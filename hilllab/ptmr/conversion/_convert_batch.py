@@ -0,0 +1,50 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from ...utilities.print_progress_bar import print_progress_bar
+
+def _convert_batch(files, converter, n_workers=None, **kwargs):
+
+    """
+    Runs a single-file converter over many files in a process pool.
+    Each file is converted independently, so one unreadable file doesn't
+    stop the rest of the batch.
+
+    ARGUMENTS:
+        files (list): the paths of the files to convert.
+        converter (function): the converter to apply to each file. Must
+            be defined at the module level so it can be sent to the
+            worker processes.
+        n_workers (int): the number of processes. Defaults to the number
+            of CPUs; use 1 to convert in this process.
+        **kwargs: passed on to the converter.
+
+    RETURNS:
+        exceptions (list): a list of {path: exception} for every file that
+            could not be converted.
+    """
+
+    n_files = len(files)
+    exceptions = []
+
+    # Convert in this process when requested, which is easier to debug
+    if n_workers == 1:
+        for i, path in enumerate(files):
+            try:
+                converter(path, **kwargs)
+            except Exception as e:
+                exceptions.append({path: e})
+            print_progress_bar(progress=i+1, total=n_files, title='Converting files')
+
+        return exceptions
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = {executor.submit(converter, path, **kwargs): path for path in files}
+        for i, future in enumerate(as_completed(futures)):
+            try:
+                future.result()
+            except Exception as e:
+                exceptions.append({futures[future]: e})
+            print_progress_bar(progress=i+1, total=n_files, title='Converting files')
+
+    return exceptions
@@ -1,26 +1,29 @@
 # Christopher Esther, Hill Lab, 2/12/2026
 from ...utilities.walk_dir import walk_dir
 from .vrpn_to_csv import vrpn_to_csv
-from ...utilities.print_progress_bar import print_progress_bar
+from ._convert_batch import _convert_batch
 
-def batch_vrpn_to_csv(folder):
+def batch_vrpn_to_csv(folder, skip_existing=True, n_workers=None):
     
     """
-    Converts all VRPNs in a folder and its subfolders into CSVs.
+    Converts all VRPNs in a folder and its subfolders into CSVs. Files
+    are converted in parallel. New data should use batch_vrpn_to_track,
+    which writes the faster and smaller .track.h5 format.
 
     ARGUMENTS:
         folder (string): the path to the folder containing CSVs.
+        skip_existing (bool): when True, any CSVs that already exist
+            will be bypassed during conversion.
+        n_workers (int): the number of processes used for conversion.
+            Defaults to the number of CPUs; use 1 to convert serially.
+
+    RETURNS:
+        exceptions (list): a list of {path: exception} for every VRPN that
+            could not be converted.
     """
 
     # Find all VRPNs in the folder and its subdirectories
     all_vrpns = walk_dir(folder, extension=['vrpn.evt.evt.mat', 'vrpn.mat'])
-    n_vrpns = len(all_vrpns)
 
     # Convert all VRPNs to CSV files
-    for i, vrpn in enumerate(all_vrpns):
-
-        # Convert the file to a CSV
-        vrpn_to_csv(path=vrpn)
-        
-        # Print progress bar
-        print_progress_bar(progress=i+1, total=n_vrpns, title='Converting files')
+    return _convert_batch(all_vrpns, vrpn_to_csv, n_workers=n_workers, skip_existing=skip_existing)
@@ -0,0 +1,29 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+from ...utilities.walk_dir import walk_dir
+from .vrpn_to_track import vrpn_to_track
+from ._convert_batch import _convert_batch
+
+def batch_vrpn_to_track(folder, skip_existing=True, n_workers=None):
+
+    """
+    Converts all VRPNs in a folder and its subfolders into .track.h5
+    files, the default track format of the Python pipeline. Files are
+    converted in parallel.
+
+    ARGUMENTS:
+        folder (string): the path to the folder containing VRPNs.
+        skip_existing (bool): when True, any track files that already
+            exist will be bypassed during conversion.
+        n_workers (int): the number of processes used for conversion.
+            Defaults to the number of CPUs; use 1 to convert serially.
+
+    RETURNS:
+        exceptions (list): a list of {path: exception} for every VRPN that
+            could not be converted.
+    """
+
+    # Find all VRPNs in the folder and its subdirectories
+    all_vrpns = walk_dir(folder, extension=['vrpn.evt.evt.mat', 'vrpn.mat'])
+
+    # Convert all VRPNs to track files
+    return _convert_batch(all_vrpns, vrpn_to_track, n_workers=n_workers, skip_existing=skip_existing)
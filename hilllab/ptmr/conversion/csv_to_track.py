@@ -0,0 +1,39 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+from pathlib import Path
+import os
+import pandas as pd
+
+from .._track_store import _write_track
+
+def csv_to_track(path, skip_existing=True, remove_csv=False):
+
+    """
+    Converts a .track.csv or .drift.track.csv file to the equivalent
+    .track.h5 or .drift.track.h5 file.
+
+    ARGUMENTS:
+        path (string): the path to the CSV file
+        skip_existing (bool): when True, any track files that already
+            exist will be bypassed during conversion.
+        remove_csv (bool): when True, the CSV is deleted once it has been
+            converted.
+
+    RETURNS:
+        track_path (pathlib.Path): the path of the track file.
+    """
+
+    # Replace the .csv at the end of the file name with .h5
+    if Path(path).suffix != '.csv':
+        raise ValueError(f"'{path}' is not a CSV file")
+    track_path = Path(path).with_suffix('.h5')
+
+    # Check if a track file for this CSV already exists, and skip if so
+    # and requested.
+    if not ((os.path.exists(track_path)) and (skip_existing)):
+        data = pd.read_csv(path)
+        _write_track(data, track_path)
+
+    if remove_csv:
+        os.remove(path)
+
+    return track_path
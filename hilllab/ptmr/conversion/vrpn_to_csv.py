@@ -15,6 +15,9 @@ def vrpn_to_csv(path, skip_existing=True):
         skip_existing (bool): when True, any CSVs that already exist 
             will be bypassed during conversion so as not to create
             duplicate CSV files for the same VRPN.
+
+    RETURNS:
+        csv_path (pathlib.Path): the path of the CSV file.
     """
 
     # Determine the file path and suffix
@@ -30,7 +33,6 @@ def vrpn_to_csv(path, skip_existing=True):
     # If just a plain .vrpn.mat, then drift subtraction has not been applied
     # so it will be saved as a .track.csv. 
     if full_suffix == '.vrpn.mat':
-        data = load_vrpn(path)
         csv_path = Path(path).parent / f'{stem}.track.csv'
 
     # If it has the evt suffixes, then drift subtraction has been applied so 
@@ -38,13 +40,18 @@ def vrpn_to_csv(path, skip_existing=True):
     elif full_suffix == '.vrpn.evt.evt.mat':
         csv_path = Path(path).parent / f'{stem}.drift.track.csv'
 
+    else:
+        raise ValueError(f"Unable to interpret the file extension of '{path}'")
+
     # Check if a CSV file for this VRPN already exists, and skip if so
     # and requested.
     if (os.path.exists(csv_path)) and (skip_existing):
-        return
+        return csv_path
 
     # Load the VRPN
     data = load_vrpn(path)
     
     # Save the data to the CSV using the predtermined path
     data.to_csv(csv_path, header=True, index=False)
+
+    return csv_path
@@ -0,0 +1,48 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+from pathlib import Path
+import os
+
+from ...utilities.load_vrpn import load_vrpn
+from .._track_store import _write_track
+
+def vrpn_to_track(path, skip_existing=True):
+
+    """
+    Converts a VRPN file to a .track.h5 file, the binary track format
+    used by the Python pipeline.
+
+    ARGUMENTS:
+        path (string): the path to the VRPN file
+        skip_existing (bool): when True, any track files that already
+            exist will be bypassed during conversion.
+
+    RETURNS:
+        track_path (pathlib.Path): the path of the track file.
+    """
+
+    # Determine the file path and suffix
+    full_suffix = ''.join(Path(path).suffixes)
+    stem = Path(path).name.split('.')[0]
+
+    # Just like with CSVs, the suffix of the VRPN determines the suffix of
+    # the track file. A plain .vrpn.mat has not been drift subtracted.
+    if full_suffix == '.vrpn.mat':
+        track_path = Path(path).parent / f'{stem}.track.h5'
+
+    # If it has the evt suffixes, then drift subtraction has been applied
+    elif full_suffix == '.vrpn.evt.evt.mat':
+        track_path = Path(path).parent / f'{stem}.drift.track.h5'
+
+    else:
+        raise ValueError(f"Unable to interpret the file extension of '{path}'")
+
+    # Check if a track file for this VRPN already exists, and skip if so
+    # and requested.
+    if (os.path.exists(track_path)) and (skip_existing):
+        return track_path
+
+    # Load the VRPN and save it to the track file
+    data = load_vrpn(path)
+    _write_track(data, track_path)
+
+    return track_path
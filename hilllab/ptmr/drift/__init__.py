@@ -9,5 +9,6 @@ part of the bead's true movement.
 """
 
 from ._subtract_linear_drift import _subtract_linear_drift
+from ._subtract_com_drift import _subtract_com_drift
 
-__all__ = ['_subtract_linear_drift']
+__all__ = ['_subtract_linear_drift', '_subtract_com_drift']
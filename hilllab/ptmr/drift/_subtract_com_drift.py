@@ -0,0 +1,85 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+import numpy as np
+
+def _subtract_com_drift(data, drift_start_time=None, drift_end_time=None):
+
+    """
+    Remove center-of-mass (ensemble) drift from bead tracking data.
+
+    The drift at each frame is the cumulative sum of the average
+    frame-to-frame step of every bead present in both frames. This
+    trajectory is shared by all beads and is subtracted from each of them,
+    so drift does not need to be linear.
+
+    ARGUMENTS:
+        data (pandas.DataFrame): the data from the VRPN. Must be run through
+            the _format_vrpn function first.
+        drift_start_time (float): start time for computing drift (seconds).
+            Only steps at or after this time contribute to the drift. If
+            None, drift is computed from the beginning of the video.
+        drift_end_time (float): end time for computing drift (seconds).
+            Only steps at or before this time contribute to the drift. If
+            None, drift is computed to the end of the video.
+
+    RETURNS:
+        cleaned_data (pandas.DataFrame): the data from the VRPN with
+            the X and Y columns replaced by the cleaned, drift subtracted
+            data.
+
+    NOTES:
+        1. Drift is held constant outside of the provided time window.
+        2. Using steps instead of positions keeps beads entering or
+        leaving the field of view from shifting the center of mass.
+        3. Because the same drift is removed from every bead, any real
+        collective motion of the sample is removed as well.
+    """
+
+    # If there are no beads in this data, simply return the empty table
+    if data.shape[0] == 0:
+        return data
+
+    # Make sure each bead's rows are contiguous and in frame order
+    particle_ids = data['particle_id'].to_numpy()
+    frames = data['frame'].to_numpy().astype(np.int64)
+    id_steps = np.diff(particle_ids)
+    if not np.all((id_steps > 0) | ((id_steps == 0) & (np.diff(frames) > 0))):
+        data = data.iloc[np.lexsort((frames, particle_ids))]
+        particle_ids = data['particle_id'].to_numpy()
+        frames = data['frame'].to_numpy().astype(np.int64)
+
+    x = data['x'].to_numpy(dtype=np.float64)
+    y = data['y'].to_numpy(dtype=np.float64)
+    timestamps = data['timestamp'].to_numpy(dtype=np.float64)
+
+    # A step is the move of one bead between consecutive frames. Each one
+    # is assigned to the frame at which it ends.
+    dx = np.diff(x)
+    dy = np.diff(y)
+    is_step = (np.diff(particle_ids) == 0) & (np.diff(frames) == 1) & ~(np.isnan(dx) | np.isnan(dy))
+
+    # Only steps inside the drift window contribute
+    step_times = timestamps[1:]
+    if drift_start_time is not None:
+        is_step &= step_times >= drift_start_time
+    if drift_end_time is not None:
+        is_step &= step_times <= drift_end_time
+
+    # Average step of all beads at each frame
+    first_frame = frames.min()
+    n_frames = int(frames.max() - first_frame) + 1
+    step_frames = frames[1:][is_step] - first_frame
+    n_steps = np.bincount(step_frames, minlength=n_frames)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_dx = np.where(n_steps > 0, np.bincount(step_frames, weights=dx[is_step], minlength=n_frames) / n_steps, 0)
+        mean_dy = np.where(n_steps > 0, np.bincount(step_frames, weights=dy[is_step], minlength=n_frames) / n_steps, 0)
+
+    # Accumulate the average steps into the drift trajectory
+    drift_x = np.cumsum(mean_dx)
+    drift_y = np.cumsum(mean_dy)
+
+    # Subtract the drift at each row's frame from every bead
+    cleaned_data = data.reset_index(drop=True)
+    cleaned_data['x'] = x - drift_x[frames - first_frame]
+    cleaned_data['y'] = y - drift_y[frames - first_frame]
+
+    return cleaned_data
@@ -1,100 +1,103 @@
 # Christopher Esther, Hill Lab, 1/12/2026
 import numpy as np
-import pandas as pd
 
 def _subtract_linear_drift(data, drift_start_time=None, drift_end_time=None):
 
     """
     Remove linear drift from 3D bead tracking data.
 
-    For each bead in the dataset, this function fits a linear trend 
-    (drift) to its X and Y positions over the specified time window, and 
-    then subtracts that trend from the bead's trajectory. 
+    For each bead in the dataset, this function fits a linear trend
+    (drift) to its X and Y positions over the specified time window, and
+    then subtracts that trend from the bead's trajectory.
 
     ARGUMENTS:
         data (pandas.DataFrame): the data from the VRPN. Must be run through
             the _format_vrpn function first.
-        drift_start_time (float): start time for computing drift (seconds). 
+        drift_start_time (float): start time for computing drift (seconds).
             Only frames at or after this time are included in the drift fit.
-        drift_end_time (float): snd time for computing drift (seconds). 
+            If None, the fit starts at the beginning of each track.
+        drift_end_time (float): end time for computing drift (seconds).
             Only frames at or before this time are included in the drift fit.
+            If None, the fit runs to the end of each track.
 
     RETURNS:
         cleaned_data (pandas.DataFrame): the data from the VRPN with
             the X and Y columns replaced by the cleaned, drift subtracted
-            data. 
-        
+            data.
+
     NOTES:
-        1. Beads with fewer than three frames in the specified time window 
-        are skipped.
+        1. Beads with fewer than three frames in the specified time window
+        are skipped and left out of the returned data.
         2. Drift is removed independently for each bead.
-        3. This method assumes that drift is approximately linear over 
-        the chosen time range. For non-linear drift, other methods 
+        3. This method assumes that drift is approximately linear over
+        the chosen time range. For non-linear drift, other methods
         (e.g., center-of-mass) may be more appropriate.
+        4. The slope of every bead is calculated at once from its sums of
+        t, t^2, x, and t*x (the closed-form least squares solution), so no
+        per-bead tables are created.
     """
 
     # If there are no beads in this data, simply return the empty table
     if data.shape[0] == 0:
         return data
 
-    # Get unique particle IDs from the data so we can iterate on them
-    unique_ids = np.unique(data['particle_id'])
-
-    # A list for storing dataframes with the drift corrected data. They'll
-    # be concatenated at the end of the function. 
-    clean_bead_dfs = []
-
-    # Iterate over each bead in this data
-    for bead_id in unique_ids:
-        
-        # Grab just the data for this bead from the main table
-        bead_data = data[data['particle_id'] == bead_id]
-
-        # Shift time so first timestamp is zero.
-        # This does not change the drift slope, but it makes the linear fit's 
-        # intercept correspond to the bead's starting position. Without this, 
-        # subtracting the fit would introduce an artificial offset and shift 
-        # the entire trajectory.
-        t = bead_data['timestamp']
-        t0 = t.iloc[0]
-        t = t - t0  # this is the time array that we'll use now
-
-        # Find the indices of the rows inside the provided drift time window
-        time_mask = (t >= (drift_start_time - t0)) & (t <= (drift_end_time - t0))
-        drift_indices = np.where(time_mask)[0]
-
-        # Make sure there are at least two points left for the linear regression
-        if len(drift_indices) <= 2:
-            continue  # skip if less than two
-
-        # Extract the timestamp and X and Y coordinate data only within the 
-        # calculated drift indices
-        drift_start_index = drift_indices[0]
-        drift_end_index = drift_indices[-1] + 1
-        x_data = bead_data['x'][drift_start_index:drift_end_index]
-        y_data = bead_data['y'][drift_start_index:drift_end_index]
-        t_data = t[drift_start_index:drift_end_index]
-        
-        # Fit a linear regression to X and Y coordinates. The polyfit runtion
-        # returns the slope and intercept of the linear curve.
-        fit_x = np.polyfit(t_data, x_data, 1)
-        fit_y = np.polyfit(t_data, y_data, 1)
-
-        # Now we'll take this linear fit and subtract it from the coordinate data
-        x_clean = x_data - np.polyval(fit_x, t_data) + fit_x[1]
-        y_clean = y_data - np.polyval(fit_y, t_data) + fit_y[1]
-
-        # Save these clean coordinates to a new dataframe and append that
-        # dataframe to the main list
-        clean_bead_data = bead_data.copy()      # make a copy of the bead data
-        clean_bead_data['x'] = x_clean          # replcae the X and Y data
-        clean_bead_data['y'] = y_clean
-        clean_bead_dfs.append(clean_bead_data)  # save to list
-
-    # Once every bead has been cleaned, combine all the data back together
-    if len(clean_bead_data) == 1:
-        return clean_bead_data[0]
-    elif len(clean_bead_data) == 0:
+    # Make sure each bead's rows are contiguous and in time order. Data from
+    # _format_vrpn already is, in which case no copy is made here.
+    particle_ids = data['particle_id'].to_numpy()
+    timestamps = data['timestamp'].to_numpy(dtype=np.float64)
+    id_steps = np.diff(particle_ids)
+    if not np.all((id_steps > 0) | ((id_steps == 0) & (np.diff(timestamps) >= 0))):
+        data = data.iloc[np.lexsort((timestamps, particle_ids))]
+        particle_ids = data['particle_id'].to_numpy()
+        timestamps = data['timestamp'].to_numpy(dtype=np.float64)
+
+    # Find where each bead's rows begin
+    _, starts, counts = np.unique(particle_ids, return_index=True, return_counts=True)
+    bead_index = np.repeat(np.arange(len(starts)), counts)
+
+    # Shift time so first timestamp of each bead is zero.
+    # This does not change the drift slope, but it makes the linear fit's
+    # intercept correspond to the bead's starting position. Without this,
+    # subtracting the fit would introduce an artificial offset and shift
+    # the entire trajectory.
+    t = timestamps - timestamps[starts][bead_index]
+
+    x = data['x'].to_numpy(dtype=np.float64)
+    y = data['y'].to_numpy(dtype=np.float64)
+
+    # Find the rows inside the provided drift time window
+    in_window = ~(np.isnan(x) | np.isnan(y))
+    if drift_start_time is not None:
+        in_window &= timestamps >= drift_start_time
+    if drift_end_time is not None:
+        in_window &= timestamps <= drift_end_time
+
+    # Per-bead sums for the least squares fit, using only the window rows
+    def _bead_sums(values):
+        return np.add.reduceat(np.where(in_window, values, 0), starts)
+
+    n = _bead_sums(np.ones_like(t))
+    sum_t = _bead_sums(t)
+    sum_tt = _bead_sums(t**2)
+
+    # Closed-form slope of the linear fit for each bead
+    denominator = n * sum_tt - sum_t**2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope_x = (n * _bead_sums(t * x) - sum_t * _bead_sums(x)) / denominator
+        slope_y = (n * _bead_sums(t * y) - sum_t * _bead_sums(y)) / denominator
+
+    # Make sure there are at least three points left for the linear regression
+    keep_beads = (n > 2) & (denominator > 0)
+    keep_rows = keep_beads[bead_index]
+
+    # If no bead could be fit, return the data unchanged
+    if not np.any(keep_beads):
         return data
-    else:
-        return pd.concat(clean_bead_dfs, ignore_index=True)
+
+    # Subtract the fitted slope from every row of the beads being kept.
+    # The intercept is left in place so each bead keeps its starting position.
+    cleaned_data = data[keep_rows].reset_index(drop=True)
+    cleaned_data['x'] = (x - slope_x[bead_index] * t)[keep_rows]
+    cleaned_data['y'] = (y - slope_y[bead_index] * t)[keep_rows]
+
+    return cleaned_data
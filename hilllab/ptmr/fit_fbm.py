@@ -1,11 +1,184 @@
 # Christopher Esther, Hill Lab, 2/16/2026
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
 
-def fit_fbm():
+from .load_tracking_data import load_tracking_data
+from ._calculate_msd_fft import _calculate_msd_fft, _log_spaced_lags
+
+def fit_fbm(files, fps, camera, magnification, units='um', lag_frames=None, min_pairs=10,
+            n_workers=None, pipeline='python'):
 
     """
-    First the fractional Browning motion parameters (D_fBm and alpha)
-    from the MSD data of the particle. 
+    Fits the fractional Brownian motion parameters (D_fBm and alpha)
+    to the MSD data of every particle in every file, as well as to the
+    ensemble MSD of each file. The MSD is modeled as
+    MSD = 4 * D_fBm * tau^alpha for tracking in two dimensions.
 
     ARGUMENTS:
-        path
-    """
\ No newline at end of file
+        files (list): the paths to the tracking files to be processed. A
+            single path may also be provided.
+        fps (int): the frame rate of the videos used for converting frame
+            numbers to timestamps.
+        camera (str): the three charcter code used for pulling the
+            pixel width of the camera for converting the coordiantes
+            into um from pixels.
+        magnification (float): the factor of magnification applied when
+            these videos were recorded.
+        units (string): the units that the coordiates should use. D_fBm
+            is returned in units^2/s^alpha.
+        lag_frames (list): the frame lags at which the MSD is sampled for
+            the fit. Defaults to 31 lags spaced evenly on a log scale from
+            1 to 1000 frames.
+        min_pairs (int): lags for which a particle has fewer displacement
+            pairs than this are excluded from its fit.
+        n_workers (int): the number of processes used to fit files in
+            parallel. Defaults to the number of CPUs; use 1 to run serially.
+        pipeline (string): either 'python' or 'matlab'. Controls which
+            type of tracking file is loaded.
+
+    RETURNS:
+        bead_fits (pandas.DataFrame): the fit for every particle with the
+            columns path, particle_id, D_fbm, D_fbm_err, alpha, alpha_err,
+            and n_lags. Joins to the MSD table from calculate_bead_msd
+            by particle_id.
+        ensemble_fits (pandas.DataFrame): the fit to the ensemble MSD of
+            each file with the same columns (minus particle_id).
+
+    NOTES:
+        1. Each fit is a weighted least squares line through log(MSD) vs
+        log(tau), weighted by the number of displacement pairs at each lag.
+        The normal equations of every particle are solved together in
+        closed form rather than with one curve_fit call per particle.
+        2. Uncertainties are the standard errors from the weighted fit,
+        scaled by the residual variance. The error on D_fBm is propagated
+        from the error on the log-intercept.
+        3. The ensemble fit is weighted by the number of particles that
+        contribute to the ensemble MSD at each lag.
+    """
+
+    # Allow a single path to be provided
+    if isinstance(files, (str, Path)):
+        files = [files]
+    files = [str(f) for f in files]
+
+    # Set the default lags
+    if lag_frames is None:
+        lag_frames = _log_spaced_lags(max_lag=1000, n_lags=31)
+    lag_frames = np.asarray(lag_frames)
+
+    # The same arguments are passed for every file
+    arguments = [(path, fps, camera, magnification, units, lag_frames, min_pairs, pipeline)
+                 for path in files]
+
+    # Fit the files in parallel, if requested
+    if n_workers == 1 or len(files) == 1:
+        results = [_fit_fbm_file(*a) for a in arguments]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_fit_fbm_file, *zip(*arguments)))
+
+    # Combine the results from every file
+    bead_fits = pd.concat([r[0] for r in results], ignore_index=True)
+    ensemble_fits = pd.concat([r[1] for r in results], ignore_index=True)
+
+    return bead_fits, ensemble_fits
+
+
+def _fit_fbm_file(path, fps, camera, magnification, units, lag_frames, min_pairs, pipeline):
+
+    """
+    Calculates the MSD of every particle in one file and fits it. Kept at
+    the module level so it can be sent to worker processes.
+    """
+
+    # Load the data and calculate the MSD of every particle
+    data = load_tracking_data(path=path, fps=fps, camera=camera, magnification=magnification,
+                              pipeline=pipeline, units=units, columns=['x', 'y'])
+    unique_ids, msd, n_pairs = _calculate_msd_fft(particle_ids=data['particle_id'].to_numpy(),
+                                                  frames=data['frame'].to_numpy(),
+                                                  x=data['x'].to_numpy(),
+                                                  y=data['y'].to_numpy(),
+                                                  lag_frames=lag_frames)
+    tau = lag_frames / fps
+
+    # Fit every particle at once, weighted by its number of pairs
+    weights = np.where(n_pairs >= min_pairs, n_pairs, 0).astype(np.float64)
+    bead_fits = pd.DataFrame(_fit_power_law(msd, tau, weights))
+    bead_fits.insert(0, 'particle_id', unique_ids.astype(int))
+    bead_fits.insert(0, 'path', path)
+
+    # Fit the ensemble MSD, weighted by the number of contributing particles
+    present = ~np.isnan(msd) & (weights > 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ensemble_msd = np.where(present, msd, 0).sum(axis=0) / present.sum(axis=0)
+    ensemble_fits = pd.DataFrame(_fit_power_law(ensemble_msd[None, :], tau,
+                                                present.sum(axis=0)[None, :].astype(np.float64)))
+    ensemble_fits.insert(0, 'path', path)
+
+    return bead_fits, ensemble_fits
+
+
+def _fit_power_law(msd, tau, weights, dimensions=2):
+
+    """
+    Fits MSD = 2 * dimensions * D * tau^alpha to every row of an MSD array
+    with weighted least squares in log-log space.
+
+    ARGUMENTS:
+        msd (numpy.ndarray): the MSD curves (rows) at each lag (columns)
+        tau (numpy.ndarray): the lag times in seconds
+        weights (numpy.ndarray): the weight of each point, same shape as
+            the MSD array. Points with zero weight are excluded.
+        dimensions (int): the number of dimensions of the MSD
+
+    RETURNS:
+        fits (dict): arrays with one value per row for 'D_fbm',
+            'D_fbm_err', 'alpha', 'alpha_err', and 'n_lags'. NaN where a
+            row has fewer than two usable lags.
+    """
+
+    # Drop points that can't be put on a log scale
+    usable = (weights > 0) & np.isfinite(msd) & (msd > 0)
+    w = np.where(usable, weights, 0)
+    x = np.log(tau)[None, :]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        y = np.where(usable, np.log(np.where(usable, msd, 1)), 0)
+
+    # Weighted sums for the 2x2 normal equations of every row
+    s_w = w.sum(axis=1)
+    s_x = (w * x).sum(axis=1)
+    s_xx = (w * x**2).sum(axis=1)
+    s_y = (w * y).sum(axis=1)
+    s_xy = (w * x * y).sum(axis=1)
+    n_lags = usable.sum(axis=1)
+
+    # Closed-form solution of the normal equations
+    with np.errstate(invalid='ignore', divide='ignore'):
+        determinant = s_w * s_xx - s_x**2
+        alpha = (s_w * s_xy - s_x * s_y) / determinant
+        intercept = (s_xx * s_y - s_x * s_xy) / determinant
+
+        # Residual variance and the standard errors of the parameters
+        residuals = np.where(usable, y - (intercept[:, None] + alpha[:, None] * x), 0)
+        variance = (w * residuals**2).sum(axis=1) / (n_lags - 2)
+        alpha_err = np.sqrt(variance * s_w / determinant)
+        intercept_err = np.sqrt(variance * s_xx / determinant)
+
+    # Convert the intercept into the generalized diffusion coefficient
+    D_fbm = np.exp(intercept) / (2 * dimensions)
+    D_fbm_err = D_fbm * intercept_err
+
+    # Rows without at least two lags can't be fit
+    unfit = n_lags < 2
+    for values in [D_fbm, D_fbm_err, alpha, alpha_err]:
+        values[unfit] = np.nan
+
+    fits = {'D_fbm': D_fbm,
+            'D_fbm_err': D_fbm_err,
+            'alpha': alpha,
+            'alpha_err': alpha_err,
+            'n_lags': n_lags}
+
+    return fits
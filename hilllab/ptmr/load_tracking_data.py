@@ -1,37 +1,66 @@
 # Christopher Esther, Hill Lab, 2/16/2026
+from pathlib import Path
 import pandas as pd
 
 from ..utilities.load_vrpn import load_vrpn
 from ..ptmr._format_vrpn import _format_vrpn
+from ._track_store import _read_track
 
-def load_tracking_data(path, fps, camera, magnification, 
-                       pipeline='python', units='um'):
+def load_tracking_data(path, fps, camera, magnification,
+                       pipeline='python', units='um', columns=None, particles=None):
 
     """
-    Loads tracking data from either the MATLAB or Python pipeline and 
+    Loads tracking data from either the MATLAB or Python pipeline and
     applies all formatting expected by other functions in this module.
 
     ARGUMENTS:
-        fps (int): the frame rate of the VRPN used for converting frame 
-            numbers to timestamps. 
-        camera (str): the three charcter code used for pulling the 
-            pixel width of the camera for converting the coordiantes 
+        path (string): the path to the tracking file. For the Python
+            pipeline this is either a .track.h5 file or a legacy
+            .track.csv file.
+        fps (int): the frame rate of the VRPN used for converting frame
+            numbers to timestamps.
+        camera (str): the three charcter code used for pulling the
+            pixel width of the camera for converting the coordiantes
             into um from pixels.
         magnification (float): the factor of magnification applied when
-            this video was recorded. 
+            this video was recorded.
+        pipeline (string): either 'python' or 'matlab'. Controls which
+            type of file is loaded.
         units (string): the units that the coordiates should be returned
-            using. Defaults to 'um', but valid values include 'm', 'cm', 
+            using. Defaults to 'um', but valid values include 'm', 'cm',
             'mm', 'um', and 'nm'.
+        columns (list): the columns to load. The particle_id and frame
+            columns are always loaded. Defaults to every column.
+        particles (list): the particle IDs to load. Defaults to every
+            particle.
+
+    NOTES:
+        Selecting columns and particles only avoids reading the rest of the
+        file for .track.h5 files. Other files are read in full and then
+        filtered.
     """
 
+    # The ID and frame are needed for formatting, so always load them
+    if columns is not None:
+        columns = ['particle_id', 'frame'] + [c for c in columns if c not in ['particle_id', 'frame']]
+
     # Load the tracking data
     if pipeline == 'matlab':
         raw_data = load_vrpn(path)
+    elif Path(path).suffix == '.h5':
+        raw_data = _read_track(path, columns=columns, particles=particles)
     else:
-        vrpn_data = pd.read_csv(path)
+        raw_data = pd.read_csv(path, usecols=columns)
+
+    # Filter the rows and columns of files that can't be read selectively
+    if (pipeline == 'matlab') or (Path(path).suffix != '.h5'):
+        if columns is not None:
+            raw_data = raw_data[columns]
+        if particles is not None:
+            raw_data = raw_data[raw_data['particle_id'].isin(particles)]
 
     # Format the data
-    vrpn_data = _format_vrpn(raw_data, fps=fps, camera=camera, 
+    vrpn_data = _format_vrpn(raw_data, fps=fps, camera=camera,
                     magnification=magnification, units=units)
-    
+
     return vrpn_data
@@ -1,28 +1,252 @@
 # Christopher Esther, Hill Lab, 2/9/2026
 from pathlib import Path
-from .batch_subtract_drift import batch_subtract_drift
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
 
-def process_vrpns(folder, camera='GS3', magnification=40, bead_size=1, fps=120, long_video=False, 
-                  drift_subtraction='linear', pipeline='python'):
+from ..utilities.walk_dir import walk_dir
+from ..utilities.load_vrpn import load_vrpn
+from ..utilities.print_progress_bar import print_progress_bar
+from ._format_vrpn import _format_vrpn
+from ._track_store import _read_track, _write_track
+from .load_tracking_data import load_tracking_data
+from .drift._subtract_linear_drift import _subtract_linear_drift
+from .drift._subtract_com_drift import _subtract_com_drift
+from ._calculate_msd_fft import _calculate_msd_fft, _log_spaced_lags
+from .calculate_ensemble_moduli import _moduli_table, _save_moduli
+from ._pipeline_cache import _load_cache, _save_cache, _cached_file_hash, _stage_key
+
+def process_vrpns(folder, camera='GS3', magnification=40, bead_size=1, fps=120, long_video=False,
+                  drift_subtraction='linear', pipeline='python', temperature=298.15,
+                  n_workers=None, force=False):
 
     """
-    Docstring for process_VRPNs
+    Runs the full PTMR pipeline on every VRPN within a folder and its
+    subfolders. Each VRPN moves through a chain of stages, with each
+    stage's output saved next to the VRPN:
+
+        .vrpn.mat -> .track.h5 -> .drift.track.h5 -> .msd.h5 -> .moduli.h5
+
+    A stage is skipped when the content of its input and its parameters
+    are unchanged since it last ran, so rerunning the pipeline on a
+    growing dataset only processes what is new or changed.
 
     ARGUMENTS:
-        folder (string): highest level directory containing subdirectories 
+        folder (string): highest level directory containing subdirectories
             with VRPNs
         camera (string): camera identifier, expected 'GS3' or 'FL3'
-        bead_size (int): bead size in pixels
-        long_video (bool): True if long video, False otherwise
+        magnification (float): the factor of magnification applied when
+            the videos were recorded.
+        bead_size (float): bead diameter in micrometers, used for the
+            calculation of the moduli.
+        fps (int): the frame rate of the videos.
+        long_video (bool): True if long video, False otherwise. Long
+            videos have their MSD evaluated out to 10,000 frames instead
+            of 1,000.
         drift_subtraction (None or string): controls the method of drift
             subtraction applied to the VRPNs. If None, then no drift
-            subtraction will be applied. 
+            subtraction will be applied. Otherwise either 'linear' or 'com'.
         pipeline (string): either 'python' or 'matlab'. Controls whether
             files are saved as MATLAB files compatible with legacy code
-            or as CSV and Excel docs compatible with this Python library. 
+            or as CSV and Excel docs compatible with this Python library.
+            Only 'python' is currently supported.
+        temperature (float): the temperature of the samples in Kelvin.
+        n_workers (int): the number of processes used to process VRPNs in
+            parallel. Defaults to the number of CPUs; use 1 to run serially.
+        force (bool): if True, every stage is rerun regardless of the cache.
+
+    RETURNS:
+        status (pandas.DataFrame): one row per VRPN recording whether each
+            stage was 'run' or 'skipped', and any error encountered.
+
+    NOTES:
+        1. The state of each VRPN is recorded in a .ptmr.json file next to
+        it, holding the content hash of every file in its chain and the key
+        (input hash plus parameters) of every stage.
+        2. Content hashes are only recalculated when a file's size or
+        modification time changes.
+        3. Since a stage's key includes the hash of its input, rerunning a
+        stage with a different output automatically reruns everything
+        downstream of it.
+    """
+
+    if pipeline != 'python':
+        raise ValueError(f"'{pipeline}' is not a supported pipeline value for process_vrpns")
+
+    if drift_subtraction not in [None, 'linear', 'com']:
+        raise ValueError(f"'{drift_subtraction}' is not a valid value for drift_subtraction.")
+
+    # Find every VRPN in the folder and its subdirectories
+    vrpn_files = walk_dir(folder, extension='vrpn.mat')
+    n_vrpns = len(vrpn_files)
+
+    # Parameters of every stage. Anything that changes a stage's output
+    # belongs here so that changing it invalidates that stage.
+    max_lag = 10000 if long_video else 1000
+    params = {
+        'track': {},
+        'drift': {'fps': fps, 'method': drift_subtraction},
+        'msd': {'fps': fps, 'camera': camera, 'magnification': magnification,
+                'lag_frames': _log_spaced_lags(max_lag=max_lag, n_lags=31).tolist()},
+        'moduli': {'fps': fps, 'bead_size': bead_size, 'temperature': temperature,
+                   'n_bootstrap': 1000}
+    }
+    stages = _build_stages(drift_subtraction)
+
+    # Process the VRPNs, in parallel if requested
+    statuses = []
+    if n_workers == 1:
+        for i, path in enumerate(vrpn_files):
+            statuses.append(_process_vrpn(path, stages, params, force))
+            print_progress_bar(progress=i+1, total=n_vrpns, title='Processing VRPNs')
+
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(_process_vrpn, path, stages, params, force) for path in vrpn_files]
+            for i, future in enumerate(as_completed(futures)):
+                future.result()
+                print_progress_bar(progress=i+1, total=n_vrpns, title='Processing VRPNs')
+
+        # Files finish in any order, so collect them in the order they were found
+        statuses = [future.result() for future in futures]
+
+    return pd.DataFrame(statuses)
+
+
+def _build_stages(drift_subtraction):
+
+    """
+    Builds the dependency graph of the stages for one VRPN. Each stage
+    names the stage whose output it takes as input, and the stages are
+    listed in an order in which they can be run.
+    """
+
+    stages = [{'name': 'track', 'input': 'vrpn', 'suffix': '.track.h5'}]
+
+    # Without drift subtraction the MSD is calculated from the track directly
+    if drift_subtraction is not None:
+        stages.append({'name': 'drift', 'input': 'track', 'suffix': '.drift.track.h5'})
+        msd_input = 'drift'
+    else:
+        msd_input = 'track'
+
+    stages.append({'name': 'msd', 'input': msd_input, 'suffix': '.msd.h5'})
+    stages.append({'name': 'moduli', 'input': 'msd', 'suffix': '.moduli.h5'})
+
+    return stages
+
+
+def _process_vrpn(vrpn_path, stages, params, force=False):
+
+    """
+    Runs every stage for one VRPN, skipping any stage whose key is
+    unchanged and whose output still matches what was recorded. Kept at
+    the module level so it can be sent to worker processes.
     """
 
-    
+    status = {'path': vrpn_path}
+    stem = Path(vrpn_path).name.split('.')[0]
+    cache = _load_cache(vrpn_path)
+    outputs = {'vrpn': Path(vrpn_path)}
+
+    try:
+        for stage in stages:
+            name = stage['name']
+            input_path = outputs[stage['input']]
+            output_path = Path(vrpn_path).parent / f"{stem}{stage['suffix']}"
+            outputs[name] = output_path
+
+            # The key changes if the input's content or the parameters change
+            key = _stage_key(name, _cached_file_hash(input_path, cache), params[name])
+            record = cache['stages'].get(name)
+
+            # Skip if this stage already ran with this key and its output
+            # hasn't been modified or removed since
+            up_to_date = ((not force) and (record is not None) and (record['key'] == key)
+                          and output_path.exists()
+                          and (_cached_file_hash(output_path, cache) == record['output_hash']))
+            if up_to_date:
+                status[name] = 'skipped'
+                continue
+
+            # Run the stage and record its key and the hash of its output
+            _STAGE_FUNCTIONS[name](input_path, output_path, params[name])
+            cache['stages'][name] = {'key': key, 'output': str(output_path),
+                                     'output_hash': _cached_file_hash(output_path, cache)}
+            _save_cache(vrpn_path, cache)
+            status[name] = 'run'
+
+    except Exception as e:
+        status['error'] = repr(e)
+
+    return status
+
+
+def _stage_track(input_path, output_path, params):
+
+    """Converts a VRPN into a track file."""
+
+    data = load_vrpn(input_path)
+    _write_track(data, output_path)
+
+
+def _stage_drift(input_path, output_path, params):
+
+    """Subtracts drift from a track file, keeping the coordinates in pixels."""
+
+    data = _read_track(input_path)
+    data = _format_vrpn(data=data, fps=params['fps'], camera=None, magnification=None, units='px')
+
+    if params['method'] == 'linear':
+        data = _subtract_linear_drift(data)
+    else:
+        data = _subtract_com_drift(data)
+
+    _write_track(data, output_path)
+
+
+def _stage_msd(input_path, output_path, params):
+
+    """Calculates the MSD (um^2) of every bead in a track file."""
+
+    data = load_tracking_data(path=input_path, fps=params['fps'], camera=params['camera'],
+                              magnification=params['magnification'], units='um',
+                              columns=['x', 'y'])
+    lag_frames = np.asarray(params['lag_frames'])
+    unique_ids, msd, n_pairs = _calculate_msd_fft(particle_ids=data['particle_id'].to_numpy(),
+                                                  frames=data['frame'].to_numpy(),
+                                                  x=data['x'].to_numpy(),
+                                                  y=data['y'].to_numpy(),
+                                                  lag_frames=lag_frames)
+
+    # One row per bead and one column per lag
+    index = pd.Index(unique_ids.astype(np.int32), name='particle_id')
+    msd = pd.DataFrame(msd.astype(np.float32), index=index, columns=lag_frames)
+    n_pairs = pd.DataFrame(n_pairs.astype(np.int32), index=index, columns=lag_frames)
+
+    msd.to_hdf(output_path, key='msd', mode='w')
+    n_pairs.to_hdf(output_path, key='n_pairs', mode='a')
+
+
+def _stage_moduli(input_path, output_path, params):
+
+    """Calculates the moduli from the bead MSDs saved by the MSD stage."""
+
+    msd = pd.read_hdf(input_path, key='msd')
+    lag_frames = msd.columns.to_numpy().astype(int)
 
+    moduli = _moduli_table(paths=[str(input_path)], bead_msds=[msd.to_numpy(dtype=np.float64) * 1e-12],
+                           lag_frames=lag_frames, tau=lag_frames / params['fps'],
+                           bead_radius=(params['bead_size'] / 2) * 1e-6,
+                           temperature=params['temperature'], n_bootstrap=params['n_bootstrap'],
+                           confidence=0.95, rng=np.random.default_rng(0))
+    _save_moduli(moduli, output_path)
 
 
+# The function that runs each stage, by stage name
+_STAGE_FUNCTIONS = {
+    'track': _stage_track,
+    'drift': _stage_drift,
+    'msd': _stage_msd,
+    'moduli': _stage_moduli
+}
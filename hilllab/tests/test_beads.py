@@ -0,0 +1,181 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+import os
+import uuid as uuid_module
+import numpy as np
+import pytest
+import pandas as pd
+
+from ..beads.load_hdf import load_hdf
+from ..beads._bead_arrays import (PARAM_FEATURES, SUMMARY_FEATURES, _read_summary, _join_labels,
+                                  _summary_features, _position_arrays, _plate_arrays, _assign_splits,
+                                  _limit_lengths, _length_stats, _bucket_boundaries)
+from ..beads.eval.exported_models import NumpyModel, load_exported, parity_check, benchmark
+from ..beads.eval.ensemble import ensemble_predict, plate_predictions, _model_key
+from ..dynamics.batch_primary_analysis import batch_primary_analysis
+from ..dynamics.DynamicsDataset import DynamicsDataset
+from .test_dynamics import _write_dynamics_vrpn
+
+def _write_plate(tmp_path):
+    for name, seed in [('one', 0), ('two', 1)]:
+        _write_dynamics_vrpn(str(tmp_path / f'{name}.vrpn.mat'), n_beads=6, seed=seed)
+    _, h5_path = batch_primary_analysis(str(tmp_path), fps=30, pixel_width=0.5, n_workers=1)
+    return h5_path
+
+def test_bead_arrays_match_per_bead_groups(tmp_path):
+    h5_path = _write_plate(tmp_path)
+    groupby_summary, groupby_positions, *_ = load_hdf(h5_path)
+    uuids = list(groupby_summary.groups.keys())
+
+    # Label a few beads, one of them 'idk'
+    pd.DataFrame({'uuid': uuids[:5] + [uuids[0]],
+                  'classification': ['stuck', 'idk', 'transiting', 'oscillating', 'stuck', 'discard']}
+                 ).to_excel(tmp_path / 'labels.xlsx', index=False)
+
+    for data in [h5_path, DynamicsDataset.build([h5_path], tmp_path / 'plate.dynamics').folder]:
+        summary = _read_summary(data)
+        assert list(summary['uuid']) == uuids
+        labelled, labels = _join_labels(summary, tmp_path / 'labels.xlsx')
+        assert list(labelled['uuid']) == [uuids[0], uuids[2], uuids[3], uuids[4]]
+        assert list(labels) == ['stuck', 'transiting', 'oscillating', 'stuck']
+
+        # Features and positions of every bead, as the generators made them
+        params = _summary_features(labelled, PARAM_FEATURES)
+        features = _summary_features(labelled, SUMMARY_FEATURES)
+        values, row_splits = _position_arrays(data, labelled)
+        assert features.shape == (4, 27)
+        for i, uuid in enumerate(labelled['uuid']):
+            bead_summary = groupby_summary.get_group(uuid)
+            assert np.allclose(params[i], bead_summary[PARAM_FEATURES].values[0].astype('float32'), equal_nan=True)
+            assert np.allclose(features[i], bead_summary.iloc[:, 28:55].values[0].astype('float32'), equal_nan=True)
+
+            bead_positions = groupby_positions.get_group(uuid)
+            expected = np.stack([bead_positions['x'] - bead_summary['mean_x'].iloc[0],
+                                 bead_positions['y'] - bead_summary['mean_y'].iloc[0]], axis=-1).astype('float32')
+            assert np.allclose(values[row_splits[i]:row_splits[i + 1]], expected, atol=1e-4, equal_nan=True)
+
+def test_splits_are_stable_and_proportional():
+    uuids = [str(uuid_module.UUID(int=i)) for i in range(20000)]
+    splits = _assign_splits(uuids)
+    fractions = pd.Series(splits).value_counts(normalize=True)
+    assert fractions['train'] == pytest.approx(0.8, abs=0.02)
+    assert fractions['val'] == pytest.approx(0.1, abs=0.02)
+
+    # A bead keeps its split however the beads are ordered or grouped
+    order = np.random.default_rng(0).permutation(len(uuids))[:500]
+    assert (_assign_splits([uuids[i] for i in order]) == splits[order]).all()
+
+def test_plate_arrays_encode_labels(tmp_path):
+    h5_path = _write_plate(tmp_path)
+    uuids = list(_read_summary(h5_path)['uuid'])
+    pd.DataFrame({'uuid': uuids[:3], 'classification': ['discard', 'stuck', 'oscillating']}
+                 ).to_excel(tmp_path / 'labels.xlsx', index=False)
+
+    arrays = _plate_arrays(h5_path, tmp_path / 'labels.xlsx', 'position')
+    assert list(arrays['label']) == [3, 0, 2]
+    assert arrays['row_splits'].size == 4
+    assert _plate_arrays(h5_path, None, 'summary')['values'].shape == (12, 27)
+
+    pd.DataFrame({'uuid': uuids[:1], 'classification': ['wobbly']}).to_excel(tmp_path / 'bad.xlsx', index=False)
+    with pytest.raises(ValueError):
+        _plate_arrays(h5_path, tmp_path / 'bad.xlsx', 'param')
+
+def test_limit_lengths_downsamples_or_crops_long_beads():
+    counts = np.array([3, 0, 10, 7])
+    row_splits = np.concatenate([[0], np.cumsum(counts)])
+    values = np.arange(counts.sum() * 2, dtype=np.float32).reshape(-1, 2)
+    beads = [values[a:b] for a, b in zip(row_splits[:-1], row_splits[1:])]
+
+    limited, limited_splits = _limit_lengths(values, row_splits, max_length=4)
+    assert list(np.diff(limited_splits)) == [3, 0, 4, 4]
+    assert np.array_equal(limited[limited_splits[2]:limited_splits[3]], beads[2][::3])
+    assert np.array_equal(limited[limited_splits[3]:], beads[3][::2])
+
+    cropped, cropped_splits = _limit_lengths(values, row_splits, max_length=4, crop=True)
+    assert list(np.diff(cropped_splits)) == [3, 0, 4, 4]
+    assert np.array_equal(cropped[cropped_splits[2]:cropped_splits[3]], beads[2][:4])
+
+    assert _limit_lengths(values, row_splits)[0] is values
+
+def test_length_buckets_reduce_padding():
+    lengths = np.random.default_rng(0).lognormal(5, 1.5, 5000).astype(np.int64) + 1
+    stats = _length_stats(np.concatenate([[0], np.cumsum(lengths)]))
+    assert stats['count'] == 5000 and stats['max'] == lengths.max()
+    assert stats['median'] == np.median(lengths)
+
+    # Beads of each bucket are about as many, and padding shrinks
+    boundaries = _bucket_boundaries(lengths, n_buckets=8)
+    buckets = np.searchsorted(boundaries, lengths, side='right')
+    assert np.bincount(buckets).min() > 5000 / 8 * 0.8
+
+    def padded_rows(batches):
+        return sum(len(batch) * max(batch) for batch in batches)
+    random_batches = [lengths[i:i + 32] for i in range(0, lengths.size, 32)]
+    bucket_batches = [bucket[i:i + 32] for bucket in [lengths[buckets == b] for b in np.unique(buckets)]
+                      for i in range(0, bucket.size, 32)]
+    assert padded_rows(bucket_batches) < 0.5 * padded_rows(random_batches)
+
+class _FakeModel():
+    def __init__(self, weight):
+        self.weight = weight
+        self.calls = 0
+
+    def get_weights(self):
+        return [np.full((2, 3), self.weight, dtype=np.float32)]
+
+    def predict_on_batch(self, features):
+        self.calls += 1
+        return np.asarray(features)[:, :3] * self.weight
+
+def test_ensemble_predict_reads_each_batch_once():
+    batches = [(np.arange(12.).reshape(4, 3), np.arange(4)), (np.ones((2, 3)), np.array([7, 8]))]
+    models = [_FakeModel(1), _FakeModel(2)]
+
+    probs, labels = ensemble_predict(models, batches)
+    assert probs.shape == (2, 6, 3)
+    assert list(labels) == [0, 1, 2, 3, 7, 8]
+    assert np.array_equal(probs[1], 2 * np.vstack([batch[0] for batch in batches]))
+    assert [model.calls for model in models] == [2, 2]
+
+def test_plate_predictions_reuse_cached_probabilities(tmp_path):
+    data = tmp_path / 'Plate1.h5'
+    data.write_bytes(b'plate')
+    model = _FakeModel(3)
+    cached = np.random.default_rng(0).random((5, 4))
+    path = tmp_path / 'cache' / _model_key(model) / 'Plate1.h5-param.npz'
+    path.parent.mkdir(parents=True)
+    np.savez(path, probs=cached, source=np.array([os.path.getmtime(data), os.path.getsize(data)]))
+
+    probs = plate_predictions([model, model], str(data), 'param', cache_dir=tmp_path / 'cache')
+    assert np.array_equal(probs, np.stack([cached, cached]))
+    assert model.calls == 0
+    assert _model_key(model) != _model_key(_FakeModel(4))
+
+def _write_dense_export(path, rng):
+    sizes = [27, 16, 16, 4]
+    arrays = {}
+    for i, (n_in, n_out) in enumerate(zip(sizes[:-1], sizes[1:])):
+        arrays[f'W{i}'] = (0.2 * rng.normal(size=(n_in, n_out))).astype(np.float32)
+        arrays[f'b{i}'] = rng.normal(size=n_out).astype(np.float32)
+    np.savez(path, n_layers=3, activations=np.array(['relu', 'relu', 'softmax']), **arrays)
+    return arrays
+
+def test_numpy_model_matches_dense_layers(tmp_path):
+    rng = np.random.default_rng(0)
+    arrays = _write_dense_export(tmp_path / 'summary_model.npz', rng)
+    model = load_exported(tmp_path)[0]
+    assert isinstance(model, NumpyModel)
+
+    x = rng.normal(size=(50, 27)).astype(np.float32)
+    hidden = np.maximum(np.maximum(x @ arrays['W0'] + arrays['b0'], 0) @ arrays['W1'] + arrays['b1'], 0)
+    logits = hidden @ arrays['W2'] + arrays['b2']
+    expected = np.exp(logits) / np.exp(logits).sum(axis=1, keepdims=True)
+    assert np.allclose(model.predict(x, batch_size=16), expected, atol=1e-6)
+
+    # Parity with itself is exact, and labels give accuracies
+    batches = [(x[:32], np.zeros(32, dtype=int)), (x[32:], np.zeros(18, dtype=int))]
+    parity = parity_check(model, model, batches)
+    assert parity['agreement'] == 1 and parity['max_abs_diff'] == 0
+    assert parity['original_accuracy'] == parity['exported_accuracy']
+
+    throughput = benchmark({'numpy': model}, batches, repeats=1)
+    assert throughput['numpy'] > 0
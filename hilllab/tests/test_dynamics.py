@@ -0,0 +1,370 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.io import savemat
+from scipy.signal import savgol_filter
+from sklearn.decomposition import PCA
+
+from ..dynamics._segment_stats import _segment_stats
+from ..dynamics._segment_pca import _segment_pca, _segment_savgol
+from ..dynamics.primary_analysis import primary_analysis
+from ..dynamics.batch_primary_analysis import batch_primary_analysis
+from ..dynamics.compile_primary_analysis import compile_primary_analysis
+from ..dynamics._primary_store import _decode_instantaneous, _combine_primary
+from ..dynamics.DynamicsDataset import DynamicsDataset
+from ..beads.load_hdf import load_hdf
+from ..dynamics.batch_calculate_AFV import batch_calculate_AFV
+from ..dynamics.calculate_AFV import calculate_AFV
+from ..dynamics._calculate_AFV_batch import _calculate_AFV_batch
+from ..dynamics.dynamics_pipeline import dynamics_pipeline
+from ..dynamics.classify_GMM import classify_GMM
+from ..dynamics.inspect_h5 import inspect_h5
+
+def _write_dynamics_vrpn(path, n_beads=12, seed=0):
+    rng = np.random.default_rng(seed)
+
+    # Random walks of varied lengths and start frames, stored frame by
+    # frame like a real VRPN, with a few untracked (NaN) rows
+    rows = []
+    for particle_id in range(n_beads):
+        birth, n = rng.integers(0, 20), rng.integers(5, 80)
+        frames = np.arange(birth, birth + n)
+        x = np.cumsum(rng.normal(size=n)) + 300
+        y = np.cumsum(rng.normal(size=n)) + 300
+        for frame, xi, yi in zip(frames, x, y):
+            rows.append([1.7e9 + frame / 30, 0, particle_id, frame, xi, yi, 0, 0, 0, 0])
+    rows = np.array(rows)
+    rows = rows[np.lexsort((rows[:, 2], rows[:, 3]))]
+    rows[rng.choice(len(rows), 10, replace=False), 4:6] = np.nan
+
+    tracking = np.zeros((1, 1), dtype=[('spot3DSecUsecIndexFramenumXYZRPY', 'O')])
+    tracking[0, 0]['spot3DSecUsecIndexFramenumXYZRPY'] = rows
+    savemat(path, {'tracking': tracking}, long_field_names=True)
+
+def test_segment_stats_match_numpy():
+    rng = np.random.default_rng(0)
+    counts = np.array([3, 0, 1, 6, 2])
+    values = rng.normal(size=counts.sum())
+    values[-1] = np.nan
+
+    stats = _segment_stats(values, counts)
+    segments = np.split(values, np.cumsum(counts)[:-1])
+    for name, function in [('mean', np.mean), ('median', np.median), ('std', np.std),
+                           ('min', np.min), ('max', np.max)]:
+        expected = [function(segment) if segment.size else np.nan for segment in segments]
+        assert np.allclose(stats[name], expected, equal_nan=True)
+
+def test_primary_analysis_matches_per_particle_calculations(tmp_path):
+    path = str(tmp_path / 'sample.vrpn.mat')
+    _write_dynamics_vrpn(path)
+    fps, pixel_width = 30, 0.5
+
+    summary, instantaneous, metadata = primary_analysis(path, fps, pixel_width)
+    assert metadata['n_particles'] == 12
+    assert summary.shape[0] == 12
+    assert instantaneous.shape[0] == summary['lifetime_frames'].sum()
+
+    # Recalculate a few parameters one particle at a time
+    for _, particle in summary.iterrows():
+        rows = instantaneous[instantaneous['uuid_code'] == particle['uuid_code']]
+        x, y = rows['x'].to_numpy(np.float64), rows['y'].to_numpy(np.float64)
+        steps = np.hypot(np.diff(x), np.diff(y))
+        speed = steps * fps
+
+        # The instantaneous table is float32, so allow for its precision
+        assert particle['path_length'] == pytest.approx(steps.sum(), rel=1e-4)
+        assert particle['median_speed'] == pytest.approx(np.median(speed), rel=1e-3)
+        assert particle['std_x'] == pytest.approx(np.std(x), rel=1e-4)
+        assert particle['rg'] == pytest.approx(np.sqrt(np.mean((x - x.mean())**2 + (y - y.mean())**2)), rel=1e-4)
+        assert rows['total_distance'].iloc[-1] == pytest.approx(steps.sum(), rel=1e-4)
+        assert np.isnan(rows['speed'].iloc[0])
+        assert np.allclose(rows['speed'].to_numpy()[1:], speed, rtol=1e-3)
+
+    # Every instantaneous column is numeric, with no strings repeated per row
+    assert all(dtype.kind in 'if' for dtype in instantaneous.dtypes)
+
+def test_segment_pca_and_savgol_match_per_particle():
+    rng = np.random.default_rng(1)
+    counts = np.array([5, 12, 40, 7, 93, 5])
+    x = rng.normal(size=counts.sum()).cumsum()
+    y = 0.5 * x + rng.normal(size=counts.sum())
+    window_lengths = np.array([5, 5, 5, 7, 9, 5])
+
+    alignment_rad, alignment_strength, projected = _segment_pca(x, y, counts)
+    smoothed = _segment_savgol(projected, counts, window_lengths)
+
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    for i, (start, n) in enumerate(zip(starts, counts)):
+        xy = np.column_stack([x[start:start + n], y[start:start + n]])
+        pca = PCA(n_components=1).fit(xy)
+        axis = pca.components_[0]
+        expected = (xy - xy.mean(axis=0)) @ axis
+
+        assert alignment_rad[i] == pytest.approx(np.arctan2(axis[1], axis[0]) % np.pi)
+        assert alignment_strength[i] == pytest.approx(pca.explained_variance_ratio_[0])
+        assert np.allclose(projected[start:start + n], expected)
+        assert np.allclose(smoothed[start:start + n],
+                           savgol_filter(expected, window_lengths[i], 3, mode='interp'))
+
+def test_primary_h5_files_store_codes_and_compile(tmp_path):
+    for folder, seed in [('a', 0), ('b', 1)]:
+        (tmp_path / folder).mkdir()
+        _write_dynamics_vrpn(str(tmp_path / folder / f'{folder}1.vrpn.mat'), n_beads=4, seed=seed)
+        _write_dynamics_vrpn(str(tmp_path / folder / f'{folder}2.vrpn.mat'), n_beads=3, seed=seed + 10)
+    batch_primary_analysis(str(tmp_path), fps=30, pixel_width=0.5, compile=False, n_workers=2)
+
+    # Compiling renumbers the codes of each file so they stay unique
+    summary, instantaneous, metadata = compile_primary_analysis(str(tmp_path), save_file=False)
+    assert summary.shape[0] == 14
+    assert np.array_equal(summary['uuid_code'], np.arange(14))
+    assert np.array_equal(metadata['path_code'], np.arange(4))
+    assert np.array_equal(np.unique(instantaneous['uuid_code']), np.arange(14))
+    assert instantaneous['x'].dtype == np.float32
+
+    # Each bead's rows can be found again by UUID, and its path by code
+    decoded = _decode_instantaneous(instantaneous, summary)
+    groups = decoded.groupby('uuid', observed=True)
+    for _, bead in summary.iterrows():
+        rows = groups.get_group(bead['uuid'])
+        assert rows.shape[0] == bead['lifetime_frames']
+        assert metadata.loc[bead['path_code'], 'path'] == bead['path']
+
+def test_batch_primary_analysis_skips_current_partials(tmp_path):
+    for name, seed in [('one', 0), ('two', 1)]:
+        _write_dynamics_vrpn(str(tmp_path / f'{name}.vrpn.mat'), n_beads=3, seed=seed)
+
+    def modified_times():
+        return {name: os.stat(tmp_path / f'{name}.primary.h5').st_mtime_ns for name in ['one', 'two']}
+
+    # Every VRPN gets a partial file, which are compiled together
+    _, h5_path = batch_primary_analysis(str(tmp_path), fps=30, pixel_width=0.5, n_workers=1)
+    first = modified_times()
+    assert pd.read_hdf(h5_path, key='summary').shape[0] == 6
+
+    # Nothing is reanalyzed on a rerun, and only a changed VRPN afterwards
+    batch_primary_analysis(str(tmp_path), fps=30, pixel_width=0.5, n_workers=1)
+    assert modified_times() == first
+    os.utime(tmp_path / 'two.vrpn.mat', ns=(first['two'] + 10**9, first['two'] + 10**9))
+    batch_primary_analysis(str(tmp_path), fps=30, pixel_width=0.5, n_workers=1)
+    second = modified_times()
+    assert second['one'] == first['one']
+    assert second['two'] != first['two']
+    assert pd.read_hdf(h5_path, key='summary').shape[0] == 6
+
+def test_batch_primary_analysis_drops_vrpns_that_become_empty(tmp_path):
+    subfolder = tmp_path / 'plate'
+    subfolder.mkdir()
+    for name, seed in [('one', 0), ('two', 1)]:
+        _write_dynamics_vrpn(str(subfolder / f'{name}.vrpn.mat'), n_beads=3, seed=seed)
+    _, h5_path = batch_primary_analysis(str(tmp_path), fps=30, pixel_width=0.5, n_workers=1)
+    assert pd.read_hdf(h5_path, key='summary').shape[0] == 6
+
+    # Reanalyzing a VRPN without beads removes its old partial file
+    tracking = np.zeros((1, 1), dtype=[('spot3DSecUsecIndexFramenumXYZRPY', 'O')])
+    tracking[0, 0]['spot3DSecUsecIndexFramenumXYZRPY'] = np.zeros((0, 10))
+    savemat(str(subfolder / 'two.vrpn.mat'), {'tracking': tracking}, long_field_names=True)
+    newer = os.stat(subfolder / 'two.primary.h5').st_mtime_ns + 10**9
+    os.utime(subfolder / 'two.vrpn.mat', ns=(newer, newer))
+    _, h5_path = batch_primary_analysis(str(tmp_path), fps=30, pixel_width=0.5, n_workers=1)
+    assert not (subfolder / 'two.primary.h5').exists()
+    assert pd.read_hdf(h5_path, key='summary').shape[0] == 3
+    assert pd.read_hdf(subfolder / 'plate.h5', key='summary').shape[0] == 3
+
+def test_batch_AFV_matches_per_bead_calculation(tmp_path):
+    _write_dynamics_vrpn(str(tmp_path / 'sample.vrpn.mat'), n_beads=8)
+    _, h5_path = batch_primary_analysis(str(tmp_path), fps=30, pixel_width=0.5, n_workers=1)
+
+    # Small chunks split beads across chunks, which must not change anything
+    afv = pd.read_hdf(batch_calculate_AFV(h5_path, n_workers=2, chunksize=50), key='afv')
+    summary = pd.read_hdf(h5_path, key='summary')
+    instantaneous = pd.read_hdf(h5_path, key='instantaneous')
+    assert list(afv['uuid']) == list(summary['uuid'])
+
+    for _, row in afv.iterrows():
+        bead = instantaneous[instantaneous['uuid_code'] == row['uuid_code']]
+        expected = calculate_AFV(position_data=bead, fps=30)
+        for name, value in expected.items():
+            assert row[name] == pytest.approx(np.nan if value is None else value, nan_ok=True)
+
+def test_AFV_of_synthetic_sinusoids():
+    fps = 30
+    beads = [(1.5, 300, 5), (3, 200, 8), (0.75, 600, 4)]  # frequency, length, amplitude
+
+    pca, speed = [], []
+    for frequency, n, amplitude in beads:
+        t = np.arange(n) / fps
+        pca.append(amplitude * np.sin(2 * np.pi * frequency * t))
+        speed.append(np.abs(2 * np.pi * frequency * amplitude * np.cos(2 * np.pi * frequency * t)))
+    counts = [n for _, n, _ in beads] + [3]
+    afv = _calculate_AFV_batch(np.concatenate(pca + [np.zeros(3)]), np.concatenate(speed + [np.zeros(3)]),
+                               counts=counts, fps=fps)
+
+    for i, (frequency, n, amplitude) in enumerate(beads):
+        # The frequency resolution is the frame rate over the padded length
+        padded_length = 1 << (n - 1).bit_length()
+        assert afv['frequency'][i] == pytest.approx(frequency, abs=fps / padded_length)
+
+        # Peak to peak amplitude, up to the sampling of the peaks
+        assert afv['amplitude_abs'][i] == pytest.approx(2 * amplitude, rel=0.06)
+        assert afv['amplitude_mean'][i] == pytest.approx(2 * amplitude, rel=0.06)
+
+        # The mean speed of a sinusoid over whole strokes is 4 A f
+        for column in ['velocity_up_mean', 'velocity_down_mean']:
+            assert afv[column][i] == pytest.approx(4 * amplitude * frequency, rel=0.05)
+
+    # A bead too short to have peaks has no amplitude or frequency
+    assert np.isnan(afv['amplitude_abs'][3]) and np.isnan(afv['frequency'][3])
+
+def test_compile_primary_analysis_streams_and_reports_errors(tmp_path):
+    for folder, seed in [('a', 0), ('b', 1)]:
+        (tmp_path / folder).mkdir()
+        _write_dynamics_vrpn(str(tmp_path / folder / f'{folder}.vrpn.mat'), n_beads=4, seed=seed)
+    batch_primary_analysis(str(tmp_path), fps=30, pixel_width=0.5, compile=False, n_workers=1)
+
+    # An H5 file that isn't a primary analysis is reported, not compiled
+    pd.DataFrame({'x': [1.0]}).to_hdf(tmp_path / 'other.h5', key='other')
+    expected = compile_primary_analysis(str(tmp_path), save_file=False)
+    compiled_path, exceptions = compile_primary_analysis(str(tmp_path), save_file=True)
+    assert len(exceptions) == 1
+    assert isinstance(exceptions[0][str(tmp_path / 'other.h5')], KeyError)
+
+    # Streaming gives the same tables as compiling in memory
+    for key, table in zip(['summary', 'instantaneous', 'metadata'], expected):
+        pd.testing.assert_frame_equal(pd.read_hdf(compiled_path, key=key).reset_index(drop=True), table)
+
+def test_dynamics_dataset_reads_single_beads(tmp_path):
+    for name, seed in [('one', 0), ('two', 1), ('three', 2)]:
+        _write_dynamics_vrpn(str(tmp_path / f'{name}.vrpn.mat'), n_beads=5, seed=seed)
+    batch_primary_analysis(str(tmp_path), fps=30, pixel_width=0.5, compile=False, n_workers=1)
+    partials = [str(tmp_path / f'{name}.primary.h5') for name in ['one', 'two', 'three']]
+    summary, instantaneous, metadata = _combine_primary(
+        [(pd.read_hdf(path, key='summary'), pd.read_hdf(path, key='instantaneous'),
+          pd.read_hdf(path, key='metadata')) for path in partials])
+
+    # Build from two files, then add the third, with small chunks
+    dataset = DynamicsDataset.build(partials[:2], tmp_path / 'plate.dynamics', chunksize=40)
+    dataset.add(partials[2:], chunksize=40)
+    dataset = DynamicsDataset(tmp_path / 'plate.dynamics')
+    assert len(dataset) == 15
+    assert dataset.metadata.shape[0] == 3
+
+    # Every bead reads back exactly its own rows, by UUID or by code
+    for _, bead in summary.iterrows():
+        expected = instantaneous[instantaneous['uuid_code'] == bead['uuid_code']].reset_index(drop=True)
+        pd.testing.assert_frame_equal(dataset.get_bead(bead['uuid']), expected)
+        pd.testing.assert_frame_equal(dataset.get_bead(int(bead['uuid_code'])), expected)
+    pd.testing.assert_series_equal(dataset.get_summary(summary['uuid'][7]), summary.iloc[7])
+
+    # load_hdf accepts the dataset folder too
+    groupby_summary, groupby_positions, _, bounds = load_hdf(str(tmp_path / 'plate.dynamics'))
+    uuid = list(groupby_summary.groups.keys())[3]
+    assert groupby_positions.get_group(uuid).shape[0] == groupby_summary.get_group(uuid)['lifetime_frames'].iloc[0]
+    assert bounds['x'] == pytest.approx(instantaneous['x'].max())
+
+def test_dynamics_pipeline_only_processes_new_and_changed_vrpns(tmp_path):
+    data = tmp_path / 'plate'
+    data.mkdir()
+    for name, seed in [('one', 0), ('two', 1)]:
+        _write_dynamics_vrpn(str(data / f'{name}.vrpn.mat'), n_beads=8, seed=seed)
+    dataset_path = tmp_path / 'plate.dynamics'
+
+    dataset = dynamics_pipeline(str(data), fps=30, pixel_width=0.5, dataset_path=dataset_path, n_workers=1)
+    assert len(dataset) == 16
+    assert dataset.summary['cluster'].notna().all()
+    first_summary = dataset.summary.copy()
+    model_time = os.path.getmtime(dataset_path / 'gmm.pkl')
+
+    # AFV values match the single bead calculation
+    bead = dataset.summary.iloc[5]
+    expected = calculate_AFV(dataset.get_bead(bead['uuid']), fps=30)
+    assert np.allclose([bead[key] for key in expected], list(expected.values()), equal_nan=True)
+
+    # Nothing is processed again
+    dataset = dynamics_pipeline(str(data), fps=30, pixel_width=0.5, dataset_path=dataset_path, n_workers=1)
+    pd.testing.assert_frame_equal(dataset.summary, first_summary)
+
+    # A new VRPN only adds its own beads, labelled with the saved model
+    _write_dynamics_vrpn(str(data / 'three.vrpn.mat'), n_beads=5, seed=2)
+    dataset = dynamics_pipeline(str(data), fps=30, pixel_width=0.5, dataset_path=dataset_path, n_workers=1)
+    assert len(dataset) == 21
+    pd.testing.assert_frame_equal(dataset.summary.iloc[:16], first_summary)
+    assert os.path.getmtime(dataset_path / 'gmm.pkl') == model_time
+    assert dataset.summary['cluster'].notna().all()
+
+    # A changed VRPN has its beads replaced, and the dataset reopens the same
+    _write_dynamics_vrpn(str(data / 'one.vrpn.mat'), n_beads=3, seed=3)
+    dataset = dynamics_pipeline(str(data), fps=30, pixel_width=0.5, dataset_path=dataset_path, n_workers=1)
+    assert len(dataset) == 16
+    assert dataset.metadata['path'].str.endswith('one.vrpn.mat').sum() == 1
+    assert dataset.summary['uuid_code'].is_unique
+    reopened = DynamicsDataset(dataset_path)
+    pd.testing.assert_frame_equal(reopened.summary, dataset.summary)
+    uuid = dataset.summary['uuid'].iloc[-1]
+    assert reopened.get_bead(uuid).shape[0] == dataset.get_summary(uuid)['lifetime_frames']
+
+def test_classify_GMM_labels_clusters_by_their_features(tmp_path):
+    rng = np.random.default_rng(0)
+
+    # Three well separated groups of beads, listed out of label order
+    groups = []
+    for label, speed, displacement in [('transiting', 5.0, 50.0), ('stuck', 0.1, 0.2), ('oscillating', 2.0, 1.0)]:
+        n = 200
+        groups.append(pd.DataFrame({
+            'displacement': rng.normal(displacement, displacement / 20, n),
+            'straightness': rng.normal(0.5, 0.05, n), 'circular_variance': rng.normal(0.5, 0.05, n),
+            'bb_area': rng.normal(10, 1, n), 'mean_speed': rng.normal(speed, speed / 20, n),
+            'mean_acceleration': rng.normal(1, 0.1, n), 'expected': label}))
+    summary = pd.concat(groups, ignore_index=True).sample(frac=1, random_state=0).reset_index(drop=True)
+    summary['path_code'] = np.arange(summary.shape[0]) % 4
+    summary.loc[3, 'mean_speed'] = np.nan
+    h5_path = str(tmp_path / 'summary.h5')
+    summary.to_hdf(h5_path, key='summary', format='table', data_columns=['path_code'])
+
+    # Fit on a stratified subsample, caching the model
+    model_path = str(tmp_path / 'gmm.pkl')
+    labelled, _ = classify_GMM(h5_path, sample_size=150, model_path=model_path, chunksize=64)
+    complete = labelled['mean_speed'].notna()
+    assert (labelled.loc[complete, 'cluster'] == labelled.loc[complete, 'expected']).all()
+    assert pd.isna(labelled.loc[3, 'cluster'])
+    weights = labelled.loc[complete, ['stuck_cluster_weight', 'oscillating_cluster_weight',
+                                      'transiting_cluster_weight']]
+    assert np.allclose(weights.sum(axis=1), 1)
+
+    # The cached model is reused, and chunking doesn't change the labels
+    model_time = os.path.getmtime(model_path)
+    relabelled, pivot = classify_GMM(h5_path, identifier='path_code', model_path=model_path)
+    assert os.path.getmtime(model_path) == model_time
+    pd.testing.assert_frame_equal(relabelled, labelled)
+    assert pivot.to_numpy().sum() == complete.sum()
+
+def test_inspect_h5_reads_only_stored_attributes(tmp_path):
+    for name, seed in [('one', 0), ('two', 1)]:
+        _write_dynamics_vrpn(str(tmp_path / f'{name}.vrpn.mat'), n_beads=6, seed=seed)
+    _, h5_path = batch_primary_analysis(str(tmp_path), fps=30, pixel_width=0.5, n_workers=1)
+
+    file_info = inspect_h5(h5_path)
+    assert file_info['# Beads'] == pd.read_hdf(h5_path, key='summary').shape[0] == 12
+    assert file_info['# VRPNs Compiled'] == 2
+    assert file_info['# Parent Folders'] == 1
+    assert file_info['# Instantaneous Rows'] == pd.read_hdf(h5_path, key='instantaneous').shape[0]
+    assert file_info['Bead Columns'] == 'codes'
+
+def test_dynamics_pipeline_reruns_without_duplicating_beads(tmp_path):
+    data = tmp_path / 'plate'
+    data.mkdir()
+    for name, seed in [('one', 0), ('two', 1)]:
+        _write_dynamics_vrpn(str(data / f'{name}.vrpn.mat'), n_beads=5, seed=seed)
+    dataset_path = tmp_path / 'plate.dynamics'
+    dataset = dynamics_pipeline(str(data), fps=30, pixel_width=0.5, dataset_path=dataset_path, n_workers=1)
+    assert len(dataset) == 10
+
+    # A run that stopped after merging its beads but before saving the
+    # manifest is processed again, replacing those beads
+    os.remove(dataset_path / 'manifest.json')
+    dataset = dynamics_pipeline(str(data), fps=30, pixel_width=0.5, dataset_path=dataset_path, n_workers=1)
+    assert len(dataset) == 10
+    assert dataset.metadata.shape[0] == 2
+    assert dataset.summary['uuid'].is_unique
+    assert dataset.summary['cluster'].notna().all()
@@ -0,0 +1,358 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+import numpy as np
+import pandas as pd
+import h5py
+import pytest
+from scipy.io import savemat, loadmat
+
+from ..ptmr._calculate_msd_fft import _calculate_msd_fft
+from ..ptmr.fit_fbm import _fit_power_law
+from ..ptmr._track_store import _write_track, _read_track
+from ..ptmr.process_vrpns import process_vrpns
+from ..ptmr._calculate_gser import _calculate_gser, _bootstrap_ensemble_msd, K_B
+from ..ptmr.calculate_ensemble_moduli import _moduli_table
+from ..ptmr.drift._subtract_linear_drift import _subtract_linear_drift
+from ..ptmr.drift._subtract_com_drift import _subtract_com_drift
+from ..utilities._read_vrpn_tracking import _read_vrpn_tracking
+from ..ptmr.conversion.vrpn_to_track import vrpn_to_track
+from ..ptmr.calculate_bead_msd import calculate_bead_msd
+from ..ptmr.PTMRDataset import PTMRDataset
+from ..ptmr._calculate_van_hove import _VanHoveAccumulator
+
+def _brute_force_msd(frames, x, y, lag):
+
+    # Pair every frame with the frame exactly one lag later
+    positions = {f: (xi, yi) for f, xi, yi in zip(frames, x, y)}
+    squared = [(positions[f + lag][0] - positions[f][0])**2 + (positions[f + lag][1] - positions[f][1])**2
+               for f in frames if f + lag in positions]
+    
+    return (np.mean(squared) if squared else np.nan), len(squared)
+
+@pytest.mark.parametrize('drop_fraction', [0, 0.2])
+def test_msd_fft_matches_brute_force(drop_fraction):
+    rng = np.random.default_rng(0)
+
+    # Build a few random walks of different lengths, optionally with gaps
+    ids, frames, xs, ys = [], [], [], []
+    for bead_id in range(6):
+        n = rng.integers(10, 200)
+        f = np.arange(n) + rng.integers(0, 50)
+        f = f[rng.random(n) >= drop_fraction]
+        ids.append(np.full(len(f), bead_id))
+        frames.append(f)
+        xs.append(np.cumsum(rng.normal(size=len(f))) + 500)
+        ys.append(np.cumsum(rng.normal(size=len(f))) + 200)
+
+    ids, frames = np.concatenate(ids), np.concatenate(frames)
+    x, y = np.concatenate(xs), np.concatenate(ys)
+    lags = np.array([1, 2, 5, 17, 150, 400])
+
+    # Shuffle the rows to make sure the engine does its own grouping
+    shuffle = rng.permutation(len(ids))
+    unique_ids, msd, n_pairs = _calculate_msd_fft(ids[shuffle], frames[shuffle], x[shuffle],
+                                                  y[shuffle], lags)
+
+    for row, bead_id in enumerate(unique_ids):
+        bead = ids == bead_id
+        for column, lag in enumerate(lags):
+            expected, expected_pairs = _brute_force_msd(frames[bead], x[bead], y[bead], lag)
+            assert n_pairs[row, column] == expected_pairs
+            np.testing.assert_allclose(msd[row, column], expected, rtol=1e-9)
+
+def test_fit_power_law_recovers_parameters():
+    tau = np.logspace(-2, 1, 20)
+
+    # Two exact power laws with different diffusivities and exponents
+    D = np.array([0.5, 0.02])
+    alpha = np.array([1.0, 0.4])
+    msd = 4 * D[:, None] * tau[None, :]**alpha[:, None]
+    weights = np.ones_like(msd)
+
+    fits = _fit_power_law(msd, tau, weights)
+
+    np.testing.assert_allclose(fits['D_fbm'], D)
+    np.testing.assert_allclose(fits['alpha'], alpha)
+    assert np.all(fits['n_lags'] == len(tau))
+
+def test_track_store_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+
+    # Three beads in shuffled order, with the constant columns of 2D tracking
+    n = 30
+    data = pd.DataFrame({'timestamp': 1.7e9 + np.arange(n) / 120, 'microseconds': 0.0,
+                         'particle_id': np.repeat([2.0, 7.0, 4.0], 10), 'frame': np.tile(np.arange(10.0), 3),
+                         'x': rng.random(n) * 1000, 'y': rng.random(n) * 1000,
+                         'z': 0.0, 'roll': 0.0, 'pitch': 0.0, 'yaw': 0.0})
+    path = tmp_path / 'sample.track.h5'
+    _write_track(data.sample(frac=1, random_state=0), path)
+
+    # Constant columns are stored once as attributes
+    with h5py.File(path, 'r') as f:
+        assert set(f['columns'].keys()) == {'timestamp', 'particle_id', 'frame', 'x', 'y'}
+        assert set(f['columns'].attrs.keys()) == {'microseconds', 'z', 'roll', 'pitch', 'yaw'}
+
+    # Everything comes back sorted, typed, and in the original column order
+    expected = data.sort_values(by=['particle_id', 'frame']).reset_index(drop=True)
+    track = _read_track(path)
+    assert list(track.columns) == list(data.columns)
+    assert track['particle_id'].dtype == np.int32
+    assert track['frame'].dtype == np.int32
+    assert track['x'].dtype == np.float32
+    np.testing.assert_array_equal(track['particle_id'], expected['particle_id'])
+    np.testing.assert_allclose(track['x'], expected['x'], rtol=1e-6)
+    np.testing.assert_allclose(track['timestamp'], expected['timestamp'], rtol=0, atol=1e-6)
+    np.testing.assert_array_equal(track['z'], 0)
+
+    # Column subsets, and particle subsets whose neighbouring blocks merge
+    # and which include IDs that aren't in the file
+    subset = _read_track(path, columns=['particle_id', 'y'], particles=[4, 7, 99])
+    assert list(subset.columns) == ['particle_id', 'y']
+    rows = expected['particle_id'].isin([4, 7]).to_numpy()
+    np.testing.assert_array_equal(subset['particle_id'], expected['particle_id'][rows])
+    np.testing.assert_allclose(subset['y'], expected['y'][rows], rtol=1e-6)
+
+    # Unknown particles only and empty files both return empty tables
+    assert _read_track(path, particles=[99]).shape == (0, len(data.columns))
+    empty_path = tmp_path / 'empty.track.h5'
+    _write_track(data.iloc[:0], empty_path)
+    assert _read_track(empty_path).shape == (0, len(data.columns))
+
+def _write_synthetic_vrpn(path, n_beads=5, n_frames=200, seed=0):
+    rng = np.random.default_rng(seed)
+
+    # Random walks with a shared linear drift, in the VRPN column layout
+    frames = np.tile(np.arange(n_frames), n_beads)
+    particle_ids = np.repeat(np.arange(n_beads), n_frames)
+    steps = rng.normal(scale=0.5, size=(2, n_beads, n_frames))
+    x = (np.cumsum(steps[0], axis=1) + 0.05 * np.arange(n_frames)).ravel() + 500
+    y = (np.cumsum(steps[1], axis=1) - 0.02 * np.arange(n_frames)).ravel() + 500
+    zeros = np.zeros_like(x)
+    values = np.column_stack([1.7e9 + frames / 120, zeros, particle_ids, frames, x, y,
+                              zeros, zeros, zeros, zeros])
+
+    tracking = np.zeros((1, 1), dtype=[('spot3DSecUsecIndexFramenumXYZRPY', 'O')])
+    tracking[0, 0]['spot3DSecUsecIndexFramenumXYZRPY'] = values
+    savemat(path, {'tracking': tracking}, long_field_names=True)
+
+def test_process_vrpns_skips_unchanged_stages(tmp_path):
+    vrpn_path = tmp_path / 'sample.vrpn.mat'
+    _write_synthetic_vrpn(vrpn_path)
+
+    def run(**kwargs):
+        status = process_vrpns(str(tmp_path), n_workers=1, **kwargs)
+        assert 'error' not in status.columns
+        return status.iloc[0]
+
+    # Everything runs the first time and nothing runs the second time
+    status = run()
+    assert all(status[stage] == 'run' for stage in ['track', 'drift', 'msd', 'moduli'])
+    status = run()
+    assert all(status[stage] == 'skipped' for stage in ['track', 'drift', 'msd', 'moduli'])
+
+    # Changing the drift method reruns drift and everything after it
+    status = run(drift_subtraction='com')
+    assert status['track'] == 'skipped'
+    assert all(status[stage] == 'run' for stage in ['drift', 'msd', 'moduli'])
+
+    # A deleted output is regenerated without rerunning anything upstream
+    (tmp_path / 'sample.moduli.h5').unlink()
+    status = run(drift_subtraction='com')
+    assert all(status[stage] == 'skipped' for stage in ['track', 'drift', 'msd'])
+    assert status['moduli'] == 'run'
+
+    # An edited output is regenerated as well
+    with open(tmp_path / 'sample.msd.h5', 'ab') as f:
+        f.write(b'edited')
+    status = run(drift_subtraction='com')
+    assert all(status[stage] == 'skipped' for stage in ['track', 'drift'])
+    assert status['msd'] == 'run'
+
+def test_gser_newtonian_fluid():
+
+    # A purely viscous fluid has MSD = 4 D tau in 2D, with D from Stokes-Einstein
+    viscosity, bead_radius, temperature = 1e-3, 0.5e-6, 298.15
+    D = K_B * temperature / (6 * np.pi * viscosity * bead_radius)
+    tau = np.logspace(-2, 1, 25)
+    msd = 4 * D * tau
+
+    gser = _calculate_gser(msd, tau=tau, bead_radius=bead_radius, temperature=temperature)
+
+    np.testing.assert_allclose(gser['alpha'], 1)
+    np.testing.assert_allclose(gser['g_double_prime'], viscosity * gser['omega'])
+    np.testing.assert_allclose(gser['g_prime'], 0, atol=1e-12 * gser['g_double_prime'].max())
+
+def test_bootstrap_intervals_bracket_ensemble():
+    rng = np.random.default_rng(0)
+
+    # Scattered bead MSDs (in m^2) with a few missing values
+    tau = np.logspace(-2, 0, 10)
+    bead_msd = 1e-13 * tau[None, :] * rng.lognormal(sigma=0.5, size=(40, 1))
+    bead_msd[rng.random(bead_msd.shape) < 0.1] = np.nan
+
+    resamples = _bootstrap_ensemble_msd(bead_msd, n_bootstrap=500, rng=np.random.default_rng(1))
+    assert resamples.shape == (500, len(tau))
+
+    moduli = _moduli_table(paths=['sample'], bead_msds=[bead_msd], lag_frames=np.arange(len(tau)),
+                           tau=tau, bead_radius=0.5e-6, temperature=298.15, n_bootstrap=500,
+                           confidence=0.95, rng=np.random.default_rng(1))
+    np.testing.assert_allclose(moduli['msd'], np.nanmean(bead_msd, axis=0))
+    for key in ['g_star', 'g_prime', 'g_double_prime']:
+        assert np.all(moduli[f'{key}_lower'] <= moduli[key])
+        assert np.all(moduli[key] <= moduli[f'{key}_upper'])
+
+def _formatted_track(particle_ids, frames, x, y, fps=100):
+    return pd.DataFrame({'particle_id': particle_ids, 'frame': frames, 'timestamp': frames / fps,
+                         'x': x, 'y': y})
+
+def test_linear_drift_matches_polyfit():
+    rng = np.random.default_rng(0)
+
+    # Beads of different lengths and start frames, one too short to fit
+    ids, frames = [], []
+    for bead_id, (start, n) in enumerate([(0, 300), (40, 120), (100, 250), (280, 2)]):
+        ids.append(np.full(n, bead_id))
+        frames.append(np.arange(start, start + n))
+    ids, frames = np.concatenate(ids), np.concatenate(frames)
+    x = np.cumsum(rng.normal(size=len(ids))) + 0.3 * frames
+    y = np.cumsum(rng.normal(size=len(ids))) - 0.1 * frames
+    data = _formatted_track(ids, frames, x, y)
+
+    start_time, end_time = 0.5, 2.5
+    cleaned = _subtract_linear_drift(data.copy(), start_time, end_time)
+
+    # Fit each bead inside the window and subtract from its whole track
+    for bead_id in range(3):
+        bead = data[data['particle_id'] == bead_id]
+        t = bead['timestamp'].to_numpy()
+        window = (t >= start_time) & (t <= end_time)
+        cleaned_bead = cleaned[cleaned['particle_id'] == bead_id]
+        for column in ['x', 'y']:
+            slope = np.polyfit(t[window], bead[column].to_numpy()[window], 1)[0]
+            expected = bead[column].to_numpy() - slope * (t - t[0])
+            np.testing.assert_allclose(cleaned_bead[column], expected, rtol=1e-10, atol=1e-9)
+
+    # The bead with too few points in the window is dropped
+    assert set(cleaned['particle_id']) == {0, 1, 2}
+
+def test_com_drift_removes_shared_drift():
+    rng = np.random.default_rng(0)
+
+    # Stationary beads, some entering and leaving, moved by a shared
+    # non-linear drift
+    ids, frames = [], []
+    for bead_id, (start, n) in enumerate([(0, 400), (50, 200), (150, 250), (0, 100)]):
+        ids.append(np.full(n, bead_id))
+        frames.append(np.arange(start, start + n))
+    ids, frames = np.concatenate(ids), np.concatenate(frames)
+    rest_x, rest_y = rng.random(4) * 1000, rng.random(4) * 1000
+    drift_x = 5 * np.sin(frames / 40) + 1e-4 * frames**2
+    drift_y = -3 * np.cos(frames / 25)
+    data = _formatted_track(ids, frames, rest_x[ids] + drift_x, rest_y[ids] + drift_y)
+
+    cleaned = _subtract_com_drift(data.sample(frac=1, random_state=0))
+
+    # Every bead is left at a fixed position
+    for column in ['x', 'y']:
+        spread = cleaned.groupby('particle_id')[column].agg(lambda values: values.max() - values.min())
+        np.testing.assert_allclose(spread, 0, atol=1e-9)
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_read_vrpn_tracking_matches_loadmat(tmp_path, compress):
+    rng = np.random.default_rng(0)
+
+    # Extra variables and struct fields around the tracking array
+    tracking = np.zeros((1, 1), dtype=[('info', 'O'), ('spot3DSecUsecIndexFramenumXYZRPY', 'O'), ('other', 'O')])
+    tracking[0, 0]['info'] = {'name': 'sample', 'ids': np.arange(5)}
+    tracking[0, 0]['spot3DSecUsecIndexFramenumXYZRPY'] = rng.random((300, 10))
+    tracking[0, 0]['other'] = rng.random((20, 20))
+    path = tmp_path / 'sample.vrpn.mat'
+    savemat(path, {'before': rng.random(10), 'tracking': tracking, 'after': 'text'},
+            long_field_names=True, do_compression=compress)
+
+    expected = loadmat(path)['tracking']['spot3DSecUsecIndexFramenumXYZRPY'][0][0]
+    np.testing.assert_array_equal(_read_vrpn_tracking(path), expected)
+
+def test_dataset_ensemble_msd_matches_pooled_beads(tmp_path):
+
+    # Two conditions with two videos each
+    for condition in ['A', 'B']:
+        (tmp_path / condition).mkdir()
+        for i in range(2):
+            vrpn_path = tmp_path / condition / f'video{i}.vrpn.mat'
+            _write_synthetic_vrpn(vrpn_path, seed=i + 10 * (condition == 'B'))
+            vrpn_to_track(vrpn_path)
+
+    lags = [1, 3, 10, 40]
+    dataset = PTMRDataset.from_folder(str(tmp_path), fps=120, camera='GS3', magnification=40,
+                                      cache_folder=str(tmp_path / 'cache'))
+    ensemble = dataset.ensemble_msd(by='folder', lag_frames=lags)
+
+    # The streaming statistics match the pooled MSDs of every bead
+    for condition in ['A', 'B']:
+        paths = dataset.index.loc[dataset.index['folder'] == condition, 'path']
+        beads = np.vstack([calculate_bead_msd(path, 120, 'GS3', 40, lag_frames=lags)[1].T.to_numpy()
+                           for path in paths])
+        rows = ensemble[ensemble['folder'] == condition]
+        np.testing.assert_allclose(rows['msd'], beads.mean(axis=0), rtol=1e-5)
+        np.testing.assert_allclose(rows['msd_std'], beads.std(axis=0, ddof=1), rtol=1e-4)
+        assert np.all(rows['n_beads'] == beads.shape[0])
+
+    # Per-file results are cached on disk and reused by new datasets
+    assert len(list((tmp_path / 'cache').iterdir())) == 4
+
+def test_van_hove_of_brownian_steps():
+    rng = np.random.default_rng(0)
+
+    # Gaussian steps with gaps, so some lags must be skipped
+    n_beads, n_frames, sigma = 50, 400, 0.1
+    ids = np.repeat(np.arange(n_beads), n_frames)
+    frames = np.tile(np.arange(n_frames), n_beads)
+    x = np.cumsum(rng.normal(scale=sigma, size=(n_beads, n_frames)), axis=1).ravel()
+    y = np.cumsum(rng.normal(scale=sigma, size=(n_beads, n_frames)), axis=1).ravel()
+    keep = rng.random(ids.size) > 0.1
+    ids, frames, x, y = ids[keep], frames[keep], x[keep], y[keep]
+
+    # Streaming in two halves gives the same result as all at once
+    lags, edges = [1, 4], np.linspace(-2, 2, 81)
+    whole = _VanHoveAccumulator(lags, edges)
+    whole.add(ids, frames, x, y)
+    halves = _VanHoveAccumulator(lags, edges)
+    split = np.searchsorted(ids, n_beads // 2)
+    halves.add(ids[:split], frames[:split], x[:split], y[:split])
+    other = _VanHoveAccumulator(lags, edges)
+    other.add(ids[split:], frames[split:], x[split:], y[split:])
+    halves.merge(other)
+    np.testing.assert_array_equal(whole.counts, halves.counts)
+
+    # Exact pair counts, MSD = 2 sigma^2 lag in 2D, and Gaussian steps
+    statistics = whole.statistics(fps=100)
+    for i, lag in enumerate(lags):
+        expected = sum(np.count_nonzero(np.isin(frames[ids == b] + lag, frames[ids == b])) for b in range(n_beads))
+        assert statistics['n'][i] == expected
+    np.testing.assert_allclose(statistics['msd'], 2 * sigma**2 * np.array(lags), rtol=0.05)
+    np.testing.assert_allclose(statistics['alpha2'], 0, atol=0.05)
+    histogram = whole.histogram(fps=100)
+    for lag in lags:
+        rows = histogram[histogram['lag_frames'] == lag]
+        np.testing.assert_allclose(np.sum(rows['density'] * (rows['bin_right'] - rows['bin_left'])), 1)
+
+def test_van_hove_of_unsorted_csv(tmp_path):
+    vrpn_path = tmp_path / 'video.vrpn.mat'
+    _write_synthetic_vrpn(vrpn_path)
+    vrpn_to_track(vrpn_path)
+
+    # A frame-major .track.csv of the same tracks, as VRPNs are stored
+    data = _read_track(tmp_path / 'video.track.h5')
+    csv_folder = tmp_path / 'csv'
+    csv_folder.mkdir()
+    data.sort_values(['frame', 'particle_id']).to_csv(csv_folder / 'video.track.csv', index=False)
+
+    # Both files give the same displacements
+    lags, edges = [1, 5], np.linspace(-5, 5, 41)
+    results = [PTMRDataset.from_folder(str(folder), fps=120, camera='GS3', magnification=40,
+                                       extension=extension).van_hove(lag_frames=lags, bin_edges=edges)
+               for folder, extension in [(tmp_path, 'track.h5'), (csv_folder, 'track.csv')]]
+    (h5_histogram, h5_statistics), (csv_histogram, csv_statistics) = results
+    assert list(h5_statistics['n']) == list(csv_statistics['n']) == [5 * 199, 5 * 195]
+    np.testing.assert_array_equal(csv_histogram['count'], h5_histogram['count'])
+    np.testing.assert_allclose(csv_statistics['msd'], h5_statistics['msd'], rtol=1e-5)
@@ -30,6 +30,7 @@ from .cache_view import cache_view
 from .load_matlab import load_matlab
 from .load_vrpn import load_vrpn
 from .walk_dir import walk_dir
+from .hash_file import hash_file
 
 __all__ = [
     "format_duration",
@@ -42,7 +43,8 @@ __all__ = [
     "cache_view",
     "load_matlab",
     "load_vrpn",
-    "walk_dir"
+    "walk_dir",
+    "hash_file"
 ]
 
 # We also need to do some initialization of the location where certain
@@ -0,0 +1,159 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+import struct
+import zlib
+import numpy as np
+import h5py
+from scipy.io import loadmat
+
+# The field of the tracking struct that holds the bead positions
+TRACKING_FIELD = 'spot3DSecUsecIndexFramenumXYZRPY'
+
+# MAT-file v5 data types and the NumPy types they map onto
+_MI_DTYPES = {1: 'i1', 2: 'u1', 3: 'i2', 4: 'u2', 5: 'i4', 6: 'u4',
+              7: 'f4', 9: 'f8', 12: 'i8', 13: 'u8'}
+_MI_MATRIX = 14
+_MI_COMPRESSED = 15
+_MX_STRUCT_CLASS = 2
+
+def _read_vrpn_tracking(path):
+
+    """
+    Reads only the tracking.spot3DSecUsecIndexFramenumXYZRPY array of a
+    VRPN file, without building the rest of the tracking struct (such as
+    the info tables) the way scipy.io.loadmat does.
+
+    ARGUMENTS:
+        path (string): the path to the VRPN file.
+
+    RETURNS:
+        tracking (numpy.ndarray): the tracking array with one row per
+            bead per frame, as float64.
+
+    NOTES:
+        1. MATLAB v7.3 files are HDF5 files, so the array is read directly
+        with h5py.
+        2. Older files are walked element by element. Other variables and
+        struct fields are skipped using their byte counts instead of being
+        parsed, and only the tracking variable is decompressed.
+        3. If a v5 file holds anything unexpected, the function falls back
+        to loadmat restricted to the tracking variable.
+    """
+
+    # MATLAB v7.3 files are HDF5 files, which store arrays transposed
+    if h5py.is_hdf5(path):
+        with h5py.File(path, 'r') as f:
+            return np.asarray(f['tracking'][TRACKING_FIELD][()], dtype=np.float64).T
+
+    try:
+        with open(path, 'rb') as f:
+            buffer = f.read()
+        return _parse_mat5(buffer)
+
+    except (ValueError, KeyError, struct.error, zlib.error):
+        data = loadmat(path, variable_names=['tracking'])
+        return np.asarray(data['tracking'][TRACKING_FIELD][0][0], dtype=np.float64)
+
+
+def _parse_mat5(buffer):
+
+    """
+    Finds the tracking variable of a MAT-file v5 buffer and returns its
+    tracking array. Raises a ValueError if it can't be found.
+    """
+
+    # The last two bytes of the 128 byte header give the byte order
+    endian = '<' if buffer[126:128] == b'IM' else '>'
+
+    position = 128
+    while position < len(buffer):
+        data_type, n_bytes, start, position = _read_tag(buffer, position, endian)
+
+        # MATLAB compresses each variable separately. Compressed elements
+        # aren't padded, so the next element starts right after this one.
+        if data_type == _MI_COMPRESSED:
+            position = start + n_bytes
+            element = zlib.decompress(buffer[start:start + n_bytes])
+            data_type, n_bytes, start, _ = _read_tag(element, 0, endian)
+        else:
+            element = buffer
+
+        if data_type != _MI_MATRIX:
+            continue
+
+        name, value = _read_matrix(element, start, start + n_bytes, endian, field=TRACKING_FIELD)
+        if name == 'tracking':
+            return value
+
+    raise ValueError('No tracking variable found')
+
+
+def _read_tag(buffer, position, endian):
+
+    """
+    Reads the tag of a data element. Returns the data type, the number of
+    bytes of data, where the data starts, and where the next element
+    starts (elements are padded to 8 bytes).
+    """
+
+    data_type, n_bytes = struct.unpack_from(endian + 'II', buffer, position)
+
+    # Small elements pack their size into the upper bytes of the type and
+    # hold their data in the remaining four bytes of the tag
+    if data_type >> 16:
+        return data_type & 0xFFFF, data_type >> 16, position + 4, position + 8
+
+    return data_type, n_bytes, position + 8, position + 8 + ((n_bytes + 7) // 8) * 8
+
+
+def _read_matrix(buffer, start, stop, endian, field=None):
+
+    """
+    Reads a matrix element between start and stop. Numeric matrices are
+    returned as float64 arrays. For structs, only the requested field of
+    the first element is read and returned.
+    """
+
+    # Array flags, dimensions, and name
+    _, _, flags_start, position = _read_tag(buffer, start, endian)
+    flags = struct.unpack_from(endian + 'I', buffer, flags_start)[0]
+    array_class = flags & 0xFF
+    is_complex = bool(flags & 0x800)
+
+    data_type, n_bytes, dims_start, position = _read_tag(buffer, position, endian)
+    dims = np.frombuffer(buffer, dtype=endian + _MI_DTYPES[data_type], count=n_bytes // 4,
+                         offset=dims_start)
+
+    data_type, n_bytes, name_start, position = _read_tag(buffer, position, endian)
+    name = bytes(buffer[name_start:name_start + n_bytes]).decode('ascii')
+
+    # Structs list their field names, then each field as its own matrix
+    if array_class == _MX_STRUCT_CLASS:
+        _, _, length_start, position = _read_tag(buffer, position, endian)
+        name_length = struct.unpack_from(endian + 'i', buffer, length_start)[0]
+        data_type, n_bytes, names_start, position = _read_tag(buffer, position, endian)
+        raw_names = bytes(buffer[names_start:names_start + n_bytes])
+        field_names = [raw_names[i:i + name_length].split(b'\0')[0].decode('ascii')
+                       for i in range(0, n_bytes, name_length)]
+
+        # Skip over every field before the requested one
+        index = field_names.index(field)
+        for _ in range(index):
+            _, _, _, position = _read_tag(buffer, position, endian)
+        data_type, n_bytes, field_start, _ = _read_tag(buffer, position, endian)
+
+        return name, _read_matrix(buffer, field_start, field_start + n_bytes, endian)[1]
+
+    if is_complex or (array_class < 6) or (array_class > 15):
+        raise ValueError('Unsupported matrix class')
+
+    # Empty matrices have no data element
+    shape = tuple(int(d) for d in dims)
+    if (position >= stop) or (0 in shape):
+        return name, np.zeros(shape, dtype=np.float64)
+
+    # Numeric data may be stored in a narrower type than its class
+    data_type, n_bytes, data_start, _ = _read_tag(buffer, position, endian)
+    dtype = np.dtype(endian + _MI_DTYPES[data_type])
+    values = np.frombuffer(buffer, dtype=dtype, count=n_bytes // dtype.itemsize, offset=data_start)
+
+    return name, values.astype(np.float64).reshape(shape, order='F')
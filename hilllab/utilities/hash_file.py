@@ -0,0 +1,26 @@
+# Christopher Esther, Hill Lab, 10/19/2026
+import hashlib
+
+def hash_file(path, chunk_size=2**20):
+
+    """
+    Calculates the SHA-256 hash of a file's contents. The file is read in
+    chunks so that large files don't need to fit in memory.
+
+    ARGUMENTS:
+        path (string): the path to the file to be hashed
+        chunk_size (int): the number of bytes read at a time
+
+    RETURNS:
+        digest (string): the hexadecimal SHA-256 digest of the file
+    """
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            sha.update(chunk)
+
+    return sha.hexdigest()
@@ -1,16 +1,17 @@
 # Christopher Esther, Hill Lab, 7/10/2025
 import pandas as pd
-from scipy.io import loadmat
 from pathlib import Path
+from ._read_vrpn_tracking import _read_vrpn_tracking
 
 def load_vrpn(path):
 
     """
-    Loads a VRPN file at a given path and returns the data as a pandas dataframe
+    Loads a VRPN file at a given path and returns the data as a pandas dataframe.
+    Only the tracking array is read; the rest of the tracking struct is skipped.
     """
 
     # Load the data from the VRPN
-    data = pd.DataFrame(loadmat(path)['tracking']['spot3DSecUsecIndexFramenumXYZRPY'][0][0])
+    data = pd.DataFrame(_read_vrpn_tracking(path))
 
     # Determine the full suffix of the file so we can decide how to 
     # name the columns